@@ -0,0 +1,69 @@
+"""Micro-benchmark of the typed attribute decoder in `tlx.dynamodb.types`.
+
+Compares it with the functions it replaced in `tlx.dynamodb.batch` and with boto3's `TypeDeserializer`, and the
+serializer with boto3's `TypeSerializer`.
+
+    python benchmarks/dynamodb_types.py
+"""
+import timeit
+from collections import defaultdict
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from tlx.dynamodb.types import deserialize_item, serialize_item
+
+
+# The decoder previously in tlx.dynamodb.batch, for comparison
+def _pull_values(item):
+    return {k: _set_types(v) for k, v in item.items()}
+
+
+_func_map = defaultdict(
+    lambda: lambda x: x, {"M": _pull_values, "N": Decimal, "L": lambda values: [_set_types(d) for d in values]}
+)
+
+
+def _set_types(v):
+    v_key = list(v.keys())[0]
+    returned_value = list(v.values())[0]  # Always one from dump
+    return _func_map[v_key](returned_value)
+
+
+# A representative item from a scan dump (types the old decoder supports)
+ITEM = {
+    "matchid": {"S": "a3f9c1d2e4b5a6c7d8e9f0a1b2c3d4e5"},
+    "updated": {"N": "1566372600123"},
+    "active": {"BOOL": True},
+    "venue": {"M": {"name": {"S": "MCG"}, "capacity": {"N": "100024"}}},
+    "odds": {"M": {
+        provider: {"L": [{"M": {"home": {"N": "1.85"}, "away": {"N": "2.05"}, "time": {"N": "1566372600"}}}] * 5}
+        for provider in ("BILL", "TAB", "SPORTSBET")
+    }},
+}
+
+
+def _time(func, number=20000):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    deserializer, serializer = TypeDeserializer(), TypeSerializer()
+    python_item = deserialize_item(ITEM)
+
+    assert deserialize_item(ITEM) == _pull_values(ITEM) == {k: deserializer.deserialize(v) for k, v in ITEM.items()}
+    assert serialize_item(python_item) == {k: serializer.serialize(v) for k, v in python_item.items()}
+
+    results = [
+        ("deserialize: tlx.dynamodb.types", _time(lambda: deserialize_item(ITEM))),
+        ("deserialize: previous _pull_values", _time(lambda: _pull_values(ITEM))),
+        ("deserialize: boto3 TypeDeserializer", _time(lambda: {k: deserializer.deserialize(v) for k, v in ITEM.items()})),
+        ("serialize: tlx.dynamodb.types", _time(lambda: serialize_item(python_item))),
+        ("serialize: boto3 TypeSerializer", _time(lambda: {k: serializer.serialize(v) for k, v in python_item.items()})),
+    ]
+    for name, usec in results:
+        print(f"{name:40} {usec:8.2f} us/item")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Import time of the tlx packages, from `python -X importtime`, for cold starts (e.g AWS Lambda).
+
+Also checks that importing them doesn't load the heavy dependencies, which should only load on first use.  Exits
+non-zero if one does, or if an import takes longer than `--max-ms`.
+
+    python benchmarks/import_time.py [--max-ms 100]
+"""
+import argparse
+import subprocess
+import sys
+
+MODULES = ["tlx", "tlx.apigateway", "tlx.codepipeline", "tlx.dynamodb", "tlx.dynamodb.json", "tlx.organizations", "tlx.util"]
+HEAVY = ["boto3", "botocore", "click"]
+
+
+def import_time(module):
+    """Cumulative import time of `module` in microseconds and the `HEAVY` modules it loaded, in a fresh interpreter"""
+
+    check = f"import sys, {module}; print(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", check], capture_output=True, text=True, check=True)
+    for line in proc.stderr.splitlines():
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]), proc.stdout.split()
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-ms", type=float, help="Fail if any import takes longer than this")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of this many runs")
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        runs = [import_time(module) for _ in range(args.repeat)]
+        micros, heavy = min(runs)[0], runs[0][1]
+        problems = [f"loads {', '.join(heavy)}"] if heavy else []
+        if args.max_ms is not None and micros / 1000 > args.max_ms:
+            problems.append(f"over {args.max_ms}ms")
+        failed = failed or bool(problems)
+        print(f"{module:20} {micros / 1000:8.1f} ms  {'FAIL: ' + '; '.join(problems) if problems else 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
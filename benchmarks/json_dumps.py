@@ -0,0 +1,88 @@
+"""Benchmark of the `tlx.dynamodb.json_dumps` backends on representative DynamoDB payloads.
+
+Checks every backend gives the same data as the previous encoder, and that the standard library backend gives
+identical text, before timing them.
+
+    python benchmarks/json_dumps.py
+"""
+import datetime as dt
+import json
+import timeit
+from decimal import Decimal
+
+from tlx.dynamodb.json import JSON_BACKENDS, json_dumps, set_json_backend
+from tlx.util import string_from_datetime
+
+
+# The encoder previously in tlx.dynamodb.json, for comparison
+class PreviousEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        if isinstance(o, dt.datetime):
+            return string_from_datetime(o)
+        return json.JSONEncoder.default(self, o)
+
+
+def previous_json_dumps(x):
+    return json.dumps(x, cls=PreviousEncoder, separators=(',', ': '))
+
+
+MATCH = {
+    "matchid": "a3f9c1d2e4b5a6c7d8e9f0a1b2c3d4e5",
+    "updated": dt.datetime(2019, 8, 21, 9, 18, 39, 123456),
+    "active": True,
+    "venue": {"name": "MCG", "capacity": Decimal("100024")},
+    "odds": {
+        provider: [{"home": Decimal("1.85"), "away": Decimal("2.05"), "time": Decimal("1566372600")}] * 20
+        for provider in ("BILL", "TAB", "SPORTSBET")
+    },
+}
+
+PAYLOADS = {
+    "single item": MATCH,
+    "list endpoint (500 items)": [dict(MATCH, matchid=str(i)) for i in range(500)],
+    "apigateway event": {
+        "resource": "/matches/{id}",
+        "headers": {"Accept-Encoding": "gzip, deflate, br", "User-Agent": "Mozilla/5.0"},
+        "queryStringParameters": {"id": "a3f9c1d2"},
+        "body": json.dumps(MATCH, default=str),
+    },
+}
+
+
+# Numbers the backends must agree on. Compared as re-dumped text, as NaN != NaN
+NON_FINITE = [Decimal("1e400"), Decimal("-1e400"), Decimal("NaN"), Decimal("Infinity"), Decimal("1.5")]
+# Written as null by orjson only. See `set_json_backend`
+NATIVE_NON_FINITE = [float("nan"), float("inf"), float("-inf")]
+
+
+def check_non_finite():
+    expected = json.dumps(json.loads(previous_json_dumps(NON_FINITE)))
+    for backend in JSON_BACKENDS:
+        set_json_backend(backend)
+        assert json.dumps(json.loads(json_dumps(NON_FINITE))) == expected, f"{backend} non-finite Decimals differ"
+        print(f"native float NaN/Infinity with {backend:6}: {json_dumps(NATIVE_NON_FINITE)}")
+    set_json_backend()
+
+
+def main():
+    check_non_finite()
+    for name, payload in PAYLOADS.items():
+        expected = previous_json_dumps(payload)
+        print(f"{name}:")
+        timings = [("previous", min(timeit.repeat(lambda: previous_json_dumps(payload), number=50, repeat=5)))]
+        for backend in JSON_BACKENDS:
+            set_json_backend(backend)
+            output = json_dumps(payload)
+            assert json.loads(output) == json.loads(expected), f"{backend} output differs"
+            if backend == "json":
+                assert output == expected, "The standard library backend output should be identical"
+            timings.append((backend, min(timeit.repeat(lambda: json_dumps(payload), number=50, repeat=5))))
+        for backend, seconds in timings:
+            print(f"    {backend:10} {seconds / 50 * 1e6:10.1f} us  ({timings[0][1] / seconds:.1f}x)")
+    set_json_backend()
+
+
+if __name__ == "__main__":
+    main()
@@ -22,14 +22,17 @@ setup(
     author='eL0ck',
     author_email='tpj800@gmail.com',
     license='Apache',
-    python_requires='>=3.6, <4',
+    python_requires='>=3.7, <4',
     packages=find_packages(),
     install_requires=get_install_requires(),
     entry_points={
         'console_scripts': [
             'get-aws-creds=tlx.util.cli_apps.get_aws_creds:main',
             'dynamo-batch-write=tlx.dynamodb.cli_apps.dynamodb_batch_write:dbw',
-            'dynamo-clear-table=tlx.dynamodb.cli_apps.dynamodb_clear_table:dct',
+            'dynamo-clear-table=tlx.dynamodb.cli_apps.dynamo_clear_table:dct',
+            'dynamo-export=tlx.dynamodb.cli_apps.dynamodb_export:dex',
+            'org-tree=tlx.organizations.cli_apps.org_tree:org_tree',
+            'cp-executions=tlx.codepipeline.cli_apps.cp_executions:cp_executions',
         ],
     },
     scripts=[
@@ -1,8 +1,11 @@
-from unittest import TestCase
+import base64
+import gzip
+import logging
+from unittest import TestCase, mock
 
 from tlx.apigateway import (APIGException, proxy_response_handler,
                             require_valid_inputs)
-from tlx.dynamodb.aux import json_loads
+from tlx.dynamodb import json_dumps, json_loads
 
 
 class TestRequireFieldsFound(TestCase):
@@ -109,3 +112,128 @@ class TestProxyResponseHandler(TestCase):
         self.assertEqual(res["statusCode"], 200, msg)
         body = json_loads(res["body"])
         self.assertEqual(body, "Hallo", msg)
+
+
+class TestProxyResponseHandlerLogging(TestCase):
+    apig_event = {"resource": "yoyo", "body": "x" * 1000}
+
+    def test_lazy(self):
+        msg = "The event should not be serialised when INFO logging is disabled"
+
+        @proxy_response_handler
+        def dummy_handler(event, context):
+            return "Hallo"
+
+        logger = logging.getLogger()
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            with mock.patch("tlx.apigateway.json_dumps", wraps=json_dumps) as dumps:
+                dummy_handler(self.apig_event, {})
+        finally:
+            logger.setLevel(level)
+        self.assertEqual(dumps.call_args_list, [mock.call("Hallo")], msg)  # The response body only
+
+    def test_sampling(self):
+        msg = "Only 1 in `log_every` invocations should be logged"
+
+        @proxy_response_handler(log_every=3)
+        def dummy_handler(event, context):
+            return "Hallo"
+
+        with self.assertLogs(level=logging.INFO) as logs:
+            for _ in range(6):
+                dummy_handler(self.apig_event, {})
+        events = [r for r in logs.records if r.getMessage().startswith("event: ")]
+        self.assertEqual(len(events), 2, msg)
+
+    def test_errors_not_sampled(self):
+        msg = "Errors should always be logged"
+
+        @proxy_response_handler(quiet=False, log_every=100)
+        def dummy_handler(event, context):
+            raise APIGException("yoyo", code=404)
+
+        with self.assertLogs(level=logging.ERROR) as logs:
+            for _ in range(3):
+                dummy_handler(self.apig_event, {})
+        self.assertEqual(len(logs.records), 3, msg)
+
+    def test_truncation_and_timing(self):
+        msg = "Long messages should be truncated and timing reported on the record"
+
+        @proxy_response_handler(max_log_length=100)
+        def dummy_handler(event, context):
+            return event["body"]
+
+        with self.assertLogs(level=logging.INFO) as logs:
+            res = dummy_handler(self.apig_event, {})
+        self.assertEqual(json_loads(res["body"]), "x" * 1000, "The response itself should be complete")
+
+        event, response, timing = logs.records
+        self.assertTrue(event.getMessage().endswith("characters truncated)"), msg)
+        self.assertLess(len(response.getMessage()), 200, msg)
+        self.assertGreaterEqual(timing.handler_ms, 0, msg)
+        self.assertGreaterEqual(timing.serialization_ms, 0, msg)
+
+
+class TestProxyResponseHandlerCompression(TestCase):
+    body = [{"id": i, "name": "item"} for i in range(100)]
+
+    def _handler(self, **kwargs):
+        @proxy_response_handler(**kwargs)
+        def dummy_handler(event, context):
+            return self.body
+
+        return dummy_handler
+
+    def _event(self, accept):
+        return {"resource": "yoyo", "headers": {"Accept-Encoding": accept}}
+
+    def test_gzip(self):
+        msg = "Large bodies should be gzipped and base64 encoded when the client accepts gzip"
+
+        res = self._handler(compress_min_size=100)(self._event("deflate, gzip;q=0.8"), {})
+        self.assertTrue(res["isBase64Encoded"], msg)
+        self.assertEqual(res["headers"]["Content-Encoding"], "gzip", msg)
+        self.assertEqual(res["headers"]["Content-Type"], "application/json", msg)
+        self.assertEqual(json_loads(gzip.decompress(base64.b64decode(res["body"]))), self.body, msg)
+
+    def test_not_accepted(self):
+        msg = "Bodies should be sent raw if the client doesn't accept an encoding or they are small"
+
+        for event in (self._event("gzip;q=0, deflate"), {"resource": "yoyo", "headers": None}, {}):
+            res = self._handler(compress_min_size=100)(event, {})
+            self.assertNotIn("isBase64Encoded", res, msg)
+            self.assertNotIn("Content-Encoding", res["headers"], msg)
+            self.assertEqual(json_loads(res["body"]), self.body, msg)
+
+        res = self._handler(compress_min_size=10 ** 6)(self._event("gzip"), {})
+        self.assertEqual(json_loads(res["body"]), self.body, msg)
+
+    def test_opt_in(self):
+        msg = "Responses should be unchanged without compress_min_size"
+
+        res = self._handler()(self._event("gzip"), {})
+        self.assertEqual(set(res), {"statusCode", "body"}, msg)
+
+    def test_brotli_preferred(self):
+        msg = "Brotli should be preferred when installed and accepted"
+
+        compressors = {"br": lambda data: b"br:" + data, "gzip": gzip.compress}
+        with mock.patch.dict("tlx.apigateway._COMPRESSORS", compressors, clear=True):
+            res = self._handler(compress_min_size=0)(self._event("gzip, br"), {})
+        self.assertEqual(res["headers"]["Content-Encoding"], "br", msg)
+        self.assertTrue(base64.b64decode(res["body"]).startswith(b"br:"), msg)
+
+    def test_binary_body(self):
+        msg = "Bytes should be returned base64 encoded"
+
+        @proxy_response_handler
+        def dummy_handler(event, context):
+            return b"\x89PNG"
+
+        res = dummy_handler({}, {})
+        self.assertTrue(res["isBase64Encoded"], msg)
+        self.assertEqual(base64.b64decode(res["body"]), b"\x89PNG", msg)
+        self.assertEqual(res["headers"]["Content-Type"], "application/octet-stream", msg)
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from unittest import TestCase, mock
+
+from tlx.codepipeline import ExecutionCache, iter_executions
+
+DETAILS = [{"stageName": "Deploy", "status": "Succeeded", "startTime": datetime(2024, 1, 1, tzinfo=timezone.utc)}]
+
+
+class TestExecutionCache(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.cache = ExecutionCache(self.path)
+        self.client = mock.Mock()
+        self.client.get_pipeline_execution.return_value = {"pipelineExecution": {"status": "Succeeded"}}
+        patch = mock.patch("tlx.codepipeline.cache.execution_details", return_value=DETAILS)
+        self.fetch = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.get("p", "e1"))
+        self.cache.put("p", "e1", DETAILS)
+        self.assertEqual(self.cache.get("p", "e1"), DETAILS, "Datetimes should be restored")
+        self.assertIsNone(self.cache.get("p", "e2"))
+        self.assertIsNone(self.cache.get("q", "e1"))
+        self.assertEqual([f for _, _, files in os.walk(self.path) for f in files if f.endswith(".tmp")], [])
+
+    def test_finished_only(self):
+        msg = "Finished executions should be fetched once. Running ones every time"
+
+        for _ in range(3):
+            self.assertEqual(self.cache.details(self.client, "p", "done", "Succeeded"), DETAILS, msg)
+            self.assertEqual(self.cache.details(self.client, "p", "running", "InProgress"), DETAILS, msg)
+        self.assertEqual([c.args[1:] for c in self.fetch.call_args_list],
+                         [("p", "done"), ("p", "running"), ("p", "running"), ("p", "running")], msg)
+        self.client.get_pipeline_execution.assert_not_called()
+
+    def test_status_looked_up(self):
+        self.cache.details(self.client, "p", "e1")
+        self.cache.details(self.client, "p", "e1")
+        self.client.get_pipeline_execution.assert_called_once_with(pipelineName="p", pipelineExecutionId="e1")
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_damaged_file(self):
+        self.cache.put("p", "e1", DETAILS)
+        with open(self.cache._file("p", "e1"), "w") as f:
+            f.write('{"Pipeline": "p", "Exec')
+        self.assertIsNone(self.cache.get("p", "e1"), "A damaged file should be a miss")
+        self.assertEqual(self.cache.details(self.client, "p", "e1", "Failed"), DETAILS)
+        self.assertEqual(self.cache.get("p", "e1"), DETAILS, "and be written again")
+
+    def test_iter_executions(self):
+        msg = "Only new and running executions should be fetched on the second run"
+
+        summaries = [{"pipelineExecutionId": "e2", "status": "InProgress"},
+                     {"pipelineExecutionId": "e1", "status": "Succeeded"}]
+        with mock.patch("tlx.codepipeline.executions.paginate", return_value=iter(summaries)):
+            list(iter_executions(["p"], client=self.client, cache=self.cache))
+        self.fetch.reset_mock()
+        with mock.patch("tlx.codepipeline.executions.paginate", return_value=iter(summaries)):
+            executions = list(iter_executions(["p"], client=self.client, cache=self.cache))
+        self.assertEqual([c.args[1:] for c in self.fetch.call_args_list], [("p", "e2")], msg)
+        self.assertEqual([e["FinalStage"] for e in executions], ["Deploy", "Deploy"], msg)
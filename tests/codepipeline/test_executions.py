@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+from datetime import datetime
+from unittest import TestCase, mock
+
+import boto3
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from tlx.codepipeline import execution_details, find_pipelines, iter_executions
+
+PIPELINES = {
+    "api-deploy": ["e1", "e2", "e3"],
+    "web-deploy": ["e4"],
+    "meta-pipeline": [],
+}
+
+
+def _detail(stage, version=3):
+    return {"stageName": stage, "pipelineVersion": version, "startTime": datetime(2024, 1, 1)}
+
+
+class _FakeCodePipeline:
+    """ Methods to be passed to the fake `paginate` below """
+
+    def list_pipelines(self):
+        pass
+
+    def list_pipeline_executions(self):
+        pass
+
+    def list_action_executions(self):
+        pass
+
+
+def _fake_paginate(method, **kwargs):
+    time.sleep(random.uniform(0, 0.01))  # Complete out of order
+    name = method.__name__
+    if name == "list_pipelines":
+        return iter([{"name": p} for p in PIPELINES])
+    if name == "list_pipeline_executions":
+        if kwargs["pipelineName"] not in PIPELINES:
+            raise ClientError({"Error": {"Code": "PipelineNotFoundException", "Message": "Not found"}}, name)
+        executions = PIPELINES[kwargs["pipelineName"]][:kwargs["PaginationConfig"]["MaxItems"]]
+        return iter([{"pipelineExecutionId": e, "status": "Succeeded",
+                      "sourceRevisions": [{"actionName": "Source", "revisionId": "0123456789abcdef"}]}
+                     for e in executions])
+    return iter([_detail("Deploy"), _detail("Build"), _detail("Source")])
+
+
+class TestIterExecutions(TestCase):
+    def setUp(self):
+        patch = mock.patch("tlx.codepipeline.executions.paginate", _fake_paginate)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.client = _FakeCodePipeline()
+
+    def test_ordered(self):
+        msg = "Summaries should come pipeline by pipeline, newest first, whatever order they complete in"
+
+        executions = list(iter_executions(client=self.client, max_workers=4))
+        self.assertEqual([(e["Pipeline"], e["ExecutionId"]) for e in executions],
+                         [("api-deploy", "e1"), ("api-deploy", "e2"), ("api-deploy", "e3"), ("web-deploy", "e4")], msg)
+        self.assertEqual(executions[0], {
+            "Pipeline": "api-deploy", "StartTime": datetime(2024, 1, 1), "Ver": 3, "StagesRan": 3,
+            "FinalStage": "Deploy", "Status": "Succeeded", "Source": "01234567", "ExecutionId": "e1"}, msg)
+
+    def test_patterns_and_errors(self):
+        msg = "Globs select pipelines, and a missing pipeline shouldn't stop the others"
+
+        executions = list(iter_executions(["web-*", "missing"], count=2, client=self.client))
+        self.assertEqual([e["Pipeline"] for e in executions], ["web-deploy"], "'missing' isn't listed by the glob")
+
+        executions = list(iter_executions(["missing", "api-deploy"], count=2, client=self.client))
+        self.assertEqual(executions[0]["Error"], "An error occurred (PipelineNotFoundException) when calling the "
+                                                 "list_pipeline_executions operation: Not found", msg)
+        self.assertEqual([e["ExecutionId"] for e in executions[1:]], ["e1", "e2"], msg)
+
+    def test_find_pipelines(self):
+        self.assertEqual(find_pipelines(["*-deploy"], self.client), ["api-deploy", "web-deploy"])
+        self.assertEqual(find_pipelines(client=self.client), list(PIPELINES))
+        with mock.patch("tlx.codepipeline.executions.paginate") as paginate:
+            self.assertEqual(find_pipelines(["a", "b"], self.client), ["a", "b"])
+            paginate.assert_not_called()
+
+    def test_stop_early(self):
+        before = threading.active_count()
+        executions = iter_executions(client=self.client, max_workers=2)
+        next(executions)
+        executions.close()
+        time.sleep(0.1)
+        self.assertLessEqual(threading.active_count(), before, "The pool should be shut down")
+
+
+def test_execution_details_paginates():
+    cp = boto3.client('codepipeline', region_name='ap-southeast-2')
+    stubber = Stubber(cp)
+    expected = {'pipelineName': 'p', 'filter': {'pipelineExecutionId': 'e1'}}
+    stubber.add_response('list_action_executions', {'actionExecutionDetails': [{'stageName': 'Deploy'}],
+                                                    'nextToken': 'next'}, expected)
+    stubber.add_response('list_action_executions', {'actionExecutionDetails': [{'stageName': 'Source'}]},
+                         dict(expected, nextToken='next'))
+    with stubber:
+        assert [d['stageName'] for d in execution_details(cp, 'p', 'e1')] == ['Deploy', 'Source']
@@ -1,7 +1,131 @@
+import datetime as dt
+import io
+import json
+from decimal import Decimal
+
+import pytest
+
+from tlx.dynamodb import json_dumps, json_iter_array, json_iterloads, json_loads
+from tlx.dynamodb.json import JSON_BACKENDS, set_json_backend
+
+
 def test_json_loads():
-    assert True  # TODO
+    """ Numbers are exact in both modes. Fast mode only leaves integers as int """
+    text = '{"odds": 1.1000000000000000001, "id": 123456789012345678901234567890, "x": [2, 0.5]}'
+
+    item = json_loads(text)
+    assert item == {"odds": Decimal("1.1000000000000000001"), "id": Decimal("123456789012345678901234567890"),
+                    "x": [Decimal(2), Decimal("0.5")]}
+    assert type(item["id"]) is Decimal
+
+    fast = json_loads(text.encode(), fast=True)
+    assert fast == item
+    assert type(fast["id"]) is int and type(fast["odds"]) is Decimal
+
+    assert json_loads('{"a": 1}', object_pairs_hook=list) == [("a", Decimal(1))]
+    assert json_loads('{"a": 1}', fast=True, object_pairs_hook=list) == [("a", 1)]
+
+
+def test_json_iterloads():
+    """ One object per line, blank lines skipped """
+    text = '{"a": 1.5}\n\n  \n{"b": [1]}\n'
+
+    for binary in (False, True):
+        assert list(json_iterloads(_dump(text, binary))) == [{"a": Decimal("1.5")}, {"b": [Decimal(1)]}]
+    assert type(next(json_iterloads(io.StringIO('{"b": 1}'), fast=True))["b"]) is int
+
+    with pytest.raises(json.JSONDecodeError):
+        list(json_iterloads(io.StringIO('{"a": 1}\n{"b"\n')))
 
 
 def test_json_dumps():
-    """ Implicitly tests DynamoEncoder """
-    assert True  # TODO
+    """ Implicitly tests DynamoEncoder. Every backend should give the same data """
+    payload = {
+        "n": Decimal("1.5"),
+        "i": Decimal("10"),
+        "big": 2 ** 70,
+        "when": dt.datetime(2020, 1, 2, 3, 4, 5, 678901),
+        "tags": {"a"},
+        "nested": [{"s": "é/"}, None, True],
+    }
+    expected = {
+        "n": 1.5,
+        "i": 10.0,
+        "big": 2 ** 70,
+        "when": "2020-01-02T03:04:05.678",
+        "tags": ["a"],
+        "nested": [{"s": "é/"}, None, True],
+    }
+
+    try:
+        for backend in JSON_BACKENDS:
+            set_json_backend(backend)
+            assert json.loads(json_dumps(payload)) == expected, backend
+    finally:
+        set_json_backend()
+
+
+def test_json_dumps_non_finite():
+    """ Decimals that overflow a float, NaN and Infinity are written the same by every backend. Native float NaN and
+        Infinity are written as null by orjson only (documented in `set_json_backend`) """
+    decimals = [Decimal("1e400"), Decimal("-1e400"), Decimal("NaN"), Decimal("Infinity")]
+    floats = [float("nan"), float("inf")]
+    try:
+        for backend in JSON_BACKENDS:
+            set_json_backend(backend)
+            assert json.dumps(json.loads(json_dumps(decimals))) == "[Infinity, -Infinity, NaN, Infinity]", backend
+            expected = "[null, null]" if backend == "orjson" else "[NaN, Infinity]"
+            assert json.dumps(json.loads(json_dumps(floats))) == expected, backend
+    finally:
+        set_json_backend()
+
+
+def test_json_dumps_stdlib_format():
+    """ The standard library backend and kwargs keep the original formatting """
+    try:
+        set_json_backend("json")
+        assert json_dumps({"a": [1, Decimal("2.5")]}) == '{"a": [1,2.5]}'
+    finally:
+        set_json_backend()
+    assert json_dumps({"a": 1}, indent=4) == '{\n    "a": 1\n}'
+
+    with pytest.raises(ValueError):
+        set_json_backend("nope")
+
+
+def _dump(text, binary):
+    return io.BytesIO(text.encode()) if binary else io.StringIO(text)
+
+
+def test_json_iter_array():
+    """ Elements should be identical to json.load regardless of chunk boundaries """
+    dump = {
+        "Count": 123456789,
+        "Items": [{"ID": {"N": str(i)}, "Name": {"S": "é" * i}, "L": {"L": [{"N": "1.5"}] * i}} for i in range(20)],
+        "ScannedCount": 20,
+    }
+    text = json.dumps(dump, indent=2)
+
+    for chunk_size in (1, 7, 64, 1 << 16):
+        for binary in (False, True):
+            items = list(json_iter_array(_dump(text, binary), "Items", chunk_size=chunk_size))
+            assert items == dump["Items"]
+
+
+def test_json_iter_array_is_lazy():
+    """ Elements should be yielded before the rest of the file is read """
+    f = io.StringIO('{"Items": [1, 2, 3, ' + ' ' * 10000 + '4]}')
+    items = json_iter_array(f, chunk_size=16)
+
+    assert next(items) == 1
+    assert f.tell() < 100
+
+
+def test_json_iter_array_errors():
+    with pytest.raises(KeyError):
+        list(json_iter_array(io.StringIO('{"Count": 0}')))
+
+    with pytest.raises(json.JSONDecodeError):
+        list(json_iter_array(io.StringIO('{"Items": [{"ID": 1}, ')))
+
+    assert list(json_iter_array(io.StringIO('{"Items": []}'))) == []
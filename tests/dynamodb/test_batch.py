@@ -1,14 +1,27 @@
+import gzip
+import io
 import json
 import os
 import tempfile
+import time
 from decimal import Decimal
 from textwrap import dedent
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
 
 import tlx.dynamodb.batch
 
 
+def _capture_items(batch_write):
+    """Items are streamed from open files, so must be consumed during the (mocked) `batch_write` call"""
+
+    written = []
+    batch_write.side_effect = lambda table, items, **kwargs: written.extend(items)
+    return written
+
+
 @patch("tlx.dynamodb.batch.get_ddb_table", autospec=True)
 @patch("tlx.dynamodb.batch.batch_write", autospec=True)
 class TestBatchLoad(TestCase):
@@ -63,9 +76,11 @@ class TestBatchLoad(TestCase):
                 f.write(self.text_input_data)
 
             # 2.    Check output
+            written = _capture_items(batch_write)
             tlx.dynamodb.batch.load_from_csv(path, "table")
             assert get_ddb_table.call_count == 1
-            batch_write.assert_called_with("table1", self.expected_batch_output)
+            self.assertEqual(batch_write.call_args[0][0], "table1")
+            self.assertListEqual(written, self.expected_batch_output)
         finally:
             os.remove(path)
 
@@ -81,9 +96,11 @@ class TestBatchLoad(TestCase):
                 f.write(self.text_input_data)
 
             # 2.    Check output
+            written = _capture_items(batch_write)
             tlx.dynamodb.batch.load_from_csv(path, "table")
             assert get_ddb_table.call_count == 1
-            batch_write.assert_called_with("table1", self.expected_batch_output)
+            self.assertEqual(batch_write.call_args[0][0], "table1")
+            self.assertListEqual(written, self.expected_batch_output)
         finally:
             os.remove(path)
 
@@ -92,11 +109,11 @@ class TestBatchLoad(TestCase):
 
         get_ddb_table.return_value = "table1"
 
-        # 1.    Get tempfile and write csv data N.B UNSPPORTED TYPES: List
+        # 1.    Get tempfile and write csv data N.B UNSPPORTED TYPES: X
         text_data = dedent(
             """
             ID,Name,Last
-            N,S,L
+            N,S,X
             1,Flojo,['Jones', 'Poo']
             2,Hubert,['McFuddle']
         """
@@ -116,6 +133,36 @@ class TestBatchLoad(TestCase):
         finally:
             os.remove(path)
 
+    def test_load_from_csv_types(self, batch_write, get_ddb_table):
+        msg = "every supported header type should be converted, and empty cells dropped"
+
+        text_data = dedent(
+            """
+            ID,Active,Tags,Scores,Meta,History,Note
+            N,BOOL,SS,NS,M,L,S
+            0,false,"[""a"", ""b""]","[1, 2.5]","{""x"": {""y"": 1.5}}","[1, ""two""]",
+            """
+        ).strip()
+        expected = [{
+            "ID": Decimal("0"),
+            "Active": False,
+            "Tags": {"a", "b"},
+            "Scores": {Decimal("1"), Decimal("2.5")},
+            "Meta": {"x": {"y": Decimal("1.5")}},
+            "History": [Decimal("1"), "two"],
+        }]
+
+        _, path = tempfile.mkstemp()
+        try:
+            with open(path, "w") as f:
+                f.write(text_data)
+
+            written = _capture_items(batch_write)
+            tlx.dynamodb.batch.load_from_csv(path, "table")
+            self.assertListEqual(written, expected, msg)
+        finally:
+            os.remove(path)
+
     def test_load_from_json_with_id(self, batch_write, get_ddb_table):
         """should form correct item list for boto3 batch_write operation"""
 
@@ -162,3 +209,138 @@ class TestBatchLoad(TestCase):
             )
         finally:
             os.remove(path)
+
+
+class TestBatchWriter(TestCase):
+    def _table(self):
+        table = MagicMock()
+        table.name = "table1"
+        table.meta.client.exceptions.ClientError = ClientError
+        table.meta.client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        return table
+
+    def test_batches(self):
+        msg = "requests should be sent in batches of at most 25"
+
+        table = self._table()
+        tlx.dynamodb.batch.batch_write(table, ({"ID": i} for i in range(60)), max_workers=3)
+
+        calls = table.meta.client.batch_write_item.call_args_list
+        sizes = sorted(len(c.kwargs["RequestItems"]["table1"]) for c in calls)
+        self.assertListEqual(sizes, [10, 25, 25], msg)
+
+    def test_unprocessed_retried(self):
+        msg = "unprocessed items should be resent until written"
+
+        table = self._table()
+        unprocessed = [{"DeleteRequest": {"Key": {"ID": 1}}}]
+        table.meta.client.batch_write_item.side_effect = [
+            {"UnprocessedItems": {"table1": unprocessed}},
+            {"UnprocessedItems": {}},
+        ]
+        tlx.dynamodb.batch.batch_delete(table, [{"ID": 0}, {"ID": 1}], backoff_base=0.001)
+
+        last_call = table.meta.client.batch_write_item.call_args
+        self.assertListEqual(last_call.kwargs["RequestItems"]["table1"], unprocessed, msg)
+
+    def test_retries_exhausted(self):
+        msg = "a batch that is never processed should raise once retries are exhausted"
+
+        table = self._table()
+        error = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "BatchWriteItem")
+        table.meta.client.batch_write_item.side_effect = error
+
+        with self.assertRaises(RuntimeError, msg=msg):
+            tlx.dynamodb.batch.batch_write(table, [{"ID": 1}], max_retries=2, backoff_base=0.001)
+        self.assertEqual(table.meta.client.batch_write_item.call_count, 3, msg)
+
+    def test_auto_tune(self):
+        msg = "the WCU estimate per request should move towards the consumed capacity"
+
+        table = self._table()
+        table.meta.client.batch_write_item.return_value = {
+            "UnprocessedItems": {},
+            "ConsumedCapacity": [{"TableName": "table1", "CapacityUnits": 50.0}],
+        }
+        with tlx.dynamodb.batch.BatchWriter(table, target_wcu=1000, auto_tune=True) as writer:
+            for i in range(25):
+                writer.put_item(Item={"ID": i})
+
+        self.assertGreater(writer._wcu_per_request, 1.0, msg)
+
+    def test_auto_tune_concurrency(self):
+        msg = "throttling should reduce the calls in flight, even without a target_wcu"
+
+        table = self._table()
+        throttled = ClientError({"Error": {"Code": "ThrottlingException"}}, "BatchWriteItem")
+        unprocessed = {"UnprocessedItems": {"table1": [{"PutRequest": {"Item": {"ID": 0}}}]}}
+        table.meta.client.batch_write_item.side_effect = [throttled, unprocessed, {"UnprocessedItems": {}}]
+        with tlx.dynamodb.batch.BatchWriter(table, max_workers=8, auto_tune=True, backoff_base=0.001) as writer:
+            writer.put_item(Item={"ID": 0})
+
+        self.assertEqual(writer._limit.limit, 2, msg)  # Halved twice
+
+    def test_auto_tune_recovers(self):
+        msg = "the calls in flight should grow back while writes succeed"
+
+        writer = tlx.dynamodb.batch.BatchWriter(self._table(), max_workers=4, auto_tune=True)
+        writer._limit.throttled()
+        with writer:
+            for i in range(10 * 25):
+                writer.put_item(Item={"ID": i})
+        self.assertEqual(writer._limit.limit, 4, msg)
+
+
+class TestTokenBucket(TestCase):
+    def test_rate_limited(self):
+        msg = "taking more tokens than the capacity should wait for them to be added"
+
+        bucket = tlx.dynamodb.batch.TokenBucket(rate=100)
+        start = time.monotonic()
+        for _ in range(3):
+            bucket.acquire(50)  # Capacity 100, so the third waits ~0.5s
+        self.assertGreater(time.monotonic() - start, 0.4, msg)
+
+
+@patch("tlx.dynamodb.batch.get_ddb_table", autospec=True)
+@patch("tlx.dynamodb.batch.batch_write", autospec=True)
+class TestLoadScanDumpStream(TestCase):
+    def test_load_scan_dump_stream(self, batch_write, get_ddb_table):
+        msg = "a streamed dump should yield the same items as one loaded whole"
+
+        get_ddb_table.return_value = "table1"
+        dump_file = io.StringIO(json.dumps(TestBatchLoad.scan_dump_data))
+        tlx.dynamodb.batch.load_scan_dump(dump_file, "table1", stream=True)
+
+        self.assertListEqual(
+            sorted(batch_write.call_args[0][1], key=lambda x: x["ID"]),
+            TestBatchLoad.expected_batch_output,
+            msg,
+        )
+
+
+class TestLoadJsonDumps(TestCase):
+    def test_load_json_dumps(self):
+        msg = "items from every shard (plain or gzipped) in the directory should be written"
+
+        table = MagicMock()
+        table.name = "table1"
+        table.meta.client.batch_write_item.return_value = {"UnprocessedItems": {}}
+
+        with tempfile.TemporaryDirectory() as directory:
+            for shard in range(5):
+                name = os.path.join(directory, f"shard-{shard}.json")
+                with (gzip.open(name + ".gz", "wt") if shard % 2 else open(name, "w")) as f:
+                    for i in range(shard * 10, shard * 10 + 10):
+                        f.write(json.dumps({"ID": i, "Value": 1.5}) + "\n\n")
+
+            total = tlx.dynamodb.batch.load_json_dumps(directory, table, processes=2)
+
+        written = [
+            r["PutRequest"]["Item"]
+            for c in table.meta.client.batch_write_item.call_args_list
+            for r in c.kwargs["RequestItems"]["table1"]
+        ]
+        self.assertEqual(total, 50, msg)
+        self.assertListEqual(sorted(i["ID"] for i in written), list(range(50)), msg)
+        self.assertEqual(written[0]["Value"], Decimal("1.5"), msg)
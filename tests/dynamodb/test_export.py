@@ -0,0 +1,132 @@
+import os
+import tempfile
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+
+from boto3.dynamodb.types import Binary
+
+import tlx.dynamodb.batch
+import tlx.dynamodb.export
+from tlx.dynamodb.cli_apps.dynamodb_batch_write import dbw
+
+
+def _item(i):
+    return {
+        "ID": Decimal(i),
+        "Price": Decimal("12345678901234567890.000000001"),
+        "Tags": {"a", "b"},
+        "Blob": Binary(b"\x00\x01"),
+        "Nested": {"L": [True, None, "x"]},
+    }
+
+
+class _Table:
+    """Fake boto3 Table. 2 segments of 3 pages of 2 items.  Raises on a scan of page `fail_on` if set."""
+
+    name = "table1"
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.meta = MagicMock()
+
+    def scan(self, Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+        page = int(ExclusiveStartKey["page"]) if ExclusiveStartKey else 0
+        if page == self.fail_on:
+            raise RuntimeError("interrupted")
+        first = Segment * 6 + page * 2
+        res = {"Items": [_item(i) for i in range(first, first + 2)]}
+        if page < 2:
+            res["LastEvaluatedKey"] = {"page": Decimal(page + 1)}
+        return res
+
+
+class TestExport(TestCase):
+    def _loaded(self, directory, fmt):
+        """Items loaded back from the export with the tlx loaders"""
+
+        table = MagicMock()
+        table.name = "table1"
+        table.meta.client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        if fmt == "ndjson":
+            tlx.dynamodb.batch.load_json_dumps(directory, table, processes=0)
+        else:
+            for shard in os.listdir(directory):
+                if shard.endswith(".json.gz"):
+                    tlx.dynamodb.batch.load_scan_dump(os.path.join(directory, shard), table, stream=True)
+        return self._written(table)
+
+    @staticmethod
+    def _written(table):
+        return sorted(
+            (
+                r["PutRequest"]["Item"]
+                for c in table.meta.client.batch_write_item.call_args_list
+                for r in c.kwargs["RequestItems"]["table1"]
+            ),
+            key=lambda i: i["ID"],
+        )
+
+    def test_dynamodb_cli_round_trip(self):
+        msg = "a gzipped dynamodb shard should load with `dynamo-batch-write --dump-file <shard>`"
+
+        table = MagicMock()
+        table.name = "table1"
+        table.meta.client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        with tempfile.TemporaryDirectory() as directory:
+            tlx.dynamodb.export.export_table(_Table(), directory, format="dynamodb", total_segments=1)
+            [shard] = [f for f in os.listdir(directory) if f.endswith(".json.gz")]
+            with patch("tlx.dynamodb.batch.get_ddb_table", return_value=table):
+                result = CliRunner().invoke(dbw, ["--dump-file", os.path.join(directory, shard), "--table", "table1"])
+
+        self.assertEqual(result.output, "", msg)
+        self.assertEqual(result.exit_code, 0, msg)
+        self.assertEqual([i["ID"] for i in self._written(table)], list(range(6)), msg)
+
+    def test_dynamodb_round_trip(self):
+        msg = "the dynamodb format should load back exactly"
+
+        with tempfile.TemporaryDirectory() as directory:
+            count = tlx.dynamodb.export.export_table(
+                _Table(), directory, format="dynamodb", total_segments=2, items_per_shard=3
+            )
+            shards = [f for f in os.listdir(directory) if f.endswith(".json.gz")]
+            loaded = self._loaded(directory, "dynamodb")
+
+        expected = [_item(i) for i in range(12)]
+        for item in expected:
+            item["Blob"] = item["Blob"].value
+        self.assertEqual(count, 12, msg)
+        self.assertEqual(len(shards), 4, "shards should rotate at the page boundary after items_per_shard")
+        self.assertListEqual(loaded, expected, msg)
+
+    def test_ndjson_round_trip(self):
+        msg = "numbers should load back exactly from ndjson"
+
+        with tempfile.TemporaryDirectory() as directory:
+            tlx.dynamodb.export.export_table(_Table(), directory, total_segments=2)
+            loaded = self._loaded(directory, "ndjson")
+
+        self.assertListEqual([i["ID"] for i in loaded], list(range(12)), msg)
+        self.assertEqual(loaded[0]["Price"], Decimal("12345678901234567890.000000001"), msg)
+        self.assertListEqual(loaded[0]["Tags"], ["a", "b"], msg)
+        self.assertEqual(loaded[0]["Blob"], "AAE=", msg)
+
+    def test_resume(self):
+        msg = "a re-run should resume an interrupted export without duplicating items"
+
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(RuntimeError):
+                tlx.dynamodb.export.export_table(
+                    _Table(fail_on=2), directory, total_segments=2, max_workers=1, items_per_shard=2
+                )
+            count = tlx.dynamodb.export.export_table(_Table(), directory, total_segments=2, items_per_shard=2)
+            loaded = self._loaded(directory, "ndjson")
+
+            with self.assertRaises(Exception, msg="an export with other settings should be refused"):
+                tlx.dynamodb.export.export_table(_Table(), directory, total_segments=4)
+
+        self.assertEqual(count, 12, msg)
+        self.assertListEqual([i["ID"] for i in loaded], list(range(12)), msg)
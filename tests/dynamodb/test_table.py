@@ -1,5 +1,28 @@
+import threading
 from unittest import TestCase
-# import tlx.dynamodb.table
+from unittest.mock import MagicMock, patch
+
+import boto3
+
+import tlx.dynamodb.table
+from tlx.dynamodb.table import UpdateBatcher
+
+
+def _segmented_table(segments):
+    """Fake boto3 Table whose scan serves `segments` (list of lists of pages) by Segment number"""
+
+    table = MagicMock()
+    table.name = "table1"
+
+    def scan(Segment=0, TotalSegments=1, ExclusiveStartKey=0, **kwargs):
+        pages = segments[Segment]
+        res = {"Items": pages[ExclusiveStartKey]}
+        if ExclusiveStartKey + 1 < len(pages):
+            res["LastEvaluatedKey"] = ExclusiveStartKey + 1
+        return res
+
+    table.scan.side_effect = scan
+    return table
 
 
 class TestTable(TestCase):
@@ -10,3 +33,280 @@ class TestTable(TestCase):
     def test_add_new_map_field(self):
         # msg = 'Field should be added'
         pass
+
+
+class TestParallelScan(TestCase):
+    segments = [
+        [[{"ID": 1}, {"ID": 2}], [{"ID": 3}]],
+        [[{"ID": 4}]],
+        [[], [{"ID": 5}], [{"ID": 6}]],
+    ]
+
+    def test_parallel_scan(self):
+        msg = "every item of every page of every segment should be returned"
+
+        table = _segmented_table(self.segments)
+        items = tlx.dynamodb.table.parallel_scan(table, total_segments=3, max_workers=2)
+
+        self.assertListEqual(sorted(i["ID"] for i in items), [1, 2, 3, 4, 5, 6], msg)
+
+    def test_parallel_scan_streams_pages(self):
+        msg = "a page should be yielded before its segment has been scanned to the end"
+
+        table = _segmented_table(self.segments)
+        scan, second_page = table.scan.side_effect, threading.Event()
+
+        def slow_scan(**kwargs):
+            if kwargs.get("ExclusiveStartKey"):
+                self.assertTrue(second_page.wait(5), msg)
+            return scan(**kwargs)
+
+        table.scan.side_effect = slow_scan
+        items = tlx.dynamodb.table.parallel_scan(table, total_segments=1)
+        self.assertEqual(next(items), {"ID": 1}, msg)
+        self.assertEqual(next(items), {"ID": 2}, msg)
+        second_page.set()
+        self.assertListEqual(list(items), [{"ID": 3}], msg)
+
+    def test_parallel_scan_errors(self):
+        msg = "a segment's error should be raised to the caller"
+
+        table = _segmented_table(self.segments)
+        table.scan.side_effect = RuntimeError("throttled")
+        with self.assertRaisesRegex(RuntimeError, "throttled", msg=msg):
+            list(tlx.dynamodb.table.parallel_scan(table, total_segments=3))
+
+    def test_parallel_scan_params(self):
+        msg = "scan params should be passed to every segment along with Segment and TotalSegments"
+
+        table = _segmented_table(self.segments)
+        tlx.dynamodb.table.full_scan(table, total_segments=3, FilterExpression="filter")
+
+        for call in table.scan.call_args_list:
+            self.assertEqual(call.kwargs["FilterExpression"], "filter", msg)
+            self.assertEqual(call.kwargs["TotalSegments"], 3, msg)
+        self.assertSetEqual({c.kwargs["Segment"] for c in table.scan.call_args_list}, {0, 1, 2}, msg)
+
+    def test_threads_own_tables(self):
+        msg = "each thread should scan with a table resource of its own that shares the table's client"
+
+        table = boto3.resource("dynamodb", region_name="eu-west-1", aws_access_key_id="a",
+                               aws_secret_access_key="b").Table("table1")
+        tables = list(tlx.dynamodb.table.map_segments(lambda t, segment, total: t, table, total_segments=3))
+
+        self.assertEqual(len({id(t) for t in tables + [table]}), 4, msg)
+        self.assertTrue(all(t.name == "table1" and t.meta.client is table.meta.client for t in tables), msg)
+
+    def test_processes_keep_region_and_endpoint(self):
+        msg = "process workers should rebuild the table with the caller's region and endpoint, not the defaults"
+
+        table = _segmented_table(self.segments)
+        table.meta.client.meta.region_name = "eu-west-1"
+        table.meta.client.meta.endpoint_url = "http://localhost:8000"
+        worker_table = _segmented_table(self.segments)
+        rebuilt = []
+
+        def get_ddb_table(t, **kwargs):
+            if isinstance(t, str):
+                rebuilt.append((t, kwargs))
+                return worker_table
+            return t
+
+        # Threads stand in for processes, which can't be sent the fake table
+        with patch("tlx.dynamodb.table.ProcessPoolExecutor", tlx.dynamodb.table.ThreadPoolExecutor), \
+                patch("tlx.dynamodb.table.get_ddb_table", get_ddb_table):
+            items = list(tlx.dynamodb.table.parallel_scan(table, total_segments=3, use_processes=True))
+
+        self.assertListEqual(sorted(i["ID"] for i in items), [1, 2, 3, 4, 5, 6], msg)
+        self.assertEqual(rebuilt, [("table1", {"region": "eu-west-1", "endpoint_url": "http://localhost:8000"})] * 3,
+                         msg)
+        table.scan.assert_not_called()
+
+
+class TestIterScan(TestCase):
+    pages = [[{"ID": 1}, {"ID": 2}], [{"ID": 3}], [{"ID": 4}]]
+
+    def test_iter_scan_items(self):
+        msg = "items of every page should be yielded in order"
+
+        for prefetch_pages in (0, 2):
+            table = _segmented_table([self.pages])
+            items = tlx.dynamodb.table.iter_scan(table, prefetch_pages=prefetch_pages)
+            self.assertListEqual([i["ID"] for i in items], [1, 2, 3, 4], msg)
+
+    def test_iter_scan_is_lazy(self):
+        msg = "no page should be requested until the first item is"
+
+        table = _segmented_table([self.pages])
+        items = tlx.dynamodb.table.iter_scan(table)
+        self.assertFalse(table.scan.called, msg)
+        next(items)
+        self.assertEqual(table.scan.call_count, 1, msg)
+
+    def test_iter_scan_resume(self):
+        msg = "passing a page's LastEvaluatedKey back should resume after that page"
+
+        table = _segmented_table([self.pages])
+        first_page = next(tlx.dynamodb.table.iter_scan(table, pages=True))
+        rest = tlx.dynamodb.table.iter_scan(table, ExclusiveStartKey=first_page["LastEvaluatedKey"])
+
+        self.assertListEqual([i["ID"] for i in rest], [3, 4], msg)
+
+
+class TestClearTable(TestCase):
+    def _table(self):
+        table = _segmented_table([
+            [[{"pk": "a", "sk": 1}, {"pk": "a", "sk": 2}], [{"pk": "b", "sk": 1}]],
+            [[{"pk": "c", "sk": 1}]],
+        ])
+        table.key_schema = [{"AttributeName": "pk", "KeyType": "HASH"}, {"AttributeName": "sk", "KeyType": "RANGE"}]
+        table.meta.client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        return table
+
+    def test_clear_table(self):
+        msg = "only the composite keys should be scanned, in parallel, and every one deleted"
+
+        table = self._table()
+        count = tlx.dynamodb.table.clear_table(table, total_segments=2, max_workers=2)
+
+        for call in table.scan.call_args_list:
+            self.assertEqual(call.kwargs["ProjectionExpression"], "#k0, #k1", msg)
+            self.assertDictEqual(call.kwargs["ExpressionAttributeNames"], {"#k0": "pk", "#k1": "sk"}, msg)
+        deleted = [
+            r["DeleteRequest"]["Key"]
+            for c in table.meta.client.batch_write_item.call_args_list
+            for r in c.kwargs["RequestItems"]["table1"]
+        ]
+        self.assertEqual(count, 4, msg)
+        self.assertCountEqual(
+            deleted, [{"pk": "a", "sk": 1}, {"pk": "a", "sk": 2}, {"pk": "b", "sk": 1}, {"pk": "c", "sk": 1}], msg
+        )
+
+    def test_clear_table_streams(self):
+        msg = "deletes should start while the table is still being scanned"
+
+        keys = [{"pk": str(i), "sk": 1} for i in range(25)]  # One full batch
+        table = _segmented_table([[keys, [{"pk": "last", "sk": 1}]]])
+        table.key_schema = [{"AttributeName": "pk", "KeyType": "HASH"}, {"AttributeName": "sk", "KeyType": "RANGE"}]
+        scan, deleting = table.scan.side_effect, threading.Event()
+
+        def slow_scan(**kwargs):
+            if kwargs.get("ExclusiveStartKey"):
+                self.assertTrue(deleting.wait(5), msg)
+            return scan(**kwargs)
+
+        def batch_write_item(**kwargs):
+            deleting.set()
+            return {"UnprocessedItems": {}}
+
+        table.scan.side_effect = slow_scan
+        table.meta.client.batch_write_item.side_effect = batch_write_item
+        self.assertEqual(tlx.dynamodb.table.clear_table(table, total_segments=1, max_workers=2), 26, msg)
+
+    def test_clear_table_recreate(self):
+        msg = "the table should be created again from its description"
+
+        table = self._table()
+        client = table.meta.client
+        client.describe_table.return_value = {"Table": {
+            "TableArn": "arn:table1",
+            "KeySchema": table.key_schema,
+            "AttributeDefinitions": [{"AttributeName": "pk", "AttributeType": "S"}],
+            "BillingModeSummary": {"BillingMode": "PAY_PER_REQUEST"},
+            "ProvisionedThroughput": {"ReadCapacityUnits": 0, "WriteCapacityUnits": 0, "NumberOfDecreasesToday": 0},
+            "GlobalSecondaryIndexes": [{
+                "IndexName": "gsi",
+                "KeySchema": [{"AttributeName": "sk", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "KEYS_ONLY"},
+                "IndexStatus": "ACTIVE",
+            }],
+        }}
+        client.describe_time_to_live.return_value = {
+            "TimeToLiveDescription": {"TimeToLiveStatus": "ENABLED", "AttributeName": "expires"}
+        }
+        client.describe_continuous_backups.return_value = {"ContinuousBackupsDescription": {}}
+
+        with patch("tlx.dynamodb.table.paginate", return_value=iter([])):  # No tags
+            tlx.dynamodb.table.clear_table(table, recreate=True)
+
+        self.assertFalse(table.scan.called, msg)
+        client.delete_table.assert_called_once_with(TableName="table1")
+        client.create_table.assert_called_once_with(
+            TableName="table1",
+            KeySchema=table.key_schema,
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+            GlobalSecondaryIndexes=[{
+                "IndexName": "gsi",
+                "KeySchema": [{"AttributeName": "sk", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "KEYS_ONLY"},
+            }],
+        )
+        client.update_time_to_live.assert_called_once_with(
+            TableName="table1", TimeToLiveSpecification={"Enabled": True, "AttributeName": "expires"}
+        )
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class TestUpdateBatcher(TestCase):
+    def _table(self):
+        table = MagicMock()
+        table.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+        return table
+
+    @patch("tlx.dynamodb.table.append_to_list_field", return_value=200)
+    def test_unknown_paths_fall_back(self, append_to_list_field):
+        msg = "appends to unknown paths should be merged per path and sent with append_to_list_field"
+
+        table = self._table()
+        with UpdateBatcher(table) as updates:
+            first = updates.append({"id": "m1"}, ["providers", "#p"], {"#p": "BILL"}, [1])
+            updates.append({"id": "m1"}, ["providers", "#q"], {"#q": "BILL"}, [2])
+            updates.append({"id": "m1"}, ["providers", "#p"], {"#p": "TAB"}, [3])
+
+        self.assertEqual(first.result(), 200, msg)
+        self.assertEqual(append_to_list_field.call_count, 2, msg)
+        _, key, fields, names, items, _ = append_to_list_field.call_args_list[0].args
+        self.assertEqual(key, {"id": "m1"}, msg)
+        self.assertListEqual([names[f] for f in fields], ["providers", "BILL"], msg)
+        self.assertListEqual(items, [2, 1], "later appends go in front, as with list_append(:new_item, path)")
+
+    @patch("tlx.dynamodb.table.append_to_list_field", return_value=200)
+    def test_known_paths_coalesced(self, append_to_list_field):
+        msg = "once paths are known, all appends for a key should be one update_item"
+
+        table = self._table()
+        updates = UpdateBatcher(table)
+        for provider in ("BILL", "TAB"):
+            updates.append({"id": "m1"}, ["providers", "#p"], {"#p": provider}, [0])
+        updates.flush()
+
+        for provider in ("BILL", "TAB", "NEW"):  # NEW is missing but its parent is known
+            updates.append({"id": "m1"}, ["providers", "#p"], {"#p": provider}, [1])
+        self.assertListEqual(updates.flush(), [200, 200, 200], msg)
+        updates.close()
+
+        self.assertEqual(append_to_list_field.call_count, 2, msg)
+        self.assertEqual(table.update_item.call_count, 1, msg)
+        kwargs = table.update_item.call_args.kwargs
+        self.assertEqual(kwargs["UpdateExpression"].count("list_append"), 3, msg)
+        self.assertEqual(kwargs["ConditionExpression"], "attribute_exists(#n0)", msg)
+        self.assertEqual(kwargs["ExpressionAttributeNames"]["#n0"], "providers", msg)
+
+    @patch("tlx.dynamodb.table.append_to_list_field", return_value=200)
+    def test_stale_cache(self, append_to_list_field):
+        msg = "if a cached parent has gone, the appends should fall back to append_to_list_field"
+
+        table = self._table()
+        updates = UpdateBatcher(table)
+        updates.append({"id": "m1"}, ["providers", "BILL"], {}, [0])
+        updates.flush()
+
+        table.update_item.side_effect = ConditionalCheckFailedException
+        updates.append({"id": "m1"}, ["providers", "BILL"], {}, [1])
+        self.assertListEqual(updates.flush(), [200], msg)
+        self.assertEqual(append_to_list_field.call_count, 2, msg)
+        updates.close()
@@ -0,0 +1,67 @@
+from decimal import Decimal
+from unittest import TestCase
+
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+
+from tlx.dynamodb.types import deserialize, deserialize_item, serialize, serialize_item
+
+
+class TestTypes(TestCase):
+    typed_item = {
+        "S": {"S": "text"},
+        "N": {"N": "12345678901234567890.123"},
+        "B": {"B": b"\x00\x01"},
+        "BOOL": {"BOOL": False},
+        "NULL": {"NULL": True},
+        "SS": {"SS": ["a", "b"]},
+        "NS": {"NS": ["1", "2.5"]},
+        "BS": {"BS": [b"\x00", b"\x01"]},
+        "L": {"L": [{"S": "a"}, {"N": "1"}, {"L": []}]},
+        "M": {"M": {"nested": {"M": {"deep": {"BOOL": True}}}}},
+    }
+
+    def _boto3_python(self):
+        deserializer = TypeDeserializer()
+        item = {k: deserializer.deserialize(v) for k, v in self.typed_item.items()}
+        # boto3 wraps binary values
+        item["B"] = item["B"].value
+        item["BS"] = {b.value for b in item["BS"]}
+        return item
+
+    def test_deserialize_item(self):
+        msg = "should match boto3's TypeDeserializer for every DynamoDB type"
+
+        self.assertDictEqual(deserialize_item(self.typed_item), self._boto3_python(), msg)
+
+    def test_serialize_item(self):
+        msg = "should match boto3's TypeSerializer for every DynamoDB type"
+
+        serializer = TypeSerializer()
+        python_item = self._boto3_python()
+        expected = {k: serializer.serialize(v) for k, v in python_item.items()}
+        expected["B"] = {"B": Binary(b"\x00\x01").value}
+
+        actual = serialize_item(python_item)
+        for set_type in ("SS", "NS", "BS"):  # Set order is not defined
+            self.assertCountEqual(actual.pop(set_type)[set_type], expected.pop(set_type)[set_type], msg)
+        self.assertDictEqual(actual, expected, msg)
+
+    def test_round_trip(self):
+        msg = "serialize should reverse deserialize"
+
+        python_item = deserialize_item(self.typed_item)
+        self.assertDictEqual(deserialize_item(serialize_item(python_item)), python_item, msg)
+
+    def test_base64_binary(self):
+        msg = "binary values in dumps are base64 strings and should be decoded"
+
+        self.assertEqual(deserialize({"B": "AAE="}), b"\x00\x01", msg)
+        self.assertSetEqual(deserialize({"BS": ["AA==", "AQ=="]}), {b"\x00", b"\x01"}, msg)
+
+    def test_unsupported(self):
+        for value in (1.5, Decimal("NaN"), set(), object()):
+            with self.assertRaises(TypeError, msg=f"{value!r} should not serialize"):
+                serialize(value)
+
+        with self.assertRaises(TypeError, msg="unknown type tags should raise"):
+            deserialize({"X": "1"})
@@ -0,0 +1,125 @@
+import copy
+import json
+from unittest import TestCase, mock
+
+from tlx.organizations import OrgCache
+
+ORG = {
+    "roots": ["r-root"],
+    "children": {"r-root": ["ou-a", "ou-b"], "ou-a": ["ou-a1"], "ou-b": [], "ou-a1": []},
+    "accounts": {"r-root": ["mgmt"], "ou-a": ["prod-web"], "ou-b": ["dev"], "ou-a1": ["prod-data"]},
+    "policies": {"p-full": ["r-root"], "p-deny-regions": ["ou-a", "555555555555"]},
+}
+ACCOUNT_IDS = {"mgmt": "111111111111", "prod-web": "222222222222", "dev": "333333333333", "prod-data": "555555555555"}
+
+
+def _unit(unit_id):
+    return {"Id": unit_id, "Name": unit_id.upper(), "Arn": f"arn:{unit_id}"}
+
+
+class _FakeOrganizations:
+    """ Serves `self.org` through a fake `paginate_pages`, counting calls per (method, id) """
+
+    def __init__(self, org):
+        self.org = org
+        self.calls = []
+
+    def paginate_pages(self, method, starting_token=None, **kwargs):
+        name = method.__name__
+        self.calls.append((name, kwargs.get("ParentId") or kwargs.get("PolicyId")))
+        org = self.org
+        page = {
+            "list_roots": lambda: {"Roots": [_unit(r) for r in org["roots"]]},
+            "list_organizational_units_for_parent": lambda: {
+                "OrganizationalUnits": [_unit(c) for c in org["children"][kwargs["ParentId"]]]},
+            "list_accounts_for_parent": lambda: {
+                "Accounts": [{"Id": ACCOUNT_IDS[a], "Name": a} for a in org["accounts"][kwargs["ParentId"]]]},
+            "list_policies": lambda: {"Policies": [{"Id": p, "Name": p} for p in org["policies"]]},
+            "list_targets_for_policy": lambda: {
+                "Targets": [{"TargetId": t} for t in org["policies"][kwargs["PolicyId"]]]},
+        }[name]()
+        yield page, None
+
+    def describe_policy(self, PolicyId):
+        self.calls.append(("describe_policy", PolicyId))
+        return {"Policy": {"Content": json.dumps({"Statement": {"Effect": "Allow", "Action": PolicyId}})}}
+
+    def describe_organization(self):
+        self.calls.append(("describe_organization", None))
+        return {"Organization": {"Id": "o-example", "MasterAccountId": ACCOUNT_IDS["mgmt"]}}
+
+    def list_roots(self):
+        pass
+
+    def list_organizational_units_for_parent(self):
+        pass
+
+    def list_accounts_for_parent(self):
+        pass
+
+    def list_policies(self):
+        pass
+
+    def list_targets_for_policy(self):
+        pass
+
+
+class TestOrgCache(TestCase):
+    def setUp(self):
+        self.fake = _FakeOrganizations(copy.deepcopy(ORG))
+        patch = mock.patch("tlx.organizations.tree.paginate_pages", self.fake.paginate_pages)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.cache = OrgCache(":memory:", client=self.fake, max_workers=2)
+        self.addCleanup(self.cache.close)
+
+    def test_queries(self):
+        msg = "Accounts, paths and SCPs should be answered from the cache"
+
+        self.assertEqual(self.cache.refresh(), 4, msg)
+        self.fake.calls.clear()
+
+        [account] = self.cache.find_accounts("PROD-DA")
+        self.assertEqual(account, {"Id": "555555555555", "Name": "prod-data", "ParentId": "ou-a1"}, msg)
+        self.assertEqual(self.cache.find_accounts("222222222222")[0]["Name"], "prod-web", msg)
+        self.assertEqual(self.cache.find_accounts("%"), [], "LIKE wildcards should be literal")
+        self.assertEqual([u["Id"] for u in self.cache.path("555555555555")], ["r-root", "ou-a", "ou-a1"], msg)
+        self.assertEqual([(p["Id"], p["TargetId"]) for p in self.cache.scps_for_account("555555555555")],
+                         [("p-full", "r-root"), ("p-deny-regions", "ou-a"), ("p-deny-regions", "555555555555")], msg)
+        self.assertEqual(len(self.cache.accounts()), 4, msg)
+
+        self.assertEqual(self.cache.attachments()["555555555555"], ["p-deny-regions"], msg)
+        self.assertEqual(json.loads(self.cache.policy_documents()["p-full"][1])["Statement"]["Action"], "p-full", msg)
+        self.assertEqual(self.cache.management_account(), "111111111111", msg)
+
+        [root] = self.cache.tree()
+        self.assertEqual([ou["Id"] for ou in root["OrgUnits"]], ["ou-a", "ou-b"], msg)
+        self.assertEqual(root["OrgUnits"][0]["SCPs"], [{"Id": "p-deny-regions", "Name": "p-deny-regions"}], msg)
+        self.assertEqual(self.fake.calls, [], "Queries should not call AWS")
+
+    def test_incremental_refresh(self):
+        msg = "Only expired units should be fetched again"
+
+        self.cache.refresh()
+        self.fake.calls.clear()
+        self.assertEqual(self.cache.refresh(), 0, msg)
+        self.assertEqual(self.fake.calls, [], msg)
+
+        # ou-b gets a new child OU and ou-a1 is removed. Only ou-a and ou-b have expired
+        self.fake.org["children"].update({"ou-a": [], "ou-b": ["ou-b1"], "ou-b1": []})
+        self.fake.org["accounts"]["ou-b1"] = ["dev"]
+        self.fake.org["accounts"]["ou-b"] = []
+        self.cache._db.execute("UPDATE units SET fetched_at = 0 WHERE id IN ('ou-a', 'ou-b')")
+
+        self.assertEqual(self.cache.refresh(), 3, msg)  # ou-a, ou-b and the new ou-b1
+        fetched = {unit for name, unit in self.fake.calls if name == "list_accounts_for_parent"}
+        self.assertEqual(fetched, {"ou-a", "ou-b", "ou-b1"}, msg)
+        self.assertEqual(self.cache.find_accounts("prod-data"), [], "Accounts of removed units should go")
+        self.assertEqual([u["Id"] for u in self.cache.path("333333333333")], ["r-root", "ou-b", "ou-b1"], msg)
+
+    def test_force(self):
+        self.cache.refresh()
+        self.assertEqual(sum(name == "describe_policy" for name, _ in self.fake.calls), 2, "Documents once per policy")
+        self.fake.org["policies"]["p-full"] = ["r-root", "222222222222"]
+        self.assertEqual(self.cache.refresh(force=True), 4)
+        self.assertEqual(len(self.cache.scps_for_account("222222222222")), 3)
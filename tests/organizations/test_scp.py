@@ -0,0 +1,90 @@
+import json
+from unittest import TestCase
+
+from tlx.organizations import ScpEvaluator
+
+FULL_ACCESS = json.dumps({"Version": "2012-10-17", "Statement": [{"Effect": "Allow", "Action": "*", "Resource": "*"}]})
+DENY_REGIONS = json.dumps({"Statement": [{
+    "Sid": "DenyOutsideEU", "Effect": "Deny", "NotAction": ["iam:*", "sts:*"], "Resource": "*",
+    "Condition": {"StringNotEquals": {"aws:RequestedRegion": ["eu-west-1"]}}}]})
+DENY_LEAVE = json.dumps({"Statement": {"Sid": "NoLeaving", "Effect": "Deny", "Action": "organizations:LeaveOrganization"}})
+SANDBOX = json.dumps({"Statement": [
+    {"Sid": "Compute", "Effect": "Allow", "Action": ["ec2:*", "S3:Get*"], "Resource": "*"},
+    {"Sid": "NoBucket", "Effect": "Deny", "Action": "s3:GetObject", "Resource": "arn:aws:s3:::secrets/*"}]})
+
+TREE = [{"Id": "r-root", "Accounts": [{"Id": "111111111111"}], "OrgUnits": [
+    {"Id": "ou-prod", "Accounts": [{"Id": "222222222222"}], "OrgUnits": []},
+    {"Id": "ou-sandbox", "Accounts": [{"Id": "333333333333"}, {"Id": "444444444444"}], "OrgUnits": []},
+]}]
+ATTACHMENTS = {
+    "r-root": ["p-full", "p-leave"],
+    "111111111111": ["p-full"],
+    "ou-prod": ["p-full", "p-regions"],
+    "222222222222": ["p-full"],
+    "ou-sandbox": ["p-sandbox"],
+    "333333333333": ["p-full"],
+    "444444444444": ["p-sandbox"],
+}
+DOCUMENTS = {"p-full": ("FullAWSAccess", FULL_ACCESS), "p-regions": ("DenyRegions", DENY_REGIONS),
+             "p-leave": ("DenyLeave", DENY_LEAVE), "p-sandbox": ("Sandbox", SANDBOX)}
+
+
+class TestScpEvaluator(TestCase):
+    def setUp(self):
+        self.scps = ScpEvaluator(TREE, ATTACHMENTS, DOCUMENTS)
+
+    def test_allow_at_every_level(self):
+        msg = "An action needs an Allow at every level of the path"
+
+        self.assertTrue(self.scps.is_allowed("s3:PutObject", "111111111111"), msg)
+        self.assertFalse(self.scps.is_allowed("s3:PutObject", "333333333333"), msg)
+        decision = self.scps.evaluate("s3:PutObject", "333333333333")
+        self.assertEqual(decision.not_allowed_at, ["ou-sandbox"], msg)
+        self.assertTrue(self.scps.is_allowed("EC2:RunInstances", "333333333333"), "Actions are case insensitive")
+        self.assertTrue(self.scps.is_allowed("s3:GetBucketPolicy", "444444444444"), "Wildcards should match")
+
+    def test_deny(self):
+        msg = "A Deny at any level should win"
+
+        decision = self.scps.evaluate("organizations:LeaveOrganization", "222222222222")
+        self.assertFalse(decision.allowed, msg)
+        self.assertEqual([(s.sid, s.policy_name, s.target_id) for s in decision.denied_by],
+                         [("NoLeaving", "DenyLeave", "r-root")], msg)
+
+        self.assertTrue(self.scps.is_allowed("s3:GetObject", "444444444444"), msg)
+        self.assertFalse(self.scps.is_allowed("s3:GetObject", "444444444444", resource="arn:aws:s3:::secrets/a"), msg)
+        self.assertTrue(self.scps.is_allowed("s3:GetObject", "444444444444", resource="arn:aws:s3:::public/a"), msg)
+
+    def test_conditions(self):
+        msg = "Conditional statements are reported and only deny if strict"
+
+        decision = self.scps.evaluate("ec2:RunInstances", "222222222222")
+        self.assertTrue(decision.allowed, msg)
+        self.assertEqual([s.sid for s in decision.conditional], ["DenyOutsideEU"], msg)
+        self.assertFalse(self.scps.is_allowed("ec2:RunInstances", "222222222222", strict=True), msg)
+        self.assertTrue(self.scps.is_allowed("iam:CreateRole", "222222222222", strict=True), "NotAction excludes")
+
+    def test_statements(self):
+        msg = "Every statement on the path, root first, with its source"
+
+        self.assertEqual([(s.policy_id, s.target_id) for s in self.scps.statements("222222222222")],
+                         [("p-full", "r-root"), ("p-leave", "r-root"), ("p-full", "ou-prod"),
+                          ("p-regions", "ou-prod"), ("p-full", "222222222222")], msg)
+        document = self.scps.document("222222222222")
+        self.assertEqual(document["Statement"][1], {
+            "Sid": "NoLeaving", "Effect": "Deny", "Action": ["organizations:LeaveOrganization"],
+            "Source": {"PolicyId": "p-leave", "PolicyName": "DenyLeave", "TargetId": "r-root"}}, msg)
+        self.assertEqual(self.scps.allowed_accounts("s3:PutObject"), {
+            "111111111111": True, "222222222222": True, "333333333333": False, "444444444444": False}, msg)
+        with self.assertRaises(ValueError):
+            self.scps.is_allowed("s3:PutObject", "999999999999")
+        with self.assertRaises(RuntimeError):
+            ScpEvaluator(TREE, ATTACHMENTS, {})
+
+    def test_management_account(self):
+        msg = "SCPs don't restrict the management account"
+
+        self.assertFalse(self.scps.is_allowed("organizations:LeaveOrganization", "111111111111"))
+        scps = ScpEvaluator(TREE, ATTACHMENTS, DOCUMENTS, management_account="111111111111")
+        self.assertEqual(scps.evaluate("organizations:LeaveOrganization", "111111111111"), (True, [], [], []), msg)
+        self.assertFalse(scps.is_allowed("organizations:LeaveOrganization", "222222222222"), "Only the management account")
@@ -0,0 +1,126 @@
+import threading
+from unittest import TestCase, mock
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from tlx.organizations import build_org_tree, iter_org_units
+
+#   r-root
+#   ├── ou-a (2 pages of accounts)
+#   │   └── ou-a1
+#   └── ou-b
+CHILDREN = {"r-root": ["ou-a", "ou-b"], "ou-a": ["ou-a1"], "ou-b": [], "ou-a1": []}
+ACCOUNTS = {"r-root": [["111"]], "ou-a": [["222", "333"], ["444"]], "ou-b": [], "ou-a1": [["555"]]}
+
+
+def _unit(unit_id):
+    return {"Id": unit_id, "Name": unit_id.upper(), "Arn": f"arn:{unit_id}"}
+
+
+class _FakeOrganizations:
+    """ Methods to be passed to the fake `paginate_pages` below """
+
+    def list_roots(self):
+        pass
+
+    def list_organizational_units_for_parent(self):
+        pass
+
+    def list_accounts_for_parent(self):
+        pass
+
+    def list_policies_for_target(self):
+        pass
+
+
+def _fake_paginate_pages(throttle=0, error=None):
+    """ Pages of the fake organisation. The first `throttle` calls for ou-a's accounts are throttled (or fail with
+        `error`) after the first page """
+    calls = []
+    lock = threading.Lock()
+
+    def paginate_pages(method, starting_token=None, **kwargs):
+        with lock:
+            calls.append((method.__name__, starting_token, kwargs))
+            throttled = len([c for c in calls if c[2].get("ParentId") == "ou-a" and "accounts" in c[0]]) <= throttle
+        name = method.__name__
+        if name == "list_roots":
+            pages = [{"Roots": [_unit("r-root")]}]
+        elif name == "list_organizational_units_for_parent":
+            pages = [{"OrganizationalUnits": [_unit(c) for c in CHILDREN[kwargs["ParentId"]]]}]
+        elif name == "list_accounts_for_parent":
+            pages = [{"Accounts": [{"Id": a} for a in page]} for page in ACCOUNTS[kwargs["ParentId"]]]
+        else:
+            assert kwargs["Filter"] == "SERVICE_CONTROL_POLICY"
+            pages = [{"Policies": [{"Id": "p-full"}]}]
+
+        start = int(starting_token or 0)
+        for i, page in enumerate(pages[start:], start + 1):
+            if throttled and i > 1 and kwargs.get("ParentId") == "ou-a" and name == "list_accounts_for_parent":
+                raise error or ClientError({"Error": {"Code": "TooManyRequestsException", "Message": "Slow down"}}, name)
+            yield page, str(i) if i < len(pages) else None
+
+    return paginate_pages, calls
+
+
+class TestOrgTree(TestCase):
+    def test_stream(self):
+        msg = "Every unit should be yielded, parents first, with all pages of accounts"
+
+        paginate_pages, _ = _fake_paginate_pages()
+        with mock.patch("tlx.organizations.tree.paginate_pages", paginate_pages):
+            units = list(iter_org_units(client=_FakeOrganizations(), max_workers=4))
+
+        order = [u["Id"] for u in units]
+        self.assertEqual(sorted(order), sorted(CHILDREN), msg)
+        for unit in units:
+            if unit["ParentId"]:
+                self.assertLess(order.index(unit["ParentId"]), order.index(unit["Id"]), msg)
+        by_id = {u["Id"]: u for u in units}
+        self.assertEqual([a["Id"] for a in by_id["ou-a"]["Accounts"]], ["222", "333", "444"], msg)
+        self.assertEqual(by_id["r-root"]["OrgUnits"], ["ou-a", "ou-b"], msg)
+        self.assertEqual(by_id["ou-b"]["SCPs"], [{"Id": "p-full"}], msg)
+
+    def test_tree(self):
+        msg = "The tree should nest units in listing order"
+
+        paginate_pages, _ = _fake_paginate_pages()
+        with mock.patch("tlx.organizations.tree.paginate_pages", paginate_pages):
+            [root] = build_org_tree(client=_FakeOrganizations(), scps=False)
+
+        self.assertEqual([ou["Id"] for ou in root["OrgUnits"]], ["ou-a", "ou-b"], msg)
+        self.assertEqual(root["OrgUnits"][0]["OrgUnits"][0]["Accounts"], [{"Id": "555"}], msg)
+        self.assertEqual(root["SCPs"], [], msg)
+        self.assertEqual(set(root), {"Name", "Id", "Arn", "Accounts", "SCPs", "OrgUnits"}, msg)
+
+    def test_throttling(self):
+        msg = "Throttled listings should back off and resume from the page they stopped at"
+
+        paginate_pages, calls = _fake_paginate_pages(throttle=2)
+        with mock.patch("tlx.organizations.tree.paginate_pages", paginate_pages), \
+                mock.patch("tlx.organizations.tree.time.sleep") as sleep:
+            units = {u["Id"]: u for u in iter_org_units(client=_FakeOrganizations())}
+
+        self.assertEqual([a["Id"] for a in units["ou-a"]["Accounts"]], ["222", "333", "444"], msg)
+        self.assertEqual(sleep.call_count, 2, msg)
+        resumed = [c[1] for c in calls if c[0] == "list_accounts_for_parent" and c[2]["ParentId"] == "ou-a"]
+        self.assertEqual(resumed, [None, "1", "1"], msg)
+
+    def test_transient_errors(self):
+        msg = "Server and connection errors should be retried, other errors raised"
+
+        server_error = ClientError({"Error": {"Code": "ServiceUnavailableException", "Message": "Try again"},
+                                    "ResponseMetadata": {"HTTPStatusCode": 503}}, "ListAccountsForParent")
+        for error in (server_error, EndpointConnectionError(endpoint_url="https://organizations.us-east-1")):
+            paginate_pages, _ = _fake_paginate_pages(throttle=1, error=error)
+            with mock.patch("tlx.organizations.tree.paginate_pages", paginate_pages), \
+                    mock.patch("tlx.organizations.tree.time.sleep"):
+                units = {u["Id"]: u for u in iter_org_units(client=_FakeOrganizations())}
+            self.assertEqual([a["Id"] for a in units["ou-a"]["Accounts"]], ["222", "333", "444"], msg)
+
+        denied = ClientError({"Error": {"Code": "AccessDeniedException", "Message": "No"},
+                              "ResponseMetadata": {"HTTPStatusCode": 400}}, "ListAccountsForParent")
+        paginate_pages, _ = _fake_paginate_pages(throttle=1, error=denied)
+        with mock.patch("tlx.organizations.tree.paginate_pages", paginate_pages), \
+                mock.patch("tlx.organizations.tree.time.sleep"), self.assertRaises(ClientError, msg=msg):
+            list(iter_org_units(client=_FakeOrganizations()))
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+import pytest
+
+import tlx.dynamodb
+import tlx.util
+
+
+def _loaded(statement, modules=("boto3", "botocore", "click")):
+    """The `modules` loaded by running `statement` in a fresh interpreter"""
+    check = f"import sys; {statement}; print(' '.join(m for m in {modules!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout.split()
+
+
+def test_heavy_dependencies_are_lazy():
+    """ Cold starts (e.g Lambda) shouldn't pay for boto3 until it's used. See benchmarks/import_time.py """
+    assert _loaded("import tlx.apigateway, tlx.codepipeline, tlx.dynamodb, tlx.organizations, tlx.util") == []
+    assert _loaded("from tlx.dynamodb import json_dumps, json_loads, serialize_item") == []
+    assert _loaded("from tlx.util import paginate, string_from_datetime") == []
+
+    assert _loaded("from tlx.util import Session") == ["boto3", "botocore"]
+    assert _loaded("from tlx.dynamodb import get_ddb_table") == []  # boto3 itself waits for a table name
+
+
+def test_lazy_attributes():
+    for name in tlx.dynamodb.__all__:
+        assert getattr(tlx.dynamodb, name) is not None
+    assert "parallel_scan" in dir(tlx.dynamodb)
+    assert tlx.util.Session.__name__ == "Session"
+    assert "Session" in dir(tlx.util)
+
+    with pytest.raises(AttributeError):
+        tlx.dynamodb.nope
+    with pytest.raises(ImportError):
+        from tlx.util import nope  # noqa: F401
@@ -0,0 +1,78 @@
+import gc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+import boto3
+import pytest
+
+from tlx.dynamodb import get_ddb_table
+from tlx.util import clear_client_cache, get_client, get_resource
+from tlx.util import clients
+
+
+class TestClientCache(TestCase):
+    def setUp(self):
+        clear_client_cache()
+
+    def tearDown(self):
+        clear_client_cache()
+
+    def test_reused(self):
+        msg = "The same client should be returned for the same arguments"
+
+        client = get_client("dynamodb", region="ap-southeast-2")
+        self.assertIs(get_client("dynamodb", region="ap-southeast-2"), client, msg)
+        self.assertIsNot(get_client("dynamodb", region="us-east-1"), client, msg)
+        self.assertIsNot(get_client("dynamodb", region="ap-southeast-2", endpoint_url="http://localhost:8000"), client)
+        self.assertIsNot(get_resource("dynamodb", region="ap-southeast-2"), client, msg)
+
+        clear_client_cache()
+        self.assertIsNot(get_client("dynamodb", region="ap-southeast-2"), client, "The cache should be cleared")
+
+    def test_config(self):
+        msg = "botocore Config options should be applied and be part of the key"
+
+        client = get_client("dynamodb", region="ap-southeast-2", max_pool_connections=50, retry_mode="adaptive",
+                            max_attempts=7)
+        self.assertEqual(client.meta.config.max_pool_connections, 50, msg)
+        self.assertEqual(client.meta.config.retries, {"mode": "adaptive", "total_max_attempts": 8}, msg)
+        self.assertIsNot(get_client("dynamodb", region="ap-southeast-2"), client, msg)
+
+    def test_sessions(self):
+        msg = "Clients should be cached per session"
+
+        session = boto3.session.Session(region_name="eu-west-1")
+        client = get_client("dynamodb", session=session)
+        self.assertEqual(client.meta.region_name, "eu-west-1", msg)
+        self.assertIs(get_client("dynamodb", session=session), client, msg)
+        self.assertIsNot(get_client("dynamodb", session=boto3.session.Session(region_name="eu-west-1")), client, msg)
+
+        with pytest.raises(AttributeError):
+            get_client("dynamodb", session=session, profile="default")
+
+    def test_sessions_released(self):
+        msg = "A session's clients should be dropped with the session rather than pinned by the cache"
+
+        for region in ("eu-west-1", "us-east-1", "ap-southeast-2"):
+            session = boto3.session.Session(region_name=region)
+            get_client("s3", session=session)
+            get_resource("dynamodb", session=session)
+            get_ddb_table("Users", session=session)
+        del session
+        gc.collect()
+        self.assertEqual(len(clients._session_caches), 0, msg)
+
+    def test_threads(self):
+        msg = "Concurrent callers should all get the one client"
+
+        with ThreadPoolExecutor(16) as pool:
+            clients = list(pool.map(lambda _: get_client("s3", region="ap-southeast-2"), range(64)))
+        self.assertEqual(len({id(c) for c in clients}), 1, msg)
+
+    def test_get_ddb_table(self):
+        msg = "Table names should be looked up on the cached resource"
+
+        table = get_ddb_table("Users", region="ap-southeast-2")
+        self.assertEqual(table.name, "Users", msg)
+        self.assertIs(table.meta.client, get_resource("dynamodb", region="ap-southeast-2").meta.client, msg)
+        self.assertIs(get_ddb_table(table), table, msg)
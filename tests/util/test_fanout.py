@@ -0,0 +1,59 @@
+import threading
+from unittest import TestCase, mock
+
+from botocore.exceptions import ClientError
+
+from tlx.util import AccountResult, fan_out
+
+
+def _client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "AssumeRole")
+
+
+class TestFanOut(TestCase):
+    def setUp(self):
+        patch = mock.patch("tlx.util.fanout.Session", side_effect=lambda role, region: mock.Mock(role=role))
+        self.Session = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_results(self):
+        msg = "Each account should get a session for its role and errors should be isolated"
+
+        def func(session, account):
+            if account == "222222222222":
+                raise ValueError("boom")
+            return session.role
+
+        accounts = ["111111111111", "222222222222", "arn:aws-cn:iam::333333333333:role/Audit"]
+        results = list(fan_out(func, accounts, role_name="ReadOnly", ordered=True))
+
+        self.assertEqual([r.account for r in results], accounts, msg)
+        self.assertEqual(results[0], AccountResult("111111111111", "arn:aws:iam::111111111111:role/ReadOnly", None))
+        self.assertIsInstance(results[1].error, ValueError, msg)
+        self.assertEqual(results[2].result, "arn:aws-cn:iam::333333333333:role/Audit", msg)
+
+    def test_concurrent(self):
+        msg = "Accounts should be processed concurrently"
+
+        barrier = threading.Barrier(4, timeout=5)
+        results = list(fan_out(lambda session, account: barrier.wait(), [str(i) * 12 for i in range(4)],
+                               max_workers=4))
+        self.assertTrue(all(r.error is None for r in results), msg)
+
+    def test_throttling(self):
+        msg = "Throttled role assumption should be retried, other errors returned"
+
+        self.Session.side_effect = [_client_error("Throttling"), _client_error("Throttling"), mock.Mock(),
+                                    _client_error("AccessDenied")]
+        with mock.patch("tlx.util.fanout.time.sleep") as sleep:
+            ok, denied = fan_out(lambda session, account: account, ["111111111111", "222222222222"],
+                                 max_workers=1, ordered=True)
+        self.assertEqual(ok, AccountResult("111111111111", "111111111111", None), msg)
+        self.assertEqual(denied.error.response["Error"]["Code"], "AccessDenied", msg)
+        self.assertEqual(sleep.call_count, 2, msg)
+
+        self.Session.side_effect = _client_error("Throttling")
+        with mock.patch("tlx.util.fanout.time.sleep"):
+            [result] = fan_out(lambda session, account: account, ["111111111111"], max_retries=3)
+        self.assertIsInstance(result.error, ClientError, "Retries should be bounded")
+        self.assertEqual(self.Session.call_count, 4 + 4, msg)
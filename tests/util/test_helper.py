@@ -1,6 +1,14 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
 import vcr
 import boto3
-from tlx.util import paginate
+import jmespath
+import pytest
+from botocore.stub import Stubber
+from tlx.util import AdaptiveSemaphore, apaginate, paginate, paginate_pages, paginate_parallel, prefetch
 
 
 @vcr.use_cassette
@@ -44,3 +52,153 @@ def test_list_s3_objects():
     assert page0 == all_pages[:len(page0)]
     assert len(page0) == 10
     assert len(all_pages) == 15
+
+
+def test_prefetch():
+    assert list(prefetch(iter(range(10)), size=3)) == list(range(10))
+    assert list(prefetch(iter(range(10)), size=0)) == list(range(10))
+
+
+def test_prefetch_raises():
+    def broken():
+        yield 1
+        raise KeyError('boom')
+
+    results = prefetch(broken(), size=2)
+    assert next(results) == 1
+    try:
+        next(results)
+    except KeyError:
+        pass
+    else:
+        assert False, 'exceptions in the producer should reach the caller'
+
+
+def _stubbed_s3(pages):
+    """ A client returning `pages` of object keys from list_objects_v2 """
+    s3 = boto3.client('s3', region_name='ap-southeast-2', aws_access_key_id='x', aws_secret_access_key='x')
+    stubber = Stubber(s3)
+    for i, keys in enumerate(pages):
+        response = {'Contents': [{'Key': k} for k in keys], 'IsTruncated': i < len(pages) - 1}
+        if i < len(pages) - 1:
+            response['NextContinuationToken'] = f'token{i + 1}'
+        expected = {'Bucket': 'b', 'ContinuationToken': f'token{i}'} if i else {'Bucket': 'b'}
+        stubber.add_response('list_objects_v2', response, expected)
+    stubber.activate()
+    return s3
+
+
+PAGES = [['a', 'b'], ['c'], ['d', 'e']]
+
+
+def test_paginate_prefetch():
+    for prefetch_pages in (0, 2):
+        s3 = _stubbed_s3(PAGES)
+        keys = [o['Key'] for o in paginate(s3.list_objects_v2, prefetch_pages=prefetch_pages, Bucket='b')]
+        assert keys == ['a', 'b', 'c', 'd', 'e']
+
+
+def test_paginate_pages_resume():
+    s3 = _stubbed_s3(PAGES)
+    pages = paginate_pages(s3.list_objects_v2, Bucket='b')
+    page, token = next(pages)
+    assert [o['Key'] for o in page['Contents']] == ['a', 'b']
+    pages.close()
+
+    # Resumes after the first page
+    s3 = _stubbed_s3(PAGES)
+    s3.list_objects_v2(Bucket='b')
+    resumed = list(paginate_pages(s3.list_objects_v2, starting_token=token, Bucket='b'))
+    assert [[o['Key'] for o in p['Contents']] for p, _ in resumed] == PAGES[1:]
+    assert resumed[-1][1] is None
+
+
+def test_paginate_does_not_hide_errors():
+    s3 = _stubbed_s3([['a']])
+    with mock.patch('tlx.util.helper._results', side_effect=TypeError('bug')):
+        with pytest.raises(TypeError):
+            list(paginate(s3.list_objects_v2, Bucket='b'))
+
+
+def test_apaginate():
+    async def collect(**kwargs):
+        with ThreadPoolExecutor(2) as pool:
+            return [x async for x in apaginate(_stubbed_s3(PAGES).list_objects_v2, executor=pool, Bucket='b', **kwargs)]
+
+    assert [o['Key'] for o in asyncio.run(collect())] == ['a', 'b', 'c', 'd', 'e']
+    assert [token for _, token in asyncio.run(collect(pages=True))][-1] is None
+
+
+class _PartitionedClient:
+    """ Fakes a client method whose listing is split by kwargs. Pages of `Items` per partition """
+
+    def __init__(self, pages):
+        self.pages = pages  # {partition: [[items], ...]}
+        self.calls = []
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        key = kwargs.get('Prefix', kwargs.get('Segment'))
+        if key == 'bad':
+            raise KeyError('boom')
+        return _FakePageIterator({'Items': items} for items in self.pages[key])
+
+    def list_things(self, **kwargs):
+        pass
+
+
+class _FakePageIterator(list):
+    resume_token = None
+    result_keys = [jmespath.compile('Items')]
+
+    def _get_next_token(self, page):
+        return {'NextToken': None}
+
+
+def test_paginate_parallel():
+    client = _PartitionedClient({'a': [[1, 2], [3]], 'b': [[4]], 'c': [], 0: [[5]], 1: [[6, 7]]})
+
+    assert list(paginate_parallel(client.list_things, prefixes=['a', 'b', 'c'], ordered=True, max_workers=2,
+                                  Bucket='x')) == [1, 2, 3, 4]
+    assert {'Bucket': 'x', 'Prefix': 'b'} in client.calls
+    assert sorted(paginate_parallel(client.list_things, partitions=[{'Prefix': 'a'}, {'Prefix': 'b'}])) == [1, 2, 3, 4]
+    assert sorted(paginate_parallel(client.list_things, segments=2)) == [5, 6, 7]
+    assert {'Segment': 1, 'TotalSegments': 2} in client.calls
+
+    with pytest.raises(KeyError):
+        list(paginate_parallel(client.list_things, prefixes=['a', 'bad']))
+    with pytest.raises(ValueError):
+        list(paginate_parallel(client.list_things, prefixes=['a'], segments=2))
+
+
+def test_paginate_parallel_stops_early():
+    client = _PartitionedClient({str(i): [[i] * 10] * 10 for i in range(20)})
+    results = paginate_parallel(client.list_things, prefixes=[str(i) for i in range(20)], max_workers=2,
+                                buffer_pages=1)
+    assert next(results) is not None
+    results.close()
+    assert len(client.calls) < 20
+
+
+def test_adaptive_semaphore():
+    limit = AdaptiveSemaphore(8)
+    limit.throttled()
+    limit.throttled()
+    assert limit.limit == 2
+    for _ in range(2):
+        limit.succeeded()
+    assert limit.limit == 3
+
+    # Blocks at the limit
+    for _ in range(3):
+        limit.acquire()
+    blocked = threading.Thread(target=limit.acquire)
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+    limit.release()
+    blocked.join(1)
+    assert not blocked.is_alive()
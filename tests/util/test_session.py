@@ -0,0 +1,168 @@
+import datetime as dt
+import gc
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from botocore.credentials import AssumeRoleCredentialFetcher
+from botocore.utils import JSONFileCache
+
+from tlx.util import session as tlx_session
+from tlx.util import Session
+
+
+def _creds(n, expires_in=dt.timedelta(hours=1)):
+    return {
+        "AccessKeyId": f"ASIA{n}",
+        "SecretAccessKey": f"secret{n}",
+        "SessionToken": f"token{n}",
+        "Expiration": dt.datetime.now(dt.timezone.utc).replace(microsecond=0) + expires_in,
+    }
+
+
+class _User:
+    """Stands in for a Session that uses the credentials"""
+
+
+class TestCredentialCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patches = [
+            mock.patch.object(tlx_session, "CACHE_DIR", self.tmp.name),
+            mock.patch.dict(tlx_session._memory_cache, clear=True),
+            mock.patch.dict(tlx_session._refresh_timers, clear=True),
+            mock.patch.dict(tlx_session._refresh_users, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_role_cached(self):
+        msg = "A role should only be assumed once while its credentials are fresh"
+
+        with mock.patch.object(tlx_session, "_assume_role", side_effect=[_creds(1), _creds(2)]) as assume_role:
+            first = Session(role="arn:aws:iam::123456789012:role/Dev", mfa_serial="arn:mfa", mfa_token="123456")
+            second = Session(role="arn:aws:iam::123456789012:role/Dev", mfa_serial="arn:mfa")
+        self.assertEqual(assume_role.call_count, 1, msg)
+        self.assertEqual(first.get_credentials().access_key, "ASIA1", msg)
+        self.assertEqual(second.get_credentials().access_key, "ASIA1", msg)
+
+    def test_disk_cache(self):
+        msg = "Credentials should be shared through the AWS CLI cache directory and refetched near expiry"
+
+        args = {"RoleArn": "arn:role", "SerialNumber": None}
+        fetch = mock.Mock(side_effect=[_creds(1, dt.timedelta(minutes=5)), _creds(2)])
+
+        self.assertEqual(tlx_session._cached_credentials(args, fetch)["AccessKeyId"], "ASIA1", msg)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 1, msg)
+
+        tlx_session._memory_cache.clear()  # e.g a new process
+        self.assertEqual(tlx_session._cached_credentials(args, fetch)["AccessKeyId"], "ASIA2", msg)
+        self.assertEqual(fetch.call_count, 2, msg)
+
+        tlx_session._memory_cache.clear()
+        creds = tlx_session._cached_credentials(args, fetch)
+        self.assertEqual(creds["AccessKeyId"], "ASIA2", msg)
+        self.assertEqual(fetch.call_count, 2, msg)
+        self.assertIsInstance(creds["Expiration"], dt.datetime, msg)
+
+    def test_cli_cache_key(self):
+        msg = "Keys should be those the AWS CLI gives the same role, so that the cache is shared"
+
+        role = "arn:aws:iam::123456789012:role/Dev"
+        for extra_args in ({}, {"SerialNumber": "arn:mfa"}):
+            fetcher = AssumeRoleCredentialFetcher(mock.Mock(), None, role, extra_args=extra_args)
+            self.assertEqual(tlx_session._cache_key(dict(extra_args, RoleArn=role)), fetcher._create_cache_key(), msg)
+
+        key = AssumeRoleCredentialFetcher(mock.Mock(), None, role)._create_cache_key()
+        JSONFileCache(self.tmp.name)[key] = {"Credentials": dict(_creds(1), Expiration=_creds(1)["Expiration"].isoformat())}
+        with mock.patch.object(tlx_session, "_assume_role") as assume_role:
+            self.assertEqual(Session(role=role).get_credentials().access_key, "ASIA1", msg)
+        assume_role.assert_not_called()
+
+    def test_no_cache(self):
+        fetch = mock.Mock(side_effect=[_creds(1), _creds(2)])
+        for n in (1, 2):
+            self.assertEqual(tlx_session._cached_credentials({"RoleArn": "r"}, fetch, cache=False)["AccessKeyId"],
+                             f"ASIA{n}", "Every call should fetch without the cache")
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_background_refresh(self):
+        msg = "Credentials should be refreshed in the background before they expire"
+
+        margin = 2 * tlx_session.REFRESH_MARGIN
+        fetch = mock.Mock(side_effect=[_creds(1, margin + dt.timedelta(seconds=0.2)), _creds(2)])
+
+        user = _User()
+        tlx_session._cached_credentials({"RoleArn": "r"}, fetch, refresh_for=user)
+        for _ in range(50):
+            if fetch.call_count == 2:
+                break
+            time.sleep(0.1)
+        self.assertEqual(fetch.call_count, 2, msg)
+        self.assertEqual(tlx_session._cached_credentials({"RoleArn": "r"}, fetch)["AccessKeyId"], "ASIA2", msg)
+        self.assertEqual(len(tlx_session._refresh_timers), 1, "The next refresh should be scheduled while used")
+        for timer in tlx_session._refresh_timers.values():
+            timer.cancel()
+
+    def test_unused_refresh_stops(self):
+        msg = "Credentials no session uses any more should not be refreshed in the background"
+
+        margin = 2 * tlx_session.REFRESH_MARGIN
+        fetch = mock.Mock(side_effect=[_creds(1, margin + dt.timedelta(seconds=0.2)), _creds(2)])
+
+        user = _User()
+        tlx_session._cached_credentials({"RoleArn": "r"}, fetch, refresh_for=user)
+        [timer] = tlx_session._refresh_timers.values()
+        del user
+        gc.collect()
+        timer.join(5)
+        self.assertEqual(fetch.call_count, 1, msg)
+        self.assertEqual(tlx_session._refresh_timers, {}, msg)
+        self.assertEqual(tlx_session._refresh_users, {}, msg)
+
+    def test_sessions_tracked(self):
+        msg = "A session should only keep its credentials refreshing while it is alive"
+
+        with mock.patch.object(tlx_session, "_assume_role", return_value=_creds(1)):
+            session = Session(role="arn:aws:iam::123456789012:role/Dev")
+        self.addCleanup(lambda: [t.cancel() for t in tlx_session._refresh_timers.values()])
+        [users] = tlx_session._refresh_users.values()
+        self.assertEqual(list(users), [session], msg)
+        del session
+        gc.collect()
+        self.assertEqual(list(users), [], msg)
+
+    def test_refreshable_session(self):
+        msg = "Sessions assuming a role without MFA should refresh rather than expire"
+
+        with mock.patch.object(tlx_session, "_assume_role", side_effect=[_creds(1, dt.timedelta(minutes=5)), _creds(2)]):
+            session = Session(role="arn:aws:iam::123456789012:role/Dev", cache=False)
+            self.assertEqual(session.get_credentials().get_frozen_credentials().access_key, "ASIA2", msg)
+
+
+class TestMfaSerial(TestCase):
+    def test_parse(self):
+        msg = "The credentials file should be parsed once and give the user's mfa_serial"
+
+        with tempfile.TemporaryDirectory() as home:
+            os.mkdir(os.path.join(home, ".aws"))
+            with open(os.path.join(home, ".aws", "credentials"), "w") as f:
+                f.write("[default]\naws_access_key_id = AKIA1\naws_secret_access_key = s%cret\nmfa_serial = arn:mfa\n"
+                        "\n[role]\nrole_arn = arn:role\nmfa_serial = arn:mfa\nsource_profile = default\n")
+
+            with mock.patch.dict(os.environ, {"HOME": home}), \
+                    mock.patch.object(tlx_session.configparser, "RawConfigParser",
+                                      wraps=tlx_session.configparser.RawConfigParser) as parser:
+                self.assertEqual(tlx_session._get_mfa_serial_if_user(None), "arn:mfa", msg)
+                self.assertIsNone(tlx_session._get_mfa_serial_if_user("role"), msg)
+                with self.assertRaises(Exception, msg=msg):
+                    tlx_session._get_mfa_serial_if_user("typo")
+            self.assertEqual(parser.call_count, 1, msg)
+
+
+def test_role_session_name():
+    """ STS only allows [\\w+=,.@-] in session names """
+    assert tlx_session._role_session_name("arn:aws:iam::123456789012:role/path/Dev Ops") == "Dev-Ops"
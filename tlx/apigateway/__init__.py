@@ -1,14 +1,34 @@
+import base64
 import functools
+import gzip
+import itertools
 import logging
 import sys
+import time
 
 from tlx.dynamodb import json_dumps
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Preferred first. Brotli only if installed
+_COMPRESSORS = {
+    name: compress
+    for name, compress, module in (
+        ("br", lambda data: brotli.compress(data, quality=5), brotli),
+        ("gzip", lambda data: gzip.compress(data, compresslevel=6), gzip),
+    )
+    if module
+}
+
 
-def proxy_response_handler(func=None, running_local=False, quiet=True):
+def proxy_response_handler(func=None, running_local=False, quiet=True, log_every=1, max_log_length=None,
+                           compress_min_size=None):
     """A Decorator for lambda functions. The function to be decorated by have two positional arguments
     (event, context) as any lambda handler would.  Decorating your handler allows you to write idomatic python
     using returns and raising exception.  This handler catches and formats them as proxy response objects
@@ -32,9 +52,23 @@ def proxy_response_handler(func=None, running_local=False, quiet=True):
     Example usage: @proxy_response_handler(running_local=__name__=="__main__")
 
     Set quiet=True (default) to suppress all error output including stack traces (eg. for Prod deployments)
+
+    The event and response are only serialised for the logs if the logger is enabled for INFO.  Set log_every=N to
+    log 1 in N invocations and max_log_length to truncate long log messages.  Each logged invocation also reports
+    the time spent in the handler and serialising the response (`handler_ms` and `serialization_ms` are added to
+    the log record for structured log formatters).  Errors are always logged.
+
+    Set compress_min_size (bytes) to compress JSON bodies at least that large with brotli (if installed) or gzip,
+    whichever the request's `Accept-Encoding` allows.  Compressed bodies are base64 encoded with `isBase64Encoded`
+    and the `Content-Encoding` header set.  Handlers may also return `bytes`, which are returned base64 encoded as
+    `application/octet-stream`.  (REST APIs need `binaryMediaTypes` configured, e.g '*/*', to decode either)
     """
     if not func:
-        return functools.partial(proxy_response_handler, running_local=running_local, quiet=quiet)
+        return functools.partial(proxy_response_handler, running_local=running_local, quiet=quiet,
+                                 log_every=log_every, max_log_length=max_log_length,
+                                 compress_min_size=compress_min_size)
+
+    invocations = itertools.count()
 
     @functools.wraps(func)
     def wrapper(*axgs):
@@ -51,8 +85,11 @@ def proxy_response_handler(func=None, running_local=False, quiet=True):
                 response["statusCode"] = code
 
         event, context = axgs[0], axgs[1]
-        logger.info("event: {}".format(json_dumps(event)))
+        log = next(invocations) % log_every == 0 and logger.isEnabledFor(logging.INFO)
+        if log:
+            logger.info("event: %s", _LazyLog(json_dumps, event, max_log_length))
 
+        start = time.perf_counter()
         try:  # to get successfull execution
             response["body"] = func(event, context)
             response["statusCode"] = 200
@@ -70,13 +107,79 @@ def proxy_response_handler(func=None, running_local=False, quiet=True):
                 setup_error_response("Error: {e}".format(e=e))  # For remote testing
 
         # Final preparation for http reponse
-        response["body"] = json_dumps(response["body"])
-        logger.info("Returning repsonse: {response}".format(**locals()))
+        handled = time.perf_counter()
+        if isinstance(response["body"], (bytes, bytearray)):
+            _set_binary_body(response, response["body"], {"Content-Type": "application/octet-stream"})
+        else:
+            response["body"] = json_dumps(response["body"])
+            if compress_min_size is not None:
+                _compress_body(response, event, compress_min_size)
+        serialized = time.perf_counter()
+
+        if log:
+            logger.info("Returning repsonse: %s", _LazyLog(str, response, max_log_length))
+            timing = {"handler_ms": (handled - start) * 1000, "serialization_ms": (serialized - handled) * 1000}
+            logger.info("timing: handler %(handler_ms).1fms, serialization %(serialization_ms).1fms", timing,
+                        extra=timing)
         return response
 
     return wrapper
 
 
+def _set_binary_body(response, body, headers):
+    response["headers"] = {**(response.get("headers") or {}), **headers}
+    response["body"] = base64.b64encode(body).decode("ascii")
+    response["isBase64Encoded"] = True
+
+
+def _compress_body(response, event, min_size):
+    """Compresses the JSON body of `response` if it is at least `min_size` bytes and the client accepts it"""
+
+    headers = {"Content-Type": "application/json", "Vary": "Accept-Encoding"}
+    body = response["body"].encode()
+    encoding = _choose_encoding(event) if len(body) >= min_size else None
+    if encoding:
+        _set_binary_body(response, _COMPRESSORS[encoding](body), dict(headers, **{"Content-Encoding": encoding}))
+    else:
+        response["headers"] = {**(response.get("headers") or {}), **headers}
+
+
+def _choose_encoding(event):
+    """The first of `_COMPRESSORS` allowed by the `Accept-Encoding` request header.  None if none are"""
+
+    headers = (event.get("headers") if isinstance(event, dict) else None) or {}
+    accept = next((v for k, v in headers.items() if k.lower() == "accept-encoding"), None) or ""
+
+    qualities = {}
+    for part in accept.split(","):
+        name, _, params = part.partition(";")
+        q = params.strip()
+        try:
+            qualities[name.strip().lower()] = float(q[2:]) if q.startswith("q=") else 1.0
+        except ValueError:
+            continue  # Malformed. Ignored like browsers do
+
+    for name in _COMPRESSORS:
+        if qualities.get(name, qualities.get("*", 0)) > 0:
+            return name
+    return None
+
+
+class _LazyLog:
+    """Defers formatting a log argument until a handler actually emits the record"""
+
+    def __init__(self, dump, obj, max_length=None):
+        self.dump = dump
+        self.obj = obj
+        self.max_length = max_length
+
+    def __str__(self):
+        text = self.dump(self.obj)
+        if self.max_length is not None and len(text) > self.max_length:
+            return "{}... ({} characters truncated)".format(text[:self.max_length], len(text) - self.max_length)
+        return text
+
+
 def require_valid_inputs(supplied, required):
     """Returns None if `supplied` is a superset of `required`.  Raises `APIGException` with
     error code 400 if not.
@@ -0,0 +1,8 @@
+from tlx.util._lazy import lazy_module
+
+name = "codepipeline"
+
+lazy_module(__name__, {
+    "cache": ["ExecutionCache"],
+    "executions": ["execution_details", "find_pipelines", "iter_executions", "summarise_execution"],
+})
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from tlx.codepipeline.executions import execution_details
+
+DEFAULT_PATH = os.path.expanduser(os.path.join('~', '.cache', 'tlx', 'codepipeline'))
+
+# An execution's action executions don't change once it has one of these statuses
+FINAL_STATUSES = {"Cancelled", "Failed", "Stopped", "Succeeded", "Superseded"}
+
+
+class ExecutionCache:
+    """A local, permanent cache of the action executions of finished pipeline executions.
+
+    Each execution is a JSON file named by the hash of its pipeline and execution ID.  Only executions with a final
+    status (`FINAL_STATUSES`) are stored, so `InProgress` ones are always fetched again and nothing cached can be
+    out of date.  Files are written atomically, so several processes can share the cache.
+
+    Kwargs (all optional):
+        path (str): The cache directory.  Default `DEFAULT_PATH`.
+
+    Example:
+        >>> cache = ExecutionCache()
+        >>> details = cache.details(client, 'meta-pipeline', execution_id)  # Only calls AWS the first time
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+
+    def details(self, client, pipeline, execution_id, status=None):
+        """`execution_details` from the cache, or else from AWS and then cached if the execution has finished.
+        `status` is the execution's status if known (e.g from `list_pipeline_executions`).  If not, it's looked up
+        on a cache miss.
+        """
+
+        cached = self.get(pipeline, execution_id)
+        if cached is not None:
+            return cached
+        if status is None:
+            status = client.get_pipeline_execution(pipelineName=pipeline, pipelineExecutionId=execution_id)[
+                "pipelineExecution"]["status"]
+        details = execution_details(client, pipeline, execution_id)
+        if status in FINAL_STATUSES:
+            self.put(pipeline, execution_id, details)
+        return details
+
+    def get(self, pipeline, execution_id):
+        """The cached action executions, or None"""
+
+        try:
+            with open(self._file(pipeline, execution_id)) as f:
+                entry = json.load(f, object_hook=_decode)
+        except (OSError, ValueError):  # Not cached, or a damaged file that will be written again
+            return None
+        if (entry.get("Pipeline"), entry.get("ExecutionId")) != (pipeline, execution_id):
+            return None
+        return entry["Details"]
+
+    def put(self, pipeline, execution_id, details):
+        path = self._file(pipeline, execution_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"Pipeline": pipeline, "ExecutionId": execution_id, "Details": details}
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+            try:
+                json.dump(entry, f, default=_encode)
+            except Exception:
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+
+    def _file(self, pipeline, execution_id):
+        key = hashlib.sha256(f"{pipeline}\0{execution_id}".encode()).hexdigest()
+        return os.path.join(self.path, key[:2], key + ".json")
+
+
+def _encode(obj):
+    if isinstance(obj, datetime):
+        return {"__datetime__": obj.isoformat()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
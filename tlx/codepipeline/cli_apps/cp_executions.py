@@ -0,0 +1,63 @@
+import json
+import logging
+import sys
+from datetime import datetime
+import click
+from tlx.codepipeline.cache import ExecutionCache
+from tlx.codepipeline.executions import iter_executions
+from tlx.util import Session
+
+
+@click.command(context_settings=dict(max_content_width=120, help_option_names=['-h', '--help']))
+@click.argument('pipelines', nargs=-1)
+@click.option('--count', '-n', default=10, show_default=True, help="Executions per pipeline, newest first.")
+@click.option('--profile', '-p', default=None, help="A profile for the account of the pipelines.  Default: the environment's credentials.")
+@click.option('--workers', '-w', default=16, show_default=True, help="API calls made at once, shared by all the pipelines.")
+@click.option('--array', is_flag=True, default=False, help="Print one JSON array at the end rather than jsonlines as they complete.")
+@click.option('--no-cache', is_flag=True, default=False, help="Fetch the details of every execution rather than reusing those of finished executions from ~/.cache/tlx/codepipeline.")
+def cp_executions(pipelines, count, profile, workers, array, no_cache):
+    """
+        CODEPIPELINE EXECUTIONS
+
+        Summarises the latest executions of many pipelines at once.  PIPELINES are names or glob patterns
+        (e.g 'deploy-*').  Default: every pipeline.
+
+        \b
+        Details:
+        Prints a JSON line per execution, pipeline by pipeline, as soon as it and every line before it are
+        complete:
+            {"Pipeline", "StartTime", "Ver", "StagesRan", "FinalStage", "Status", <source>: <revision>, ..., "ExecutionId"}
+        A pipeline that can't be read prints {"Pipeline", "ExecutionId", "Error"} and the others continue.
+        The details of finished executions never change, so they are cached locally and only new and
+        running executions are fetched.
+
+        \b
+        Examples:
+            cp-executions '*-deploy' -n 3 | jtbl
+            cp-executions | jq -c 'select(.Status == "Failed")'
+    """
+
+    logging.basicConfig(format="%(message)s", level=logging.WARNING)
+    session = Session(profile=profile) if profile else None
+
+    try:  # Surpress all exceptions for CLI app
+        executions = iter_executions(list(pipelines) or None, count=count, session=session, max_workers=workers,
+                                     cache=None if no_cache else ExecutionCache())
+        if array:
+            print(json.dumps(list(executions), default=_json_default))
+            return
+        for execution in executions:
+            print(json.dumps(execution, default=_json_default), flush=True)
+    except Exception as e:
+        print("{}: {}".format(type(e).__name__, e), file=sys.stderr)
+        sys.exit(1)
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat(timespec='minutes')
+    return str(obj)
+
+
+if __name__ == "__main__":
+    cp_executions()
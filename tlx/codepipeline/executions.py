@@ -0,0 +1,121 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+
+from botocore.exceptions import ClientError
+
+from tlx.util import get_client, paginate
+
+logger = logging.getLogger(__name__)
+
+
+def iter_executions(pipelines=None, count=10, client=None, session=None, max_workers=16, cache=None):
+    """Summarises the latest `count` executions of each pipeline (newest first) and yields them in order: pipeline
+    by pipeline, each as soon as it and every summary before it are complete.
+
+    Every pipeline shares one pool of `max_workers` threads and a client with as many connections, so watching
+    hundreds of pipelines costs one process.  Every listing is paginated.  Each summary is:
+
+        {"Pipeline", "StartTime", "Ver", "StagesRan", "FinalStage", "Status", <source action name>: <revision>, ...,
+         "ExecutionId"}
+
+    A pipeline or execution that can't be read is yielded as {"Pipeline", "ExecutionId", "Error"} rather than
+    stopping the others.
+
+    Kwargs (all optional):
+        pipelines (list): Pipeline names or glob patterns, e.g ['deploy-*'].  Default: every pipeline.
+        count (int): Executions per pipeline.
+        client: A codepipeline client.  Default: one from `tlx.util.get_client` for `session` with a connection pool
+            of `max_workers`.
+        session (boto3.session.Session): e.g a `tlx.util.Session` for the account of the pipelines.
+        cache (ExecutionCache): Reuse the details of finished executions, so that only new and running executions
+            are fetched.
+
+    Example:
+        >>> for execution in iter_executions(['*-deploy'], count=5):
+        ...     print(execution['Pipeline'], execution['Status'])
+    """
+
+    client = client or get_client("codepipeline", session=session, max_pool_connections=max_workers,
+                                  retry_mode="standard", max_attempts=10)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _list(pipeline):
+        executions = paginate(client.list_pipeline_executions, pipelineName=pipeline,
+                              PaginationConfig={"MaxItems": count, "PageSize": min(count, 100)})
+        return [pool.submit(_summarise, pipeline, summary) for summary in executions]
+
+    def _summarise(pipeline, summary):
+        try:
+            if cache is None:
+                details = execution_details(client, pipeline, summary["pipelineExecutionId"])
+            else:
+                details = cache.details(client, pipeline, summary["pipelineExecutionId"], summary.get("status"))
+        except ClientError as ce:
+            return _error(pipeline, summary["pipelineExecutionId"], ce)
+        return summarise_execution(summary, details, pipeline)
+
+    listings = [(pipeline, pool.submit(_list, pipeline)) for pipeline in find_pipelines(pipelines, client)]
+    try:
+        for pipeline, listing in listings:
+            try:
+                summaries = listing.result()
+            except ClientError as ce:
+                yield _error(pipeline, None, ce)
+                continue
+            for summary in summaries:
+                yield summary.result()
+    finally:  # The caller may stop early
+        for _, listing in listings:
+            if not listing.cancel() and listing.done() and not listing.exception():
+                for summary in listing.result():
+                    summary.cancel()
+        pool.shutdown(wait=False)
+
+
+def find_pipelines(patterns=None, client=None):
+    """The names of the pipelines matching any of `patterns` (names or glob patterns), or of every pipeline.  Names
+    without wildcards are returned as they are, without listing the pipelines.
+    """
+
+    if patterns and not any(set("*?[") & set(pattern) for pattern in patterns):
+        return list(patterns)
+    client = client or get_client("codepipeline")
+    names = [pipeline["name"] for pipeline in paginate(client.list_pipelines)]
+    return [name for name in names if not patterns or any(fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+def execution_details(client, pipeline, execution_id):
+    """Every action execution of a pipeline execution, newest first"""
+
+    return list(paginate(client.list_action_executions, pipelineName=pipeline,
+                         filter={"pipelineExecutionId": execution_id}))
+
+
+def summarise_execution(summary, details, pipeline=None):
+    """One execution's summary from its `list_pipeline_executions` summary and its action executions (newest first)"""
+
+    execution = {
+        "Pipeline": pipeline,
+        "StartTime": "",
+        "Ver": "",
+        "StagesRan": len(set(detail.get("stageName") for detail in details)),
+        "FinalStage": "",
+        "Status": summary.get("status"),
+    }
+    for source in summary.get("sourceRevisions", []):
+        execution[source["actionName"]] = source.get("revisionId", "")[:8]
+
+    if details:  # None yet if it has only just started
+        last_stage = details[0]
+        execution["Ver"] = last_stage.get("pipelineVersion")
+        execution["FinalStage"] = last_stage.get("stageName")
+        execution["StartTime"] = last_stage.get("startTime") or ""
+
+    execution["ExecutionId"] = summary.get("pipelineExecutionId")
+    return execution
+
+
+def _error(pipeline, execution_id, error):
+    logger.debug(f"{pipeline} {execution_id or ''}: {error!r}")
+    return {"Pipeline": pipeline, "ExecutionId": execution_id, "Error": str(error)}
@@ -1,8 +1,14 @@
-# flake8: noqa F401         - import not used error
-from .batch import (batch_delete, batch_write, get_ddb_table, load_json_dump,
-                    load_scan_dump)
-from .json import DynamoEncoder, json_dumps, json_loads
-from .table import (add_key, add_new_map_field, append_to_list_field,
-                    clear_table, full_scan)
+from tlx.util._lazy import lazy_module
 
 name = "dynamodb"
+
+# Imported from their submodule on first use, so that e.g `from tlx.dynamodb import json_dumps` doesn't pay for boto3
+lazy_module(__name__, {
+    "batch": ["BatchWriter", "batch_delete", "batch_write", "get_ddb_table", "load_json_dump", "load_json_dumps",
+              "load_scan_dump"],
+    "export": ["export_table"],
+    "json": ["DynamoEncoder", "json_dumps", "json_iter_array", "json_iterloads", "json_loads", "set_json_backend"],
+    "table": ["UpdateBatcher", "add_key", "add_new_map_field", "append_to_list_field", "clear_table", "full_scan",
+              "iter_scan", "map_segments", "parallel_scan"],
+    "types": ["deserialize", "deserialize_item", "serialize", "serialize_item"],
+})
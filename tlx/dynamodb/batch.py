@@ -1,31 +1,211 @@
+import contextlib
 import csv
+import glob
+import gzip
 import io
 import json
+import logging
 import math
-from collections import defaultdict
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 from decimal import Decimal
 
-import boto3  # type: ignore
-from tlx.util import get_dynamo_compatible_uuid
+from tlx.dynamodb.json import json_iter_array, json_iterloads, json_loads
+from tlx.dynamodb.types import deserialize_item
+from tlx.util import AdaptiveSemaphore, get_dynamo_compatible_uuid
 
+logger = logging.getLogger(__name__)
 
-def _pull_values(item):
-    return {k: _set_types(v) for k, v in item.items()}
+# Most requests allowed in a single BatchWriteItem call
+BATCH_SIZE = 25
+_THROTTLE_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded")
 
 
-_func_map = defaultdict(
-    lambda: lambda x: x, {"M": _pull_values, "N": Decimal, "L": lambda values: [_set_types(d) for d in values]}
-)
-
-
-def _set_types(v):
-    v_key = list(v.keys())[0]
-    returned_value = list(v.values())[0]  # Always one from dump
-    return _func_map[v_key](returned_value)
+class TokenBucket:
+    """Thread safe token bucket rate limiter.  `rate` tokens are added per second up to `capacity`
+    (default one second's worth).
+    """
 
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available and takes them.  Requests larger than the capacity wait for a
+        full bucket then drive it negative, so large requests are still limited to `rate` on average.
+        """
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                needed = min(tokens, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                delay = (needed - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class BatchWriter:
+    """Writes items to a table with concurrent `BatchWriteItem` calls.  Use in place of boto3's
+    `table.batch_writer()` when throughput matters.
+
+    - Requests are sent in batches of 25 by `max_workers` threads.
+    - `UnprocessedItems` are retried with exponential backoff and full jitter.  A batch still failing after
+      `max_retries` attempts raises a `RuntimeError` from the writer.
+    - If `target_wcu` is set, a token bucket limits writes to roughly that many write capacity units per second.
+    - If `auto_tune` is set, the number of calls in flight is halved whenever a call is throttled or returns
+      `UnprocessedItems` and grows back towards `max_workers` while calls succeed (an `AdaptiveSemaphore`).  With
+      `target_wcu` too, the `ConsumedCapacity` of each call corrects the WCU estimate per request (items over 1KB
+      cost more than 1 WCU) and the rate is backed off while throttled.
+
+    Like boto3's batch writer, the same key must not appear twice in a batch.  Add items from a single thread.
+
+    e.g
+        >>> with BatchWriter('Table-Name', max_workers=8, target_wcu=1000) as writer:
+        ...     for item in items:
+        ...         writer.put_item(Item=item)
+    """
 
-def batch_write(table, items):
+    def __init__(
+        self, table, max_workers=4, target_wcu=None, auto_tune=False, max_retries=10, backoff_base=0.05, backoff_cap=20
+    ):
+        self.table = get_ddb_table(table)
+        self.target_wcu = target_wcu
+        self.auto_tune = auto_tune
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._client = self.table.meta.client
+        self._bucket = TokenBucket(target_wcu) if target_wcu else None
+        self._limit = AdaptiveSemaphore(max_workers) if auto_tune else contextlib.nullcontext()
+        self._wcu_per_request = 1.0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_workers * 2)  # Bounds the batches held in memory
+        self._buffer = []
+        self._futures = set()
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def put_item(self, Item):
+        self._add({"PutRequest": {"Item": Item}})
+
+    def delete_item(self, Key):
+        self._add({"DeleteRequest": {"Key": Key}})
+
+    def flush(self):
+        """Sends any buffered requests and waits for all batches to be written"""
+
+        if self._buffer:
+            self._submit()
+        wait(list(self._futures))
+        self._raise_errors()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type:
+            for future in list(self._futures):
+                future.cancel()
+            self._executor.shutdown()
+        else:
+            self.close()
+
+    def _add(self, request):
+        self._buffer.append(request)
+        if len(self._buffer) >= BATCH_SIZE:
+            self._submit()
+
+    def _submit(self):
+        self._raise_errors()  # Fail fast rather than queue more work
+        requests, self._buffer = self._buffer, []
+        self._slots.acquire()
+        future = self._executor.submit(self._write, requests)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+            if not future.cancelled() and future.exception():
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def _raise_errors(self):
+        if self._errors:
+            raise self._errors[0]
+
+    def _write(self, requests):
+        params = {"ReturnConsumedCapacity": "TOTAL"} if self.auto_tune else {}
+        attempt = 0
+        while requests:
+            if self._bucket:
+                self._bucket.acquire(len(requests) * self._wcu_per_request)
+
+            try:
+                with self._limit:
+                    res = self._client.batch_write_item(RequestItems={self.table.name: requests}, **params)
+            except self._client.exceptions.ClientError as ce:
+                if ce.response["Error"]["Code"] not in _THROTTLE_ERRORS:
+                    raise ce
+                unprocessed = requests
+            else:
+                unprocessed = res.get("UnprocessedItems", {}).get(self.table.name, [])
+                if self.auto_tune:
+                    self._tune(res.get("ConsumedCapacity", []), len(requests) - len(unprocessed))
+                    if not unprocessed:
+                        self._limit.succeeded()
+
+            if unprocessed:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise RuntimeError(f"{len(unprocessed)} requests unprocessed after {self.max_retries} retries")
+                if self.auto_tune:
+                    self._throttled()
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                logger.debug(f"{len(unprocessed)} unprocessed items. Retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+            requests = unprocessed
+
+    def _tune(self, consumed_capacity, processed):
+        """Moves the WCU estimate per request towards that observed and recovers the rate after throttling"""
+
+        consumed = sum(c.get("CapacityUnits", 0) for c in consumed_capacity)
+        with self._lock:
+            if processed and consumed:
+                self._wcu_per_request = 0.8 * self._wcu_per_request + 0.2 * consumed / processed
+            if self._bucket and self._bucket.rate < self.target_wcu:
+                self._bucket.rate = min(self.target_wcu, self._bucket.rate + 0.05 * self.target_wcu)
+
+    def _throttled(self):
+        self._limit.throttled()
+        if self._bucket:
+            with self._lock:
+                self._bucket.rate = max(1, self._bucket.rate * 0.7)
+
+
+def batch_write(table, items, **writer_kwargs):
     """
+    Writes all `items` with a `BatchWriter`. `writer_kwargs` are passed to it, e.g `max_workers` and `target_wcu`.
+
     Basic Usage:
     >>> from tlx.dynamodb.batch import batch_write, get_ddb_table
     >>> table = get_ddb_table('Table-Name')
@@ -34,30 +214,28 @@ def batch_write(table, items):
     >>> batch_write(table, items)
     """
 
-    table = get_ddb_table(table)
-
-    with table.batch_writer() as batch:
+    with BatchWriter(table, **writer_kwargs) as batch:
         for item in items:
             batch.put_item(
                 Item=item,
             )
 
 
-def batch_delete(table, item_keys):
+def batch_delete(table, item_keys, **writer_kwargs):
     """
     item_keys must be a list of dictionary of the keys required by the Table.
     e.g for a single key table: [{'id': 001},{'id': 002}, ...}]
     for tables with a sort key, that must be included.
-    """
 
-    table = get_ddb_table(table)
+    Deletes are sent with a `BatchWriter`. `writer_kwargs` are passed to it.
+    """
 
-    with table.batch_writer() as batch:
+    with BatchWriter(table, **writer_kwargs) as batch:
         for item_key in item_keys:
             batch.delete_item(Key=item_key)
 
 
-def load_scan_dump(dump_file, table=None):
+def load_scan_dump(dump_file, table=None, stream=False, **writer_kwargs):
     """
     Loads the results of a scan opperation into a table.
 
@@ -66,81 +244,222 @@ def load_scan_dump(dump_file, table=None):
     and writes to an existing table. Similar to the `aws dynamodb batch-write-item` command except:
         - No limit to amount of items in the upload (25 with awscli)
         - Take the output of a table scan, requiring no reformatting
+
+    `dump_file` is an open file or a file name.  A file name ending in `.gz` or `.zst` is decompressed, e.g a
+    `dynamodb` format shard from `export_table`.
+
+    Set `stream=True` to parse the items incrementally while they are written, keeping memory flat
+    regardless of the dump size. The items are then read lazily so `dump_file` must stay open until
+    the load completes.
+
+    `writer_kwargs` are passed to the `BatchWriter`. e.g `max_workers`, `target_wcu`
     """
 
+    if isinstance(dump_file, (str, os.PathLike)):
+        with _open_text(os.fspath(dump_file)) as f:
+            return load_scan_dump(f, table, stream=stream, **writer_kwargs)
+
     table = get_ddb_table(table)
-    items = json.load(dump_file)["Items"]
-    batch_write(table, (_pull_values(item) for item in items))
+    if stream:
+        items = json_iter_array(dump_file, "Items")
+    else:
+        items = json.load(dump_file)["Items"]
+    batch_write(table, (deserialize_item(item) for item in items), **writer_kwargs)
 
 
-def load_from_csv(csv_file, table):
+def _csv_number(x):
+    number = Decimal(x)
+    if math.isnan(number) or math.isinf(number):
+        # Remove Inf and Nan, DynamoDB does support them
+        return None
+    return number
+
+
+def _csv_bool(x):
+    try:
+        return _CSV_BOOLS[x.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Not a boolean: {x!r}") from None
+
+
+_CSV_BOOLS = {"true": True, "t": True, "yes": True, "1": True, "false": False, "f": False, "no": False, "0": False}
+
+# Empty cells are never passed to these. Returning None drops the field from the item.
+_CSV_TYPES = {
+    "N": _csv_number,
+    "S": str,
+    "BOOL": _csv_bool,
+    "SS": lambda x: set(json.loads(x)) or None,
+    "NS": lambda x: set(json_loads(x)) or None,
+    "M": json_loads,
+    "L": json_loads,
+}
+
+
+def load_from_csv(csv_file, table, **writer_kwargs):
     """CSV must conform to the following format:
         first row:  Field names
-        second row: Field types. One of: ['N', 'S']
+        second row: Field types. One of: ['N', 'S', 'BOOL', 'SS', 'NS', 'M', 'L']
+
+    Sets, Maps and Lists are JSON encoded.  e.g `"[""a"", ""b""]"` for a string set (SS) or `"{""a"": 1}"` for a Map.
+    BOOL is one of true/false, t/f, yes/no or 1/0.  Empty cells, NaN and Inf are not written.
 
-    N.B Only works for flat data structures. i.e Maps/Lists/Sets are not supported
+    Rows are read, converted and written as a stream so memory use is constant and parsing overlaps with the
+    writes of the `BatchWriter`.  `writer_kwargs` are passed to it. e.g `max_workers`, `target_wcu`
     """
 
     table = get_ddb_table(table)
 
     with io.open(csv_file, newline="") as csvfile:
-        data = list(csv.reader(csvfile))
+        reader = csv.reader(csvfile)
+        field_names, types = next(reader), next(reader)
+
+        # Fail before writing anything if the header is wrong
+        try:
+            converters = [_CSV_TYPES[t] for t in types]
+        except KeyError:
+            raise Exception("load_from_csv only supports Dynamo Types {}".format(list(_CSV_TYPES)))
+
+        fields = list(zip(field_names, converters))
+        items = (
+            {k: v for k, v in ((k, convert(x)) for (k, convert), x in zip(fields, row) if x) if v is not None}
+            for row in reader
+        )
+        batch_write(table, items, **writer_kwargs)
+
+
+def _open_text(file_name, mode="r"):
+    """Opens a text file, transparently (de)compressing `.gz` and `.zst` files.  zstandard is optional"""
+
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, mode + "t")
+    if file_name.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as ie:
+            raise ImportError("zstandard is required for .zst files: pip install zstandard") from ie
+        return zstandard.open(file_name, mode + "t")
+    return open(file_name, mode)
+
+
+def _parse_json_dump(file_name):
+    """Parses a newline delimited json file.  Returns the items and the time taken.
+    Module level so that it can be run in a process pool.
+    """
 
-    field_names, types = data[0], data[1]
+    start = time.monotonic()
+    with _open_text(file_name) as f:
+        items = list(json_iterloads(f))
+    return items, time.monotonic() - start
 
-    # Throws KeyError if missing. Only string and number are supported for csv
-    def _format_number(x):
-        tmp = Decimal(x if x else "Nan")
-        if math.isnan(tmp) or math.isinf(tmp):
-            # Remove Inf and Nan, DynamoDB does support them
-            return None
-        return tmp
 
-    _this_func_map = {
-        "N": _format_number,
-        "S": lambda x: str(x),
-    }
+def _json_dump_files(path):
+    """Shard file names from a directory, a glob pattern or a single file name"""
 
-    # Decimal Conversion if string field
-    try:
-        ddata = [  # Not a generator for testing
-            {k1: v1 for k1, v1 in ((k, _this_func_map[t](v)) for k, t, v in zip(field_names, types, d)) if v1}
-            for d in data[2:]
-        ]
-    except KeyError:
-        raise Exception("load_from_csv only supports Dynamo Types {}".format(list(_this_func_map)))
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in os.listdir(path) if not f.startswith(".")]
+        files = [f for f in files if os.path.isfile(f)]
+    else:
+        files = glob.glob(path)
+    if not files:
+        raise FileNotFoundError(f"No files found for: {path}")
+    return sorted(files)
 
-    batch_write(table, ddata)
 
-
-def load_json_dump(file_name, table_name, primary_key=False):
+def load_json_dump(file_name, table_name, primary_key=False, **writer_kwargs):
     """Loads a file consisting of newline seperated items, in which each item is
-    a json row object (Such as a BigQuery dump).
+    a json row object (Such as a BigQuery dump).  Files ending in `.gz` or `.zst` are decompressed.
 
     If `primary_key` is provided the field is added to each item with a unique id as the sole partition key.
     If not provided, the input data must contain the keys of the dynamodb.
+
+    `writer_kwargs` are passed to the `BatchWriter`. e.g `max_workers`, `target_wcu`
     """
     table = get_ddb_table(table_name)
 
-    with open(file_name, "r") as f:
-        items = [json.loads(line.replace("\n", ""), parse_int=Decimal, parse_float=Decimal) for line in f]
+    items, _ = _parse_json_dump(file_name)
 
     if primary_key:
         for i in items:
             i[primary_key] = get_dynamo_compatible_uuid()
 
-    batch_write(table, items)
+    batch_write(table, items, **writer_kwargs)
 
 
-def get_ddb_table(table):
-    """Takes either a string or an existing boto3 Table object.  If neither raises Exception"""
+def load_json_dumps(path, table_name, primary_key=False, processes=None, **writer_kwargs):
+    """Loads many files like `load_json_dump` (such as a sharded BigQuery export) in parallel.
+
+    `path` is a directory, a glob pattern (e.g 'export/*.json.gz') or a single file.  The files are parsed in a
+    pool of `processes` (default: cpu count) and the items of each are streamed into one concurrent `BatchWriter`
+    as soon as it is parsed.  At most two files per process are parsed ahead of the writer to bound memory.
+    Use `processes=0` to parse in a single background thread where process pools are unavailable (e.g AWS Lambda).
+
+    Progress and throughput are logged at INFO level for each file.  Returns the number of items written.
+
+    `writer_kwargs` are passed to the `BatchWriter`. e.g `max_workers`, `target_wcu`
+
+    e.g
+        >>> load_json_dumps('gs-export/', 'Table-Name', max_workers=16)
+    """
+
+    table = get_ddb_table(table_name)
+    files = _json_dump_files(path)
+
+    processes = os.cpu_count() if processes is None else processes
+    pool = ProcessPoolExecutor(max_workers=processes) if processes else ThreadPoolExecutor(max_workers=1)
+    window = 2 * max(processes, 1)
+
+    start, total = time.monotonic(), 0
+    with pool, BatchWriter(table, **writer_kwargs) as writer:
+        pending = deque()
+        for file_name in files:
+            pending.append((file_name, pool.submit(_parse_json_dump, file_name)))
+            if len(pending) >= window:
+                total += _write_json_dump(writer, *pending.popleft(), primary_key)
+                _log_progress(len(files) - len(pending), len(files), total, start)
+        while pending:
+            total += _write_json_dump(writer, *pending.popleft(), primary_key)
+            _log_progress(len(files) - len(pending), len(files), total, start)
+        writer.flush()
+
+    logger.info(f"Loaded {total} items from {len(files)} files in {time.monotonic() - start:.1f}s")
+    return total
+
+
+def _write_json_dump(writer, file_name, future, primary_key):
+    items, parse_time = future.result()
+    write_start = time.monotonic()
+    for item in items:
+        if primary_key:
+            item[primary_key] = get_dynamo_compatible_uuid()
+        writer.put_item(Item=item)
+    logger.info(
+        f"{file_name}: {len(items)} items. Parsed in {parse_time:.2f}s ({len(items) / max(parse_time, 1e-6):.0f} items/s), "
+        f"queued for writing in {time.monotonic() - write_start:.2f}s"
+    )
+    return len(items)
+
+
+def _log_progress(done, count, total, start):
+    elapsed = time.monotonic() - start
+    logger.info(f"{done}/{count} files. {total} items in {elapsed:.1f}s ({total / max(elapsed, 1e-6):.0f} items/s)")
+
+
+def get_ddb_table(table, session=None, **resource_kwargs):
+    """Takes either a string or an existing boto3 Table object.  If neither raises Exception
+
+    A table name is looked up on a DynamoDB resource cached for the process (see `tlx.util.get_resource`) so that
+    e.g warm Lambda invocations reuse its connections.  `session` (e.g a `tlx.util.Session` with an assumed role)
+    and `resource_kwargs` (region, profile, endpoint_url, max_pool_connections ...) are passed to it.
+    """
 
     try:  # test is boto3 Table object
         _ = table.name  # noqa: F841
     except AttributeError as ae:
         if isinstance(table, str):
-            dynamodb = boto3.resource("dynamodb")
-            table = dynamodb.Table(table)
+            from tlx.util import get_resource  # Imports boto3 which is slow. Only when needed
+
+            table = get_resource("dynamodb", session=session, **resource_kwargs).Table(table)
         else:
             raise Exception("Table must be either a boto3 Table object or a string not: {type(table)}") from ae
     return table
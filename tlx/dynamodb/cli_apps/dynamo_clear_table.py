@@ -1,3 +1,4 @@
+import logging
 import sys
 import click
 from tlx.dynamodb.table import clear_table
@@ -5,16 +6,26 @@ from tlx.dynamodb.table import clear_table
 
 @click.command(context_settings=dict(max_content_width=120, help_option_names=['-h', '--help']))
 @click.option('--table', '-t', required=True, help="Table to clear")
-def dbw(table):
+@click.option('--recreate', is_flag=True, default=False, help="Delete and recreate the table from its description instead of deleting each item.  Fast for any table size.  See `tlx.dynamodb.clear_table` for what is kept.")
+@click.option('--segments', '-s', default=8, show_default=True, help="Segments of the parallel keys-only scan.")
+@click.option('--workers', '-w', default=8, show_default=True, help="Concurrent scan and delete workers.")
+def dct(table, recreate, segments, workers):
     """
         DYNAMO TABLE CLEAR
 
         WILL IMMEDIATELY DELETE ALL ITEMS WITHOUT CONFIRMATION !
 
+        \b
+        Modes:
+            - default:    parallel keys-only scan and concurrent batch deletes. Progress is printed.
+            - --recreate: delete the table and create it again with the same configuration.
     """
 
+    logging.basicConfig(format="%(message)s", level=logging.INFO)  # Progress
+    logging.getLogger("botocore").setLevel(logging.WARNING)
+
     try:  # Surpress all exceptions for CLI app
-        clear_table(table)
+        clear_table(table, total_segments=segments, max_workers=workers, recreate=recreate)
     except Exception as e:
         print("{}: {}".format(type(e).__name__, e))
         sys.exit(1)
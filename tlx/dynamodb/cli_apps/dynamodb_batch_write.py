@@ -4,9 +4,10 @@ from tlx.dynamodb.batch import load_scan_dump
 
 
 @click.command(context_settings=dict(max_content_width=120, help_option_names=['-h', '--help']))
-@click.option('--dump-file', '-d', required=True, type=click.File('rb'), help="File dumped from dynamodb with a `scan`.")
+@click.option('--dump-file', '-d', required=True, type=click.Path(exists=True, dir_okay=False), help="File dumped from dynamodb with a `scan`, or a `dynamodb` format shard from `dynamo-export`.  `.gz` and `.zst` files are decompressed.")
 @click.option('--table', '-t', required=True, help="Table to send data to. Table must exist and key schema must match.  Use `aws dynamodb describe-table --table-name <TableName>`")
-def dbw(dump_file, table=None):
+@click.option('--stream/--no-stream', default=True, show_default=True, help="Parse the dump incrementally while writing.  Memory stays flat for any dump size.")
+def dbw(dump_file, table=None, stream=True):
     """
         DYNAMO BATCH WRITE
 
@@ -21,7 +22,7 @@ def dbw(dump_file, table=None):
     """
 
     try:  # Surpress all exceptions for CLI app
-        load_scan_dump(dump_file, table)
+        load_scan_dump(dump_file, table, stream=stream)
     except Exception as e:
         print("{}: {}".format(type(e).__name__, e))
         sys.exit(1)
@@ -0,0 +1,46 @@
+import logging
+import sys
+import click
+from tlx.dynamodb.export import COMPRESSIONS, FORMATS, export_table
+
+
+@click.command(context_settings=dict(max_content_width=120, help_option_names=['-h', '--help']))
+@click.option('--table', '-t', required=True, help="Table to export.")
+@click.option('--directory', '-o', required=True, type=click.Path(file_okay=False), help="Directory for the shards and manifests.  Re-run with the same directory to resume.")
+@click.option('--format', '-f', 'fmt', default='ndjson', show_default=True, type=click.Choice(FORMATS), help="ndjson: for `load_json_dumps`, dynamodb: lossless scan dumps for `dynamo-batch-write`, parquet: requires pyarrow.")
+@click.option('--compression', '-c', default='gzip', show_default=True, type=click.Choice([c or 'none' for c in COMPRESSIONS]), help="zstd requires zstandard.")
+@click.option('--segments', '-s', default=8, show_default=True, help="Segments of the parallel scan.")
+@click.option('--workers', '-w', default=None, type=int, help="Segments exported at once.  [default: segments]")
+@click.option('--processes', is_flag=True, default=False, help="Export segments in processes rather than threads.")
+@click.option('--items-per-shard', default=100000, show_default=True, help="Approximate items in each shard file.")
+def dex(table, directory, fmt, compression, segments, workers, processes, items_per_shard):
+    """
+        DYNAMO EXPORT
+
+        Exports a table to compressed shard files with a parallel scan.
+
+        \b
+        Details:
+        Each segment of the scan writes its own shards and a manifest of them.  If the export is
+        interrupted, run the same command again to resume it.  Load the shards with:
+            - ndjson:   `tlx.dynamodb.load_json_dumps(directory, table)`
+            - dynamodb: `dynamo-batch-write --dump-file <shard> --table <table>` (for each shard)
+    """
+
+    logging.basicConfig(format="%(message)s", level=logging.INFO)  # Progress
+    logging.getLogger("botocore").setLevel(logging.WARNING)
+
+    try:  # Surpress all exceptions for CLI app
+        export_table(
+            table,
+            directory,
+            format=fmt,
+            compression=None if compression == 'none' else compression,
+            total_segments=segments,
+            max_workers=workers,
+            use_processes=processes,
+            items_per_shard=items_per_shard,
+        )
+    except Exception as e:
+        print("{}: {}".format(type(e).__name__, e))
+        sys.exit(1)
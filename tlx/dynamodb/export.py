@@ -0,0 +1,243 @@
+"""Exports tables to sharded files with a parallel scan.  The reverse of the loaders in `tlx.dynamodb.batch`."""
+import base64
+import glob
+import json
+import logging
+import os
+import time
+from decimal import Decimal
+
+from tlx.dynamodb.batch import _open_text, get_ddb_table
+from tlx.dynamodb.table import iter_scan, map_segments
+from tlx.dynamodb.types import deserialize_item, serialize_item
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "dynamodb", "parquet")
+COMPRESSIONS = ("gzip", "zstd", None)
+_EXTENSIONS = {"ndjson": ".ndjson", "dynamodb": ".json", "parquet": ".parquet"}
+_COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", None: ""}
+
+
+def export_table(
+    table,
+    directory,
+    format="ndjson",
+    compression="gzip",
+    total_segments=8,
+    max_workers=None,
+    use_processes=False,
+    items_per_shard=100000,
+    **table_scan_params,
+):
+    """Exports all items of a table to compressed shard files in `directory` with a parallel segmented scan.
+
+    Formats:
+        ndjson:     One json object per line.  Load with `load_json_dump` or `load_json_dumps(directory, ...)`.
+                    Numbers are written exactly.  Sets become lists and binary becomes base64 strings.
+        dynamodb:   `{"Items": [...]}` of typed attribute values like `aws dynamodb scan`.  Lossless.
+                    Load each shard with `load_scan_dump`.
+        parquet:    Requires pyarrow.  Numbers become float or int.  Compression is applied within the file.
+
+    Every segment writes its own shards of about `items_per_shard` items and records them in a manifest in
+    `directory/manifests`.  Run the same export again to resume an interrupted one: complete segments are
+    skipped and the others continue after their last complete shard.
+
+    Args:
+        table (str or boto3 Table):
+        directory (str): Created if it doesn't exist.
+        format (str): One of `FORMATS`.
+        compression (str): 'gzip', 'zstd' (requires zstandard) or None.
+        total_segments, max_workers, use_processes: As for `parallel_scan`.
+        items_per_shard (int): Shards are rotated at the first page boundary after this many items.
+        table_scan_params: As for `full_scan`. e.g a `FilterExpression`
+
+    Returns:
+        int: The number of items exported, including those exported by previous runs.
+
+    e.g
+        >>> export_table('Table-Name', '/data/export', total_segments=32, max_workers=16)
+        >>> load_json_dumps('/data/export', 'Other-Table')
+    """
+
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {COMPRESSIONS}")
+
+    table = get_ddb_table(table)
+    os.makedirs(os.path.join(directory, "manifests"), exist_ok=True)
+    settings = {"table": table.name, "total_segments": total_segments, "format": format, "compression": compression}
+    _check_existing_export(directory, settings)
+
+    start, total = time.monotonic(), 0
+    for segment, count in map_segments(
+        _export_segment,
+        table,
+        total_segments,
+        max_workers,
+        use_processes,
+        directory=directory,
+        format=format,
+        compression=compression,
+        items_per_shard=items_per_shard,
+        **table_scan_params,
+    ):
+        total += count
+        logger.info(f"Segment {segment} exported {count} items. Total {total} in {time.monotonic() - start:.1f}s")
+    return total
+
+
+def _export_segment(table, segment, total_segments, directory, format, compression, items_per_shard, **params):
+    """Exports one segment, resuming from its manifest.  Returns (segment, item count)"""
+
+    table = get_ddb_table(table)
+    path = _manifest_path(directory, table.name, segment, total_segments)
+    manifest = _load_manifest(path) or {
+        "table": table.name,
+        "segment": segment,
+        "total_segments": total_segments,
+        "format": format,
+        "compression": compression,
+        "shards": [],
+        "last_evaluated_key": None,
+        "complete": False,
+    }
+    if manifest["complete"]:
+        return segment, sum(s["items"] for s in manifest["shards"])
+
+    if manifest["last_evaluated_key"]:
+        params["ExclusiveStartKey"] = deserialize_item(manifest["last_evaluated_key"])
+
+    shard = None
+    for page in iter_scan(table, pages=True, Segment=segment, TotalSegments=total_segments, **params):
+        if page["Items"] and shard is None:
+            name = f"{table.name}-s{segment:04d}-{len(manifest['shards']):05d}"
+            name += _EXTENSIONS[format] + ("" if format == "parquet" else _COMPRESSION_EXTENSIONS[compression])
+            shard = _SHARD_WRITERS[format](os.path.join(directory, name), compression)
+        for item in page["Items"]:
+            shard.write(item)
+
+        last_evaluated_key = page.get("LastEvaluatedKey")
+        if shard and (shard.count >= items_per_shard or not last_evaluated_key):
+            shard.close()
+            manifest["shards"].append({"file": os.path.basename(shard.path), "items": shard.count})
+            shard = None
+        if shard is None:  # Checkpoint only at shard boundaries
+            manifest["last_evaluated_key"] = last_evaluated_key and serialize_item(last_evaluated_key)
+            manifest["complete"] = not last_evaluated_key
+            _save_manifest(path, manifest)
+
+    return segment, sum(s["items"] for s in manifest["shards"])
+
+
+def _manifest_path(directory, table_name, segment, total_segments):
+    return os.path.join(directory, "manifests", f"{table_name}-s{segment:04d}-of-{total_segments:04d}.json")
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_manifest(path, manifest):
+    """Atomic so that an interruption never leaves a partial manifest"""
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, default=_json_default)
+    os.replace(tmp, path)
+
+
+def _check_existing_export(directory, settings):
+    for path in glob.glob(os.path.join(directory, "manifests", "*.json")):
+        manifest = _load_manifest(path)
+        if manifest["table"] == settings["table"] and any(manifest[k] != v for k, v in settings.items()):
+            raise Exception(f"{directory} holds an export of {settings['table']} with different settings: {path}")
+
+
+def _json_default(o):
+    o = getattr(o, "value", o)  # boto3 wraps binary values in `Binary`
+    if isinstance(o, (bytes, bytearray)):
+        return base64.b64encode(o).decode()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _plain_json(value):
+    """Encodes an item as plain json.  Unlike `json_dumps` numbers are exact rather than floats"""
+
+    t = type(value)
+    if t is str:
+        return json.dumps(value)
+    if t is Decimal or t is int:
+        return str(value)
+    if t is dict:
+        return "{" + ",".join(json.dumps(k) + ":" + _plain_json(v) for k, v in value.items()) + "}"
+    if t is list or t is set:
+        return "[" + ",".join(_plain_json(v) for v in (sorted(value, key=_set_order) if t is set else value)) + "]"
+    if t is bool:
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return json.dumps(_json_default(value))
+
+
+def _set_order(v):
+    return getattr(v, "value", v)
+
+
+class _NdjsonShard:
+    def __init__(self, path, compression):
+        self.path, self.count = path, 0
+        self._file = _open_text(path, "w")
+
+    def write(self, item):
+        self._file.write(_plain_json(item) + "\n")
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class _DynamodbShard(_NdjsonShard):
+    def __init__(self, path, compression):
+        super().__init__(path, compression)
+        self._file.write('{"Items": [\n')
+
+    def write(self, item):
+        self._file.write((",\n" if self.count else "") + json.dumps(serialize_item(item), default=_json_default))
+        self.count += 1
+
+    def close(self):
+        self._file.write(f'\n], "Count": {self.count}, "ScannedCount": {self.count}}}\n')
+        self._file.close()
+
+
+class _ParquetShard:
+    """Rows are buffered and written when the shard is closed"""
+
+    def __init__(self, path, compression):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as ie:
+            raise ImportError("pyarrow is required for parquet exports: pip install pyarrow") from ie
+        self.path, self.count = path, 0
+        self._compression = compression or "none"
+        self._rows = []
+
+    def write(self, item):
+        self._rows.append(json.loads(_plain_json(item)))
+        self.count += 1
+
+    def close(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(self._rows), self.path, compression=self._compression)
+        self._rows = []
+
+
+_SHARD_WRITERS = {"ndjson": _NdjsonShard, "dynamodb": _DynamodbShard, "parquet": _ParquetShard}
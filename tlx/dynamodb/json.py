@@ -1,28 +1,237 @@
+import codecs
 import json
+import math
+import os
+import re
 from decimal import Decimal
 import datetime as dt
 from tlx.util import string_from_datetime
 
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Reused rather than built for every call as `json.loads(parse_float=...)` does. Matters for jsonlines
+_DECODER = json.JSONDecoder(parse_int=Decimal, parse_float=Decimal)
+_FAST_DECODER = json.JSONDecoder(parse_float=Decimal)
 
-def json_loads(x, **kwargs):
-    """Loads json for DynamoDB (Numerical types go to Decimal)"""
-    return json.loads(x, parse_int=Decimal, parse_float=Decimal, **kwargs)
+
+def json_loads(x, fast=False, **kwargs):
+    """Loads json for DynamoDB (Numerical types go to Decimal)
+
+    With `fast=True` integers stay python `int` and only non-integers become Decimal.  Both are exact and accepted
+    by boto3 but the standard library parses ints in C, roughly a third quicker on numeric payloads.
+    """
+    if kwargs:
+        return json.loads(x, parse_int=None if fast else Decimal, parse_float=Decimal, **kwargs)
+    if isinstance(x, (bytes, bytearray)):
+        x = x.decode()
+    return (_FAST_DECODER if fast else _DECODER).decode(x)
+
+
+def json_iterloads(fp, fast=False, **kwargs):
+    """Yields the objects of the newline delimited json (jsonlines) file `fp` one at a time, like `json_loads`.
+    Blank lines are skipped.  `fp` may be opened in text or binary (utf-8) mode.
+
+    e.g
+        >>> with open('dump.json') as f:
+        ...     for item in json_iterloads(f):
+        ...         print(item)
+    """
+    for line in fp:
+        if not line.isspace():
+            yield json_loads(line, fast=fast, **kwargs)
+
+
+def json_iter_array(fp, key="Items", chunk_size=1 << 16, **kwargs):
+    """Incrementally parses the JSON object in file `fp` and yields the elements of the array under `key`
+    one at a time.  Memory use is bounded by the largest element rather than the file size.
+
+    e.g the items of a scan dump (`aws dynamodb scan --table-name <TableName> > dump.json`)
+        >>> with open('dump.json', 'rb') as f:
+        ...     for item in json_iter_array(f, 'Items'):
+        ...         print(item)
+
+    `fp` may be opened in text or binary (utf-8) mode. `kwargs` are passed to `json.JSONDecoder`.
+    Raises `KeyError` if the object has no `key` and `json.JSONDecodeError` if the file is not valid JSON.
+    """
+
+    return _ArrayStream(fp, chunk_size, json.JSONDecoder(**kwargs)).iter_array(key)
+
+
+class _ArrayStream:
+    """Buffers just enough of a file to decode the next JSON value"""
+
+    def __init__(self, fp, chunk_size, decoder):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = decoder
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def iter_array(self, key):
+        self._expect("{")
+        if self._peek() == "}":
+            raise KeyError(key)
+        while True:
+            name = self._value()
+            self._expect(":")
+            if name == key:
+                yield from self._elements()
+                return
+            self._value()  # Skip the values of other keys
+            if self._expect(",}") == "}":
+                raise KeyError(key)
+
+    def _elements(self):
+        self._expect("[")
+        if self._peek() == "]":
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def _read(self):
+        """Reads more of the file, at least doubling the buffer for values larger than a chunk"""
+
+        self._buf, self._pos = self._buf[self._pos:], 0
+        data = self._fp.read(max(self._chunk_size, len(self._buf)))
+        if not data:
+            self._eof = True
+        elif isinstance(data, bytes):
+            data = self._text.decode(data)
+        self._buf += data or ""
+
+    def _peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                raise json.JSONDecodeError("Unexpected end of file", self._buf, self._pos)
+            self._read()
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self._buf, self._pos)
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number at the end of the buffer may be cut short. Need the next character to be sure.
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read()
 
 
 def json_dumps(x, **kwargs):
-    """Dumps json for DynamoDB (Numerical types go to Decimal) use indent=4 if required"""
-    return json.dumps(x, cls=DynamoEncoder, separators=(',', ': '), **kwargs)
+    """Dumps json for DynamoDB (Numerical types go to Decimal) use indent=4 if required
+
+    Without `kwargs` the fastest available backend is used (see `set_json_backend`).  With them, the standard
+    library encoder is used as before.
+    """
+    if kwargs:
+        return json.dumps(x, cls=DynamoEncoder, separators=(',', ': '), **kwargs)
+    return _backend(x)
 
 
 class DynamoEncoder(json.JSONEncoder):
     """ Makes type conversions to allow JSON serialisation using data types commonly used in the project
         Decimal -> float
         datetime -> ISO string
+        set -> list
     """
 
-    def default(self, o, markers=None):
-        if isinstance(o, Decimal):
+    def default(self, o):
+        if type(o) is Decimal:  # By far the most common
             return float(o)
-        if isinstance(o, dt.datetime):
-            return string_from_datetime(o)
-        return json.JSONEncoder(self).default(o, markers)
+        convert = _CONVERSIONS.get(type(o))
+        if convert:
+            return convert(o)
+        for types, convert in _CONVERSIONS.items():  # Subclasses
+            if isinstance(o, types):
+                return convert(o)
+        return json.JSONEncoder.default(self, o)
+
+
+_CONVERSIONS = {
+    Decimal: float,
+    dt.datetime: string_from_datetime,
+    set: list,
+    frozenset: list,
+}
+
+# Reused rather than built for every call as `json.dumps(cls=DynamoEncoder)` does
+_ENCODER = DynamoEncoder(separators=(',', ': '))
+
+
+def _stdlib_dumps(x):
+    return _ENCODER.encode(x)
+
+
+def _orjson_dumps(x):
+    try:
+        return orjson.dumps(x, default=_fast_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS).decode()
+    except orjson.JSONEncodeError:  # e.g integers over 64 bits. The standard library has no such limits.
+        return _stdlib_dumps(x)
+
+
+def _ujson_dumps(x):
+    try:
+        return ujson.dumps(x, default=_fast_default, ensure_ascii=False, escape_forward_slashes=False)
+    except (TypeError, OverflowError, ValueError):
+        return _stdlib_dumps(x)
+
+
+def _fast_default(o):
+    if type(o) is Decimal:
+        number = float(o)  # Decimal('1e400') is finite but overflows to inf
+        if math.isfinite(number):
+            return number
+        raise TypeError("Left to the standard library which writes NaN and Infinity")
+    return _ENCODER.default(o)
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+JSON_BACKENDS = {
+    name: dumps
+    for name, dumps, module in (("orjson", _orjson_dumps, orjson), ("ujson", _ujson_dumps, ujson), ("json", _stdlib_dumps, json))
+    if module
+}
+
+
+def set_json_backend(name=None):
+    """Sets the backend used by `json_dumps`.  One of `JSON_BACKENDS`: 'orjson' or 'ujson' if installed, or 'json'.
+
+    The default is the `TLX_JSON_BACKEND` environment variable or else the first available of those.  All backends
+    give the same data with the same conversions, however orjson and ujson omit the whitespace after separators and
+    don't escape non-ASCII characters.  Decimals that aren't finite as a float (NaN, Infinity or e.g 1e400) are
+    written as NaN and Infinity by every backend.  Native float NaN and infinities are the exception: orjson writes
+    them as null where the others write NaN and Infinity.  Use 'json' or 'ujson' if those must survive.
+    """
+    global _backend
+    name = name or os.environ.get("TLX_JSON_BACKEND") or next(iter(JSON_BACKENDS))
+    try:
+        _backend = JSON_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"JSON backend must be one of {list(JSON_BACKENDS)} not: {name}") from None
+
+
+set_json_backend()
@@ -1,8 +1,13 @@
+import functools
 import logging
-import sys
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 
-from tlx.dynamodb.batch import batch_delete, get_ddb_table
-from tlx.util import paginate
+from tlx.dynamodb.batch import BatchWriter, get_ddb_table
+from tlx.util import paginate, prefetch
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -100,7 +105,8 @@ def add_new_map_field(
     """
 
     if not path:  # Limit of recursion (Primary key was not found)
-        return add_key(table, key, field_to_add) if add_missing_key else {field_to_add: data}
+        field_to_add = expression_attribute_names.get(field_to_add, field_to_add)
+        return add_key(table, key, {field_to_add: data}) if add_missing_key else {field_to_add: data}
 
     str_path = ".".join(path)
     # Default to error instead of overwrite
@@ -135,35 +141,432 @@ def add_new_map_field(
 
     # Recursively try to add until we empty the 'path' variable
     return add_new_map_field(
-        table, key, path[:-1], path[-1], expression_attribute_names, new_data, replace_existing=replace_existing
+        table, key, path[:-1], path[-1], expression_attribute_names, new_data, add_missing_key, replace_existing
     )
 
 
-def clear_table(table):
-    """in Alpha
+class UpdateBatcher:
+    """Batches many `append_to_list_field` calls into as few `update_item` calls as possible.
+
+    - All appends queued for a key are sent as a single `UpdateExpression`.  Appends to the same path are merged
+      in the order `append_to_list_field` would have applied them.
+    - Document paths known to exist are cached per key.  A list whose parent map is known to exist is appended to,
+      or created, in that one update without the failed round trip `append_to_list_field` needs to find it missing.
+      Other paths fall back to `append_to_list_field` and are cached once it succeeds.
+    - Different keys are updated concurrently by `max_workers` threads.
+
+    Args:
+        table (str or boto3 Table):
+        max_workers (int): Keys updated at once.
+        add_missing_key (bool): As for `append_to_list_field`.
+        max_paths_per_update (int): Paths updated by one `update_item`.  Keeps expressions under DynamoDB's limits.
+        max_cached_keys (int): Keys for which existing paths are remembered. The least recently used are forgotten.
+
+    e.g
+        >>> with UpdateBatcher(table) as updates:
+        ...     for matchid, provider, odds in feed:
+        ...         updates.append({'matchid': matchid}, ['providers', '#p'], {'#p': provider}, [odds])
+    """
+
+    def __init__(self, table, max_workers=8, add_missing_key=False, max_paths_per_update=50, max_cached_keys=100000):
+        self.table = get_ddb_table(table)
+        self.add_missing_key = add_missing_key
+        self.max_paths_per_update = max_paths_per_update
+        self.max_cached_keys = max_cached_keys
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = []
+        self._known_paths = OrderedDict()  # frozen key -> set of path tuples known to exist
+        self._lock = threading.Lock()
+
+    def append(self, key, field_to_update, expression_attribute_names, new_item):
+        """Queues an append. Takes the same arguments as `append_to_list_field`.
+
+        Returns a `Future` resolved by `flush` with what `append_to_list_field` would have returned.
+        """
+
+        path = tuple(expression_attribute_names.get(field, field) for field in field_to_update)
+        future = Future()
+        self._pending.append((key, path, new_item, future))
+        return future
+
+    def flush(self):
+        """Sends all queued appends and waits for them.  Returns their results in the order they were appended"""
+
+        pending, self._pending = self._pending, []
+
+        by_key = OrderedDict()
+        for key, path, new_item, future in pending:
+            by_key.setdefault(_frozen_key(key), (key, []))[1].append((path, new_item, future))
+
+        wait([self._executor.submit(self._update_key, key, appends) for key, appends in by_key.values()])
+        return [future.result() for *_, future in pending]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type:
+            self._executor.shutdown()
+        else:
+            self.close()
+
+    def _update_key(self, key, appends):
+        try:
+            # list_append(:new_item, path) puts each new item in front of the last
+            merged = OrderedDict()
+            for path, new_item, future in appends:
+                items, futures = merged.get(path, ([], []))
+                merged[path] = (list(new_item) + items, futures + [future])
+
+            # Lists whose parent map is known to exist can be appended to, or created, without a failed round trip
+            known = self._known(key)
+            ready = [path for path in merged if path[:-1] in known]
+            for i in range(0, len(ready), self.max_paths_per_update):
+                paths = ready[i:i + self.max_paths_per_update]
+                if self._append_paths(key, {p: merged[p][0] for p in paths}):
+                    for path in paths:
+                        _resolve(merged.pop(path)[1], 200)
+                else:  # The cache is stale. Fall back for these paths.
+                    self._forget(key)
+
+            for path, (items, futures) in merged.items():
+                names = {f"#n{i}": field for i, field in enumerate(path)}
+                res = append_to_list_field(self.table, key, list(names), names, items, self.add_missing_key)
+                if res == 200:
+                    self._remember(key, [path])
+                _resolve(futures, res)
+        except Exception as e:
+            for _, _, future in appends:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _append_paths(self, key, items_by_path):
+        """One update_item appending to, or creating, every list.  Returns False if a parent map does not exist"""
+
+        names, values, updates, conditions = {}, {":empty": []}, [], set()
+        for i, (path, items) in enumerate(items_by_path.items()):
+            placeholders = [names.setdefault(field, f"#n{len(names)}") for field in path]
+            str_path = ".".join(placeholders)
+            values[f":v{i}"] = items
+            updates.append(f"{str_path} = list_append(:v{i}, if_not_exists({str_path}, :empty))")
+            parent = placeholders[:-1] or [names.setdefault(next(iter(key)), f"#n{len(names)}")]  # Or the item
+            conditions.add(f"attribute_exists({'.'.join(parent)})")
+
+        try:
+            self.table.update_item(
+                Key=key,
+                UpdateExpression="SET " + ", ".join(updates),
+                ExpressionAttributeNames={placeholder: field for field, placeholder in names.items()},
+                ExpressionAttributeValues=values,
+                ConditionExpression=" AND ".join(sorted(conditions)),
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+        self._remember(key, items_by_path)
+        return True
+
+    def _known(self, key):
+        with self._lock:
+            return set(self._known_paths.get(_frozen_key(key), ()))
+
+    def _remember(self, key, paths):
+        """Marks `paths`, every map above them and the item (the empty path) as existing for `key`"""
+
+        frozen = _frozen_key(key)
+        with self._lock:
+            known = self._known_paths.setdefault(frozen, set())
+            self._known_paths.move_to_end(frozen)
+            for path in paths:
+                known.update(path[:d] for d in range(len(path) + 1))
+            while len(self._known_paths) > self.max_cached_keys:
+                self._known_paths.popitem(last=False)
+
+    def _forget(self, key):
+        with self._lock:
+            self._known_paths.pop(_frozen_key(key), None)
+
+
+def _frozen_key(key):
+    return tuple(sorted(key.items()))
+
+
+def _resolve(futures, result):
+    for future in futures:
+        future.set_result(result)
+
+
+def clear_table(table, total_segments=8, max_workers=8, recreate=False, progress_every=100000):
+    """Deletes all items in a table and returns the number deleted (None if `recreate`).
 
     - WILL IMMEDIATELY DELETE ALL ITEMS WITHOUT CONFIRMATION !
 
-    NOT TESTED with Primary and Sort Key Tables !!!
-    TODO:
-        - test on multikey tables
-        - make cli app for it
+    Only the key attributes (partition and sort key) are scanned, with a parallel scan of `total_segments`,
+    and the deletes are sent by `max_workers` concurrent batch writers.  Keys are streamed to the writers page by
+    page as they are scanned, so deleting starts with the first pages and memory stays at a few pages per worker
+    whatever the size of the table.  Progress is logged at INFO level every `progress_every` items.
+
+    With `recreate=True` the table is instead deleted and created again from its `describe_table` description
+    which takes the same time for any size of table.  Indexes, billing mode, throughput, streams, encryption,
+    table class, tags, TTL and point in time recovery are kept.  Auto scaling policies and resource policies are
+    NOT, and tables with replicas or deletion protection are refused.
+    """
+
+    table = get_ddb_table(table)
+    if recreate:
+        return _recreate_table(table)
+
+    key_names = {f"#k{i}": key["AttributeName"] for i, key in enumerate(table.key_schema)}
+    keys_only = dict(ProjectionExpression=", ".join(key_names), ExpressionAttributeNames=key_names)
+
+    if total_segments:
+        keys = parallel_scan(table, total_segments=total_segments, max_workers=max_workers, **keys_only)
+    else:
+        keys = iter_scan(table, **keys_only)
+
+    start, count = time.monotonic(), 0
+    with BatchWriter(table, max_workers=max_workers) as batch:
+        for key in keys:
+            batch.delete_item(Key=key)
+            count += 1
+            if not count % progress_every:
+                logger.info(f"Deleting from {table.name}: {count} items ({count / (time.monotonic() - start):.0f}/s)")
+
+    logger.info(f"Deleted {count} items from {table.name} in {time.monotonic() - start:.1f}s")
+    return count
+
+
+def _recreate_table(table):
+    """Deletes and creates the table again with the same configuration.  See `clear_table`"""
+
+    client = table.meta.client
+    desc = client.describe_table(TableName=table.name)["Table"]
+    if desc.get("Replicas"):
+        raise Exception(f"{table.name} has replicas. Recreating global tables is not supported")
+    if desc.get("DeletionProtectionEnabled"):
+        raise Exception(f"{table.name} has deletion protection enabled")
+
+    on_demand = desc.get("BillingModeSummary", {}).get("BillingMode") == "PAY_PER_REQUEST"
+
+    def throughput(d):
+        return {k: d["ProvisionedThroughput"][k] for k in ("ReadCapacityUnits", "WriteCapacityUnits")}
+
+    params = {
+        "TableName": table.name,
+        "KeySchema": desc["KeySchema"],
+        "AttributeDefinitions": desc["AttributeDefinitions"],
+    }
+    if on_demand:
+        params["BillingMode"] = "PAY_PER_REQUEST"
+    else:
+        params["ProvisionedThroughput"] = throughput(desc)
+
+    if desc.get("GlobalSecondaryIndexes"):
+        params["GlobalSecondaryIndexes"] = [
+            {
+                "IndexName": gsi["IndexName"],
+                "KeySchema": gsi["KeySchema"],
+                "Projection": gsi["Projection"],
+                **({} if on_demand else {"ProvisionedThroughput": throughput(gsi)}),
+            }
+            for gsi in desc["GlobalSecondaryIndexes"]
+        ]
+    if desc.get("LocalSecondaryIndexes"):
+        params["LocalSecondaryIndexes"] = [
+            {k: lsi[k] for k in ("IndexName", "KeySchema", "Projection")} for lsi in desc["LocalSecondaryIndexes"]
+        ]
+    if desc.get("StreamSpecification", {}).get("StreamEnabled"):
+        params["StreamSpecification"] = desc["StreamSpecification"]
+    sse = desc.get("SSEDescription", {})
+    if sse.get("Status") == "ENABLED" and sse.get("SSEType") == "KMS":
+        params["SSESpecification"] = {"Enabled": True, "SSEType": "KMS", "KMSMasterKeyId": sse["KMSMasterKeyArn"]}
+    if desc.get("TableClassSummary", {}).get("TableClass"):
+        params["TableClass"] = desc["TableClassSummary"]["TableClass"]
+    tags = list(paginate(client.list_tags_of_resource, ResourceArn=desc["TableArn"]))
+    if tags:
+        params["Tags"] = tags
+
+    ttl = client.describe_time_to_live(TableName=table.name)["TimeToLiveDescription"]
+    pitr = client.describe_continuous_backups(TableName=table.name)["ContinuousBackupsDescription"]
+    pitr_enabled = pitr.get("PointInTimeRecoveryDescription", {}).get("PointInTimeRecoveryStatus") == "ENABLED"
+
+    logger.info(f"Deleting table {table.name}")
+    client.delete_table(TableName=table.name)
+    client.get_waiter("table_not_exists").wait(TableName=table.name)
+
+    logger.info(f"Creating table {table.name}")
+    client.create_table(**params)
+    client.get_waiter("table_exists").wait(TableName=table.name)
+
+    if ttl.get("TimeToLiveStatus") in ("ENABLED", "ENABLING"):
+        client.update_time_to_live(
+            TableName=table.name,
+            TimeToLiveSpecification={"Enabled": True, "AttributeName": ttl["AttributeName"]},
+        )
+    if pitr_enabled:
+        client.update_continuous_backups(
+            TableName=table.name,
+            PointInTimeRecoverySpecification={"PointInTimeRecoveryEnabled": True},
+        )
+
+
+def _scan_segment(table, segment, total_segments, results, stop, **table_scan_params):
+    """Scans a single segment of `table`, putting each page's items on the `results` queue as (items, None), then
+    (None, None) once the segment is complete or (None, error) if it fails.  Gives up once `stop` is set.
+
+    Module level so that it can be sent to a process pool.
+    """
+
+    if stop.is_set():
+        return
+    try:
+        for page in _scan_pages(table, Segment=segment, TotalSegments=total_segments, **table_scan_params):
+            if not _put(results, stop, (page["Items"], None)):
+                return  # The caller stopped
+    except Exception as e:  # Handed to the caller
+        _put(results, stop, (None, e))
+    else:
+        _put(results, stop, (None, None))
+
+
+def _put(results, stop, value):
+    while not stop.is_set():
+        try:
+            results.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def parallel_scan(table, total_segments=4, max_workers=None, use_processes=False, buffer_pages=2,
+                  **table_scan_params):
+    """Scans the table with DynamoDB's parallel scan (`Segment`/`TotalSegments`) and yields the items.
+
+    Each segment is scanned by a worker that hands over its pages as they arrive, so items are yielded page by
+    page while the segments are still being scanned and the order of items is not defined.  The workers hold at
+    most `buffer_pages` pages each ahead of the caller, so memory doesn't grow with the size of the table.
+    Accepts the same `table_scan_params` as `full_scan`, including a `FilterExpression` from
+    `boto3.dynamodb.conditions`.
+
+    Args:
+        table (str or boto3 Table):
+        total_segments (int): Number of segments to split the table into.
+        max_workers (int): Default `total_segments`. Number of segments scanned at once.
+        use_processes (bool): Default False. Scan segments in a process pool rather than threads.
+                              Each process makes its own table resource for the table's name, region and
+                              endpoint, with the default credentials.
+        buffer_pages (int): Default 2. Pages each worker may fetch ahead of the caller.
+
+    e.g
+        >>> from boto3.dynamodb.conditions import Attr
+        >>> for item in parallel_scan('Table-Name', total_segments=16, FilterExpression=Attr('userId').eq(USERID)):
+        ...     print(item)
     """
 
     table = get_ddb_table(table)
-    ddb = table.meta.client
+    max_workers = max_workers or total_segments
+    manager = None
+    if use_processes:
+        import multiprocessing  # Only when needed
+
+        manager = multiprocessing.Manager()  # Its queue and event can be shared with the processes
+        results, stop = manager.Queue(maxsize=buffer_pages * max_workers), manager.Event()
+    else:
+        results, stop = queue.Queue(maxsize=buffer_pages * max_workers), threading.Event()
+
+    executor, submit = _segment_pool(table, max_workers, use_processes)
+    futures = []
+    try:
+        futures = [submit(_scan_segment, segment, total_segments, results=results, stop=stop, **table_scan_params)
+                   for segment in range(total_segments)]
+        segments_left = total_segments
+        while segments_left:
+            try:
+                items, error = results.get(timeout=1)
+            except queue.Empty:  # e.g a process that couldn't start, so never reports
+                for future in futures:
+                    if future.done() and not future.cancelled() and future.exception():
+                        raise future.exception()
+                continue
+            if error is not None:
+                raise error
+            if items is None:
+                segments_left -= 1
+            else:
+                yield from items
+    finally:  # Releases the workers if the caller stops early
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=use_processes)  # Processes finish with the manager before it goes
+        if manager:
+            manager.shutdown()
+
+
+def map_segments(func, table, total_segments=4, max_workers=None, use_processes=False, **kwargs):
+    """Calls `func(table, segment, total_segments, **kwargs)` for every segment in a thread or process pool and
+    yields the results as they complete.
+
+    `func` should scan its segment by passing `Segment` and `TotalSegments` to the scan.  In a thread pool each call
+    gets a table resource of its own sharing the table's client.  For a process pool `func` must be defined at
+    module level.  Each process then gets a table of the same name, region and endpoint
+    (e.g DynamoDB local) from its own resource, using the default credentials.
+    """
+
+    table = get_ddb_table(table)
+    executor, submit = _segment_pool(table, max_workers or total_segments, use_processes)
+    with executor:
+        futures = [submit(func, segment, total_segments, **kwargs) for segment in range(total_segments)]
+        for future in as_completed(futures):
+            yield future.result()
+
 
-    table_keys = [key["AttributeName"] for key in table.key_schema]
-    all_ids = ({key: r[key] for key in table_keys} for r in paginate(ddb.scan, TableName=table.name))
-    batch_delete(table, all_ids)
+def _segment_pool(table, max_workers, use_processes):
+    """(executor, submit) where `submit(func, segment, total_segments, **kwargs)` calls `func` with the table"""
 
+    if use_processes:
+        client = table.meta.client.meta
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        return executor, functools.partial(executor.submit, _in_process, table_name=table.name,
+                                           region=client.region_name, endpoint_url=client.endpoint_url)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    return executor, lambda func, *args, **kwargs: executor.submit(_in_thread, func, table, *args, **kwargs)
 
-def full_scan(table, **table_scan_params):
+
+def _in_thread(func, table, segment, total_segments, **kwargs):
+    """Calls `func` with a Table resource of its own.  Resources aren't thread-safe but their client is, so the
+    copy shares the client (and its credentials and connection pool)
+    """
+
+    from boto3.resources.base import ServiceResource  # Already imported with the table
+
+    if isinstance(table, ServiceResource):
+        table = type(table)(table.name, client=table.meta.client)
+    return func(table, segment, total_segments, **kwargs)
+
+
+def _in_process(func, segment, total_segments, table_name, region, endpoint_url, **kwargs):
+    """Calls `func` in a worker process with the table rebuilt there.  Tables can't be sent between processes"""
+
+    table = get_ddb_table(table_name, region=region, endpoint_url=endpoint_url)
+    return func(table, segment, total_segments, **kwargs)
+
+
+def full_scan(table, total_segments=None, max_workers=None, use_processes=False, **table_scan_params):
     """Paginates fully over the table resource scan method wich is not natively pagable.
     Although the client scan method is pagable using with the generic paginator in tlx,
     it won't accept the FilterExpression from `boto3.dynamodb.conditions` (`Key, Attr`)
 
     This method takes normal table scan parameters and returns the complete list.
+    Set `total_segments` to scan in parallel (see `parallel_scan`).  Item order is then not defined.
 
     e.g
         >>> from boto3.dynamodb.conditions import Key, Attr
@@ -173,18 +576,53 @@ def full_scan(table, **table_scan_params):
         ...     FilterExpression=Attr('userId').eq(USERID),
         ... )
         >>> items = tlx.dynamodb.table.full_scan(table_name, **table_scan_params)
+        >>> items = tlx.dynamodb.table.full_scan(table_name, total_segments=8, **table_scan_params)
 
     """
 
-    table = get_ddb_table(table)
+    if total_segments:
+        return list(parallel_scan(table, total_segments, max_workers, use_processes, **table_scan_params))
+    return list(iter_scan(table, **table_scan_params))
 
-    items = []
+
+def _scan_pages(table, **table_scan_params):
     scan_incomplete = True
     while scan_incomplete:
         res = table.scan(**table_scan_params)
-        items.extend(res["Items"])
+        yield res
         try:
             table_scan_params["ExclusiveStartKey"] = res["LastEvaluatedKey"]
         except KeyError:  # Last item
             scan_incomplete = False
-    return items
+
+
+def iter_scan(table, pages=False, prefetch_pages=0, **table_scan_params):
+    """Lazily scans the table, yielding items (or whole pages) as they arrive.
+
+    With `prefetch_pages=0` the next page is only requested once the caller has consumed the current one, so one
+    page is held in memory.  Otherwise a background thread fetches up to `prefetch_pages` pages ahead of the caller
+    and at most `prefetch_pages` + 2 pages are held: the caller's page, the queued pages and one the thread has
+    fetched while it waits for room in the queue.
+
+    Args:
+        table (str or boto3 Table):
+        pages (bool): Default False. Yield the raw scan responses rather than items.  A response's
+                      `LastEvaluatedKey` is a checkpoint: pass it back as `ExclusiveStartKey` to resume
+                      the scan after that page.
+        prefetch_pages (int): Default 0. Number of pages to fetch ahead of the caller.
+        table_scan_params: As for `full_scan`.
+
+    e.g Resume an interrupted export
+        >>> for page in iter_scan(table_name, pages=True, ExclusiveStartKey=checkpoint):
+        ...     export(page["Items"])
+        ...     checkpoint = page.get("LastEvaluatedKey")
+    """
+
+    table = get_ddb_table(table)
+
+    results = prefetch(_scan_pages(table, **table_scan_params), size=prefetch_pages)
+    if pages:
+        yield from results
+    else:
+        for res in results:
+            yield from res["Items"]
@@ -0,0 +1,125 @@
+"""Conversion between DynamoDB typed attribute values and python types.
+
+Typed attribute values are what the low level API returns and what `aws dynamodb scan` dumps contain, e.g
+`{"ID": {"N": "1"}, "Tags": {"SS": ["a", "b"]}}`.  These functions cover the full DynamoDB type system and are
+equivalent to boto3's `TypeDeserializer`/`TypeSerializer` except that binary values are `bytes` rather than
+`boto3.dynamodb.types.Binary`.  Binary values in dumps are base64 strings and are decoded.
+"""
+from base64 import b64decode
+from decimal import Decimal
+
+
+def deserialize(attribute):
+    """Converts a typed attribute value to python. e.g {"N": "1"} -> Decimal("1")"""
+
+    (tag, value), = attribute.items()  # Always exactly one type
+    try:
+        return _DESERIALIZERS[tag](value)
+    except KeyError:
+        raise TypeError(f"Unknown DynamoDB type: {tag}") from None
+
+
+def deserialize_item(item):
+    """Converts an item of typed attribute values to python. e.g {"ID": {"N": "1"}} -> {"ID": Decimal("1")}"""
+
+    return {k: deserialize(v) for k, v in item.items()}
+
+
+def serialize(value):
+    """Converts a python value to a typed attribute value. e.g Decimal("1") -> {"N": "1"}
+
+    Like boto3, floats are rejected to avoid silent loss of precision.  Use Decimal.
+    """
+
+    try:
+        return _SERIALIZERS[type(value)](value)
+    except KeyError:
+        pass
+
+    for types, func in _SUBCLASS_SERIALIZERS:  # Slow path for subclasses of supported types
+        if isinstance(value, types):
+            return func(value)
+    if _is_boto3_binary(value):  # Returned by boto3 table resources
+        return {"B": value.value}
+    raise TypeError(f"Unsupported type {type(value)} for value {value!r}")
+
+
+def serialize_item(item):
+    """Converts an item of python values to typed attribute values. e.g {"ID": Decimal("1")} -> {"ID": {"N": "1"}}"""
+
+    return {k: serialize(v) for k, v in item.items()}
+
+
+def _is_boto3_binary(value):
+    from boto3.dynamodb.types import Binary  # Only imported for otherwise unsupported types
+
+    return isinstance(value, Binary)
+
+
+def _binary(value):
+    return b64decode(value) if isinstance(value, str) else bytes(value)
+
+
+def _number(value):
+    if isinstance(value, Decimal) and not value.is_finite():
+        raise TypeError("Infinity and NaN are not supported by DynamoDB")
+    return str(value)
+
+
+def _float(value):
+    raise TypeError("Float types are not supported. Use Decimal types instead.")
+
+
+def _set(value):
+    if not value:
+        raise TypeError("Empty sets are not supported by DynamoDB")
+    sample = next(iter(value))
+    if isinstance(sample, str):
+        return {"SS": list(value)}
+    if isinstance(sample, (int, Decimal)) and not isinstance(sample, bool):
+        return {"NS": [_number(v) for v in value]}
+    if isinstance(sample, (bytes, bytearray)):
+        return {"BS": [bytes(v) for v in value]}
+    if _is_boto3_binary(sample):
+        return {"BS": [v.value for v in value]}
+    raise TypeError(f"Unsupported set element type {type(sample)}")
+
+
+_DESERIALIZERS = {
+    "S": str,
+    "N": Decimal,
+    "B": _binary,
+    "BOOL": bool,
+    "NULL": lambda value: None,
+    "M": deserialize_item,
+    "L": lambda values: [deserialize(v) for v in values],
+    "SS": set,
+    "NS": lambda values: set(map(Decimal, values)),
+    "BS": lambda values: set(map(_binary, values)),
+}
+
+_SERIALIZERS = {
+    str: lambda value: {"S": value},
+    bool: lambda value: {"BOOL": value},
+    int: lambda value: {"N": str(value)},
+    Decimal: lambda value: {"N": _number(value)},
+    float: _float,
+    type(None): lambda value: {"NULL": True},
+    bytes: lambda value: {"B": value},
+    bytearray: lambda value: {"B": bytes(value)},
+    dict: lambda value: {"M": serialize_item(value)},
+    list: lambda value: {"L": [serialize(v) for v in value]},
+    tuple: lambda value: {"L": [serialize(v) for v in value]},
+    set: _set,
+    frozenset: _set,
+}
+
+_SUBCLASS_SERIALIZERS = [
+    ((str,), _SERIALIZERS[str]),
+    ((int, Decimal), lambda value: {"N": _number(value)}),
+    ((float,), _float),
+    ((bytes, bytearray), _SERIALIZERS[bytearray]),
+    ((dict,), _SERIALIZERS[dict]),
+    ((list, tuple), _SERIALIZERS[list]),
+    ((set, frozenset), _set),
+]
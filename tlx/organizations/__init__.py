@@ -0,0 +1,9 @@
+from tlx.util._lazy import lazy_module
+
+name = "organizations"
+
+lazy_module(__name__, {
+    "cache": ["OrgCache"],
+    "scp": ["ScpEvaluator"],
+    "tree": ["build_org_tree", "iter_org_units"],
+})
@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tlx.organizations.tree import _client, _Lister
+from tlx.util import AdaptiveSemaphore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.expanduser(os.path.join('~', '.cache', 'tlx', 'organizations.sqlite'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id TEXT PRIMARY KEY, name TEXT, arn TEXT, parent_id TEXT, position INTEGER, fetched_at REAL
+);
+CREATE INDEX IF NOT EXISTS units_parent ON units (parent_id);
+CREATE TABLE IF NOT EXISTS accounts (id TEXT PRIMARY KEY, name TEXT, parent_id TEXT, data TEXT);
+CREATE INDEX IF NOT EXISTS accounts_name ON accounts (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS accounts_parent ON accounts (parent_id);
+CREATE TABLE IF NOT EXISTS policies (id TEXT PRIMARY KEY, name TEXT, data TEXT, fetched_at REAL);
+CREATE TABLE IF NOT EXISTS attachments (policy_id TEXT, target_id TEXT, PRIMARY KEY (policy_id, target_id));
+CREATE INDEX IF NOT EXISTS attachments_target ON attachments (target_id);
+CREATE TABLE IF NOT EXISTS documents (policy_id TEXT PRIMARY KEY, content TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL);
+CREATE TABLE IF NOT EXISTS organization (id TEXT PRIMARY KEY, management_account_id TEXT, data TEXT);
+"""
+
+
+class OrgCache:
+    """A local SQLite copy of the organisation (units, accounts, SCPs and their attachments) for fast, offline
+    queries.
+
+    `refresh()` updates it from AWS, re-fetching only the units and policies older than `ttl` seconds.  Everything
+    else reads the local copy without network calls.
+
+    Kwargs (all optional):
+        path (str): The database file.  Default `DEFAULT_PATH`.  ':memory:' for a throwaway cache.
+        ttl (int): Seconds before a unit's children and accounts, or a policy's attachments and document,
+            are fetched again.
+        client / session / max_workers: As for `iter_org_units`, used by `refresh()`.
+
+    Example:
+        >>> with OrgCache(session=Session(profile='management')) as org:
+        ...     org.refresh()
+        ...     [account] = org.find_accounts('prod-data')
+        ...     print([p['Name'] for p in org.scps_for_account(account['Id'])])
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=3600, client=None, session=None, max_workers=8):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db_path = path
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._client = client
+        self._session = session
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    # Refresh
+
+    def refresh(self, force=False):
+        """Fetches the units and policies that are older than `ttl` (all of them if `force`).  Units are walked
+        from the roots; an unchanged subtree costs no calls until its own units expire.  Returns the number of units
+        fetched.
+        """
+
+        client = self._client or _client(self._session, self.max_workers)
+        org = _Lister(client, AdaptiveSemaphore(self.max_workers), max_retries=10, backoff_base=0.2, backoff_cap=20)
+        expired = time.time() - (0 if force else self.ttl)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            if force or self._stale_meta("roots", expired) or self.management_account() is None:
+                self._save_roots(org.roots(), org.organization())
+            fetched = self._refresh_units(org, pool, expired)
+            if force or self._stale_meta("policies", expired) or self._missing_documents():
+                self._refresh_policies(org, pool, expired)
+        return fetched
+
+    def _refresh_units(self, org, pool, expired):
+        fetched = 0
+        level = [row["id"] for row in self._db.execute("SELECT id FROM units WHERE parent_id IS NULL ORDER BY position")]
+        while level:
+            stale = [u for u in level if self._unit_fetched_at(u) <= expired]
+            futures = {u: (pool.submit(org.org_units, u), pool.submit(org.accounts, u)) for u in stale}
+            for unit_id, (units, accounts) in futures.items():
+                self._save_children(unit_id, units.result(), accounts.result())
+                fetched += 1
+            level = [row["id"] for u in level
+                     for row in self._db.execute("SELECT id FROM units WHERE parent_id = ? ORDER BY position", (u,))]
+        return fetched
+
+    def _refresh_policies(self, org, pool, expired):
+        policies = org.policies()
+        known = {row["id"]: row["fetched_at"] for row in self._db.execute(
+            "SELECT id, fetched_at FROM policies JOIN documents ON policy_id = id")}
+        stale = [p for p in policies if known.get(p["Id"], 0) <= expired]
+        targets = {p["Id"]: pool.submit(org.targets, p["Id"]) for p in stale}
+        documents = {p["Id"]: pool.submit(org.document, p["Id"]) for p in stale}
+        now = time.time()
+        with self._db:
+            ids = [p["Id"] for p in policies]
+            self._db.execute(f"DELETE FROM policies WHERE id NOT IN ({','.join('?' * len(ids))})", ids)
+            self._db.execute(f"DELETE FROM attachments WHERE policy_id NOT IN ({','.join('?' * len(ids))})", ids)
+            self._db.execute(f"DELETE FROM documents WHERE policy_id NOT IN ({','.join('?' * len(ids))})", ids)
+            for policy in policies:
+                if policy["Id"] not in targets:
+                    self._db.execute("UPDATE policies SET name = ?, data = ? WHERE id = ?",
+                                     (policy["Name"], json.dumps(policy, default=str), policy["Id"]))
+                    continue
+                self._db.execute("INSERT OR REPLACE INTO policies VALUES (?, ?, ?, ?)",
+                                 (policy["Id"], policy["Name"], json.dumps(policy, default=str), now))
+                self._db.execute("INSERT OR REPLACE INTO documents VALUES (?, ?)",
+                                 (policy["Id"], documents[policy["Id"]].result()))
+                self._db.execute("DELETE FROM attachments WHERE policy_id = ?", (policy["Id"],))
+                self._db.executemany("INSERT OR IGNORE INTO attachments VALUES (?, ?)",
+                                     [(policy["Id"], t["TargetId"]) for t in targets[policy["Id"]].result()])
+            self._set_meta("policies", now)
+
+    def _save_roots(self, roots, organization):
+        with self._db:
+            self._db.execute("DELETE FROM organization")
+            self._db.execute("INSERT INTO organization VALUES (?, ?, ?)", (
+                organization["Id"], organization["MasterAccountId"], json.dumps(organization, default=str)))
+            ids = [r["Id"] for r in roots]
+            for gone in self._db.execute(
+                    f"SELECT id FROM units WHERE parent_id IS NULL AND id NOT IN ({','.join('?' * len(ids))})",
+                    ids).fetchall():
+                self._delete_subtree(gone["id"])
+            for position, root in enumerate(roots):
+                self._upsert_unit(root, None, position)
+            self._set_meta("roots", time.time())
+
+    def _save_children(self, unit_id, units, accounts):
+        with self._db:
+            ids = [u["Id"] for u in units]
+            for gone in self._db.execute(
+                    f"SELECT id FROM units WHERE parent_id = ? AND id NOT IN ({','.join('?' * len(ids))})",
+                    [unit_id] + ids).fetchall():
+                self._delete_subtree(gone["id"])
+            for position, unit in enumerate(units):
+                self._upsert_unit(unit, unit_id, position)
+
+            self._db.execute("DELETE FROM accounts WHERE parent_id = ?", (unit_id,))
+            self._db.executemany("INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?)",
+                                 [(a["Id"], a.get("Name"), unit_id, json.dumps(a, default=str)) for a in accounts])
+            self._db.execute("UPDATE units SET fetched_at = ? WHERE id = ?", (time.time(), unit_id))
+
+    def _upsert_unit(self, unit, parent_id, position):
+        """Keeps `fetched_at` of a unit already known so that it isn't fetched again before it expires"""
+
+        self._db.execute(
+            "INSERT INTO units VALUES (?, ?, ?, ?, ?, 0) ON CONFLICT (id) DO UPDATE SET "
+            "name = excluded.name, arn = excluded.arn, parent_id = excluded.parent_id, position = excluded.position",
+            (unit["Id"], unit["Name"], unit["Arn"], parent_id, position))
+
+    def _delete_subtree(self, unit_id):
+        subtree = """WITH RECURSIVE subtree (id) AS (
+            SELECT ? UNION ALL SELECT units.id FROM units JOIN subtree ON units.parent_id = subtree.id
+        )"""
+        self._db.execute(f"{subtree} DELETE FROM accounts WHERE parent_id IN (SELECT id FROM subtree)", (unit_id,))
+        self._db.execute(f"{subtree} DELETE FROM units WHERE id IN (SELECT id FROM subtree)", (unit_id,))
+
+    def _unit_fetched_at(self, unit_id):
+        return self._db.execute("SELECT fetched_at FROM units WHERE id = ?", (unit_id,)).fetchone()["fetched_at"]
+
+    def _stale_meta(self, key, expired):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row is None or row["value"] <= expired
+
+    def _missing_documents(self):
+        """e.g in a cache written before documents were kept"""
+
+        return self._db.execute("SELECT 1 FROM policies WHERE id NOT IN (SELECT policy_id FROM documents)").fetchone()
+
+    def _set_meta(self, key, value):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    # Offline queries
+
+    def management_account(self):
+        """The Id of the organisation's management account, or None before the first `refresh()`"""
+
+        row = self._db.execute("SELECT management_account_id FROM organization").fetchone()
+        return row["management_account_id"] if row else None
+
+    def accounts(self):
+        """Every account, each with its `ParentId`"""
+
+        return [self._account(row) for row in self._db.execute("SELECT * FROM accounts ORDER BY name")]
+
+    def find_accounts(self, query):
+        """Accounts whose Id is `query` or whose Name contains it (case insensitive)"""
+
+        rows = self._db.execute("SELECT * FROM accounts WHERE id = ? OR name LIKE ? ESCAPE '\\' ORDER BY name",
+                                (query, "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"))
+        return [self._account(row) for row in rows]
+
+    def path(self, target_id):
+        """The units from the root down to the parent of the account or unit `target_id`"""
+
+        row = self._db.execute("SELECT parent_id FROM accounts WHERE id = ? UNION ALL "
+                               "SELECT parent_id FROM units WHERE id = ?", (target_id, target_id)).fetchone()
+        path = []
+        parent_id = row["parent_id"] if row else None
+        while parent_id:
+            unit = self._db.execute("SELECT * FROM units WHERE id = ?", (parent_id,)).fetchone()
+            path.insert(0, {"Id": unit["id"], "Name": unit["name"], "Arn": unit["arn"]})
+            parent_id = unit["parent_id"]
+        return path
+
+    def scps_for_account(self, account_id):
+        """The SCPs that apply to an account: those attached to each unit on its path and to the account itself.
+        Root first.  Each policy summary has the `TargetId` it is attached to.
+        """
+
+        targets = [u["Id"] for u in self.path(account_id)] + [account_id]
+        scps = []
+        for target_id in targets:
+            rows = self._db.execute("SELECT policies.data FROM attachments JOIN policies ON policies.id = policy_id "
+                                    "WHERE target_id = ? ORDER BY policies.name", (target_id,))
+            scps.extend(dict(json.loads(row["data"]), TargetId=target_id) for row in rows)
+        return scps
+
+    def attachments(self):
+        """The Ids of the SCPs attached to each root, OU and account: {target Id: [policy Id, ...]}"""
+
+        attached = {}
+        for row in self._db.execute("SELECT target_id, policy_id FROM attachments JOIN policies ON policies.id = "
+                                    "policy_id ORDER BY target_id, policies.name"):
+            attached.setdefault(row["target_id"], []).append(row["policy_id"])
+        return attached
+
+    def policy_documents(self):
+        """The name and policy document (a JSON string) of each SCP: {policy Id: (Name, document)}"""
+
+        return {row["id"]: (row["name"], row["content"]) for row in self._db.execute(
+            "SELECT id, name, content FROM policies JOIN documents ON policy_id = id")}
+
+    def tree(self):
+        """The organisation in the form of `build_org_tree`, from the cache.  SCPs are policy summaries"""
+
+        def _nest(unit):
+            children = self._db.execute("SELECT * FROM units WHERE parent_id = ? ORDER BY position", (unit["id"],))
+            return {
+                "Name": unit["name"],
+                "Id": unit["id"],
+                "Arn": unit["arn"],
+                "Accounts": [json.loads(a["data"]) for a in self._db.execute(
+                    "SELECT data FROM accounts WHERE parent_id = ? ORDER BY name", (unit["id"],))],
+                "SCPs": [json.loads(p["data"]) for p in self._db.execute(
+                    "SELECT policies.data FROM attachments JOIN policies ON policies.id = policy_id "
+                    "WHERE target_id = ? ORDER BY policies.name", (unit["id"],))],
+                "OrgUnits": [_nest(child) for child in children.fetchall()],
+            }
+
+        roots = self._db.execute("SELECT * FROM units WHERE parent_id IS NULL ORDER BY position").fetchall()
+        return [_nest(root) for root in roots]
+
+    @staticmethod
+    def _account(row):
+        return dict(json.loads(row["data"]), ParentId=row["parent_id"])
@@ -0,0 +1,102 @@
+import json
+import logging
+import sys
+import click
+from tlx.organizations.cache import OrgCache
+from tlx.organizations.scp import ScpEvaluator
+from tlx.organizations.tree import build_org_tree, iter_org_units
+from tlx.util import Session
+
+
+@click.command(context_settings=dict(max_content_width=120, help_option_names=['-h', '--help']))
+@click.option('--profile', '-p', default=None, help="A profile for the management account.  Default: the environment's credentials.")
+@click.option('--workers', '-w', default=8, show_default=True, help="Organizations calls made at once (fewer while throttled).")
+@click.option('--stream', is_flag=True, default=False, help="Print each OU as jsonlines as soon as it's resolved, rather than the nested tree at the end.")
+@click.option('--no-accounts', is_flag=True, default=False, help="Don't list the accounts of each OU.")
+@click.option('--no-scps', is_flag=True, default=False, help="Don't list the SCPs attached to each OU.")
+@click.option('--cache', 'use_cache', is_flag=True, default=False, help="Use a local copy of the organisation (~/.cache/tlx/organizations.sqlite), only re-fetching units older than --ttl.")
+@click.option('--ttl', default=3600, show_default=True, help="Seconds before a cached unit or policy is fetched again.")
+@click.option('--offline', is_flag=True, default=False, help="Use the cache as it is, with no AWS calls.  Implies --cache.")
+@click.option('--find', default=None, help="Print the accounts with this Id or Name (substring) from the cache, with their path and SCPs.  Implies --cache.")
+@click.option('--effective', is_flag=True, default=False, help="With --find, also print each account's SCP statements merged into one document, with the source of each.")
+@click.option('--allowed', 'action', default=None, help="Print whether SCPs allow this action (e.g s3:PutObject) in each account, or those from --find.  Implies --cache.")
+def org_tree(profile, workers, stream, no_accounts, no_scps, use_cache, ttl, offline, find, effective, action):
+    """
+        ORG TREE
+
+        Prints the organisation as a JSON tree of roots and organisational units, with the accounts
+        and SCPs at each level.
+
+        \b
+        Details:
+        Every listing is paginated and calls are made concurrently, backing off when Organizations throttles.
+        With --stream each OU is printed as it's resolved (parents first) as:
+            {"Name", "Id", "Arn", "ParentId", "Accounts": [...], "SCPs": [...], "OrgUnits": [child ids]}
+
+        \b
+        Cache:
+        With --cache the tree is kept in a local database and only units older than --ttl are fetched
+        again.  Then --offline and --find answer from it in milliseconds, e.g:
+            org-tree --find prod-data | jq .SCPs
+        The SCPs are evaluated offline too:
+            org-tree --offline --allowed ec2:RunInstances | jq 'select(.Allowed | not)'
+    """
+
+    logging.basicConfig(format="%(message)s", level=logging.WARNING)
+    kwargs = dict(session=Session(profile=profile) if profile else None, max_workers=workers,
+                  accounts=not no_accounts, scps=not no_scps)
+
+    try:  # Surpress all exceptions for CLI app
+        if use_cache or offline or find or action:
+            _from_cache(kwargs, ttl, offline, find, stream, effective, action)
+        elif stream:
+            for unit in iter_org_units(**kwargs):
+                print(json.dumps(unit, default=str), flush=True)
+        else:
+            print(json.dumps(build_org_tree(**kwargs), default=str))
+    except Exception as e:
+        print("{}: {}".format(type(e).__name__, e), file=sys.stderr)
+        sys.exit(1)
+
+
+def _from_cache(kwargs, ttl, offline, find, stream, effective, action):
+    with OrgCache(ttl=ttl, session=kwargs["session"], max_workers=kwargs["max_workers"]) as org:
+        if not offline:
+            org.refresh()
+        scps = ScpEvaluator.from_cache(org) if effective or action else None
+        if action:
+            for account in org.find_accounts(find) if find else org.accounts():
+                decision = scps.evaluate(action, account["Id"])
+                print(json.dumps({
+                    "Id": account["Id"],
+                    "Name": account.get("Name"),
+                    "Action": action,
+                    "Allowed": decision.allowed,
+                    "DeniedBy": [dict(Sid=s.sid, PolicyId=s.policy_id, TargetId=s.target_id) for s in decision.denied_by],
+                    "NotAllowedAt": decision.not_allowed_at,
+                    "Conditional": [dict(Sid=s.sid, PolicyId=s.policy_id, TargetId=s.target_id)
+                                    for s in decision.conditional],
+                }))
+        elif find:
+            for account in org.find_accounts(find):
+                account.update(Path=org.path(account["Id"]), SCPs=org.scps_for_account(account["Id"]))
+                if effective:
+                    account["EffectivePolicy"] = scps.document(account["Id"])
+                print(json.dumps(account, default=str))
+        elif stream:
+            for unit in _walk(org.tree()):
+                print(json.dumps(unit, default=str))
+        else:
+            print(json.dumps(org.tree(), default=str))
+
+
+def _walk(units, parent_id=None):
+    """The nested tree as `iter_org_units` would stream it"""
+
+    for unit in units:
+        yield dict(unit, ParentId=parent_id, OrgUnits=[child["Id"] for child in unit["OrgUnits"]])
+        yield from _walk(unit["OrgUnits"], unit["Id"])
+
+
+if __name__ == "__main__":
+    org_tree()
@@ -0,0 +1,242 @@
+import json
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+Statement = namedtuple("Statement", ["sid", "effect", "actions", "not_actions", "resources", "not_resources",
+                                     "condition", "policy_id", "policy_name", "target_id"])
+Statement.__doc__ = """An SCP statement with its source: the policy it's from and the root, OU or account it's
+attached to.  Actions and resources are tuples of patterns."""
+
+Decision = namedtuple("Decision", ["allowed", "denied_by", "not_allowed_at", "conditional"])
+Decision.__doc__ = """Whether SCPs allow an action in an account.
+
+    denied_by: The Deny statements that match.
+    not_allowed_at: The roots, OUs or accounts on the path that have no Allow statement for the action.
+    conditional: Matching statements with a `Condition`, which can't be evaluated offline.  Assumed to allow and not
+        deny (or the reverse if `strict`).
+"""
+
+
+class ScpEvaluator:
+    """Evaluates the service control policies of every account offline.
+
+    An action is allowed in an account if an Allow statement matches it at every level of its path (the root, each OU
+    and the account itself) and no Deny statement matches at any level.  Each policy document is parsed once however
+    many targets it's attached to, and each level is indexed by action once and shared by everything below it.
+    Decisions are memoised per level, so asking about every account costs little more than asking about one OU.
+    SCPs don't restrict the management account, so everything is allowed there.
+
+    Args:
+        tree (list): Roots nested as from `build_org_tree` or `OrgCache.tree()`.
+        attachments (dict): {target Id: [policy Id, ...]} for roots, OUs and accounts.
+        documents (dict): {policy Id: (Name, policy document as a JSON string)}.
+
+    Kwargs:
+        management_account (str): The Id of the organisation's management account.
+
+    Example:
+        >>> with OrgCache() as org:
+        ...     scps = ScpEvaluator.from_cache(org)
+        >>> scps.is_allowed('s3:PutObject', '123456789012')
+        False
+        >>> scps.evaluate('s3:PutObject', '123456789012').denied_by[0].target_id
+        'ou-ab12-cdefgh34'
+    """
+
+    def __init__(self, tree, attachments, documents, management_account=None):
+        self.management_account = management_account
+        self._attachments = attachments
+        self._documents = documents
+        self._accounts = {}
+        for root in tree:
+            self._add(root, None)
+
+    @classmethod
+    def from_cache(cls, cache):
+        """From an `OrgCache`, without network calls.  `refresh()` it first for an up to date answer"""
+
+        return cls(cache.tree(), cache.attachments(), cache.policy_documents(), cache.management_account())
+
+    def _add(self, unit, parent):
+        """One pass down the tree.  Each node extends its parent's levels rather than copying them"""
+
+        node = _Node(self._level(unit["Id"]), parent)
+        for account in unit["Accounts"]:
+            self._accounts[account["Id"]] = _Node(self._level(account["Id"]), node)
+        for child in unit["OrgUnits"]:
+            self._add(child, node)
+
+    def _level(self, target_id):
+        statements = []
+        for policy_id in self._attachments.get(target_id, []):
+            try:
+                name, content = self._documents[policy_id]
+            except KeyError:
+                raise RuntimeError(f"No document for policy {policy_id}. Refresh the cache") from None
+            statements.extend(Statement(*statement, policy_id, name, target_id) for statement in _parse(content))
+        return _Level(target_id, statements)
+
+    def accounts(self):
+        """The Ids of every account"""
+
+        return list(self._accounts)
+
+    def evaluate(self, action, account_id, resource="*", strict=False):
+        """The `Decision` for `action` (e.g 's3:PutObject') on `resource` (an ARN, or '*' for any) in an account.
+
+        Conditions can't be evaluated offline.  By default a statement with a `Condition` is assumed to hold for
+        an Allow and not for a Deny; `strict` assumes the opposite.  Either way they are listed in `conditional`.
+        The management account is always allowed.
+        """
+
+        node = self._node(account_id)
+        if account_id == self.management_account:
+            return Decision(True, [], [], [])
+        denied, not_allowed, conditional = node.evaluate((action.lower(), resource, strict))
+        return Decision(not denied and not not_allowed, list(denied), list(not_allowed), list(conditional))
+
+    def is_allowed(self, action, account_id, resource="*", strict=False):
+        return self.evaluate(action, account_id, resource, strict).allowed
+
+    def allowed_accounts(self, action, resource="*", strict=False):
+        """{account Id: allowed} for every account"""
+
+        return {account_id: self.is_allowed(action, account_id, resource, strict) for account_id in self._accounts}
+
+    def statements(self, account_id):
+        """Every SCP statement that applies to an account, root first, each with the policy and target it's from"""
+
+        node, levels = self._node(account_id), []
+        while node:
+            levels.insert(0, node.level)
+            node = node.parent
+        return [statement for level in levels for statement in level.statements]
+
+    def document(self, account_id):
+        """The statements that apply to an account as one policy document, each with its `Source`.  For reading: a
+        statement only allows at its own level, so this isn't a policy that could be attached as it is.
+        """
+
+        keys = (("Action", "actions"), ("NotAction", "not_actions"), ("Resource", "resources"),
+                ("NotResource", "not_resources"))
+        statements = []
+        for statement in self.statements(account_id):
+            entry = {"Sid": statement.sid, "Effect": statement.effect}
+            entry.update((key, list(getattr(statement, field))) for key, field in keys if getattr(statement, field))
+            if statement.condition:
+                entry["Condition"] = statement.condition
+            entry["Source"] = {"PolicyId": statement.policy_id, "PolicyName": statement.policy_name,
+                               "TargetId": statement.target_id}
+            statements.append({k: v for k, v in entry.items() if v is not None})
+        return {"Version": "2012-10-17", "Statement": statements}
+
+    def _node(self, account_id):
+        try:
+            return self._accounts[account_id]
+        except KeyError:
+            raise ValueError(f"Account {account_id} is not in the organisation") from None
+
+
+class _Node:
+    """A root, OU or account: its own level and its parent's node"""
+
+    def __init__(self, level, parent):
+        self.level = level
+        self.parent = parent
+        self._memo = {}
+
+    def evaluate(self, key):
+        """(denied_by, not_allowed_at, conditional) for the path down to this node"""
+
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        inherited = self.parent.evaluate(key) if self.parent else ((), (), ())
+        result = self._memo[key] = tuple(a + b for a, b in zip(inherited, self.level.evaluate(*key)))
+        return result
+
+
+class _Level:
+    """The statements attached to one target, indexed by action"""
+
+    def __init__(self, target_id, statements):
+        self.target_id = target_id
+        self.statements = statements
+        self.allow = _Index(s for s in statements if s.effect == "Allow")
+        self.deny = _Index(s for s in statements if s.effect == "Deny")
+
+    def evaluate(self, action, resource, strict):
+        denied, conditional, allowed = [], [], False
+        for statement in self.deny.match(action):
+            if _matches_resource(statement, resource):
+                if statement.condition:
+                    conditional.append(statement)
+                if strict or not statement.condition:
+                    denied.append(statement)
+        for statement in self.allow.match(action):
+            if _matches_resource(statement, resource):
+                if statement.condition:
+                    conditional.append(statement)
+                allowed = allowed or not (strict and statement.condition)
+        return tuple(denied), () if allowed else (self.target_id,), tuple(conditional)
+
+
+class _Index:
+    """Statements by action: exact names in a dict, wildcards and NotAction scanned.  Lookups are memoised"""
+
+    def __init__(self, statements):
+        self.exact = {}
+        self.patterns = []  # (regex, statement)
+        self.not_actions = []  # ([regex, ...], statement)
+        self._matches = {}
+        for statement in statements:
+            for action in statement.actions:
+                if "*" in action or "?" in action:
+                    self.patterns.append((_glob(action.lower()), statement))
+                else:
+                    self.exact.setdefault(action.lower(), []).append(statement)
+            if statement.not_actions:
+                self.not_actions.append(([_glob(a.lower()) for a in statement.not_actions], statement))
+
+    def match(self, action):
+        try:
+            return self._matches[action]
+        except KeyError:
+            pass
+        found = list(self.exact.get(action, []))
+        found.extend(s for regex, s in self.patterns if regex.fullmatch(action) and s not in found)
+        found.extend(s for regexes, s in self.not_actions if not any(r.fullmatch(action) for r in regexes))
+        self._matches[action] = found
+        return found
+
+
+def _matches_resource(statement, resource):
+    if statement.not_resources:
+        return not any(_glob(r).fullmatch(resource) for r in statement.not_resources)
+    return any(_glob(r).fullmatch(resource) for r in statement.resources or ("*",))
+
+
+@lru_cache(maxsize=None)
+def _glob(pattern):
+    return re.compile("".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern))
+
+
+@lru_cache(maxsize=None)
+def _parse(content):
+    """A policy document's statements as tuples.  Cached by content, so an SCP is parsed once"""
+
+    document = json.loads(content)
+    statements = document["Statement"]
+    if isinstance(statements, dict):
+        statements = [statements]
+    return tuple((s.get("Sid"), s["Effect"], _tuple(s.get("Action")), _tuple(s.get("NotAction")),
+                  _tuple(s.get("Resource")), _tuple(s.get("NotResource")), s.get("Condition"))
+                 for s in statements)
+
+
+def _tuple(value):
+    if value is None:
+        return ()
+    return (value,) if isinstance(value, str) else tuple(value)
@@ -0,0 +1,204 @@
+import logging
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+
+from tlx.util import AdaptiveSemaphore, get_client, paginate_pages
+
+logger = logging.getLogger(__name__)
+
+# Organizations allows few requests per second per account.  Retried, with fewer calls at once
+_THROTTLE_ERRORS = {"TooManyRequestsException", "Throttling", "ThrottlingException", "ServiceException"}
+
+
+def iter_org_units(client=None, session=None, max_workers=8, accounts=True, scps=True, max_retries=10,
+                   backoff_base=0.2, backoff_cap=20):
+    """Walks the organisation concurrently and yields each root and OU as soon as it is resolved:
+
+        {"Name", "Id", "Arn", "ParentId", "Accounts": [...], "SCPs": [...], "OrgUnits": [child OU ids]}
+
+    Parents are yielded before their children.  Every listing is paginated.  At most `max_workers` calls are made
+    at once, fewer while Organizations is throttling (`TooManyRequestsException`), and throttled calls resume from
+    the page they stopped at after a backoff with full jitter.
+
+    Kwargs (all optional):
+        client: An organizations client.  Default: one from `tlx.util.get_client` for `session` with a connection
+            pool of `max_workers`.
+        session (boto3.session.Session): e.g a `tlx.util.Session` for the management account.
+        accounts (bool): List the accounts of each unit.  `Accounts` is empty if not.
+        scps (bool): List the service control policies attached to each unit.  `SCPs` is empty if not.
+    """
+
+    client = client or _client(session, max_workers)
+    org = _Lister(client, AdaptiveSemaphore(max_workers), max_retries, backoff_base, backoff_cap)
+
+    fields = [("OrgUnits", org.org_units)]
+    if accounts:
+        fields.append(("Accounts", org.accounts))
+    if scps:
+        fields.append(("SCPs", org.scps))
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    pending = {}  # future: (record, field)
+    outstanding = {}  # Id: fields still to fetch
+    waiting = defaultdict(list)  # Parent Id: resolved children, yielded after their parent
+    yielded = set()
+
+    def _release(record):
+        ready = [record]
+        while ready:
+            record = ready.pop(0)
+            yielded.add(record["Id"])
+            ready.extend(waiting.pop(record["Id"], []))
+            yield record
+
+    def _start(unit, parent_id):
+        record = {"Name": unit["Name"], "Id": unit["Id"], "Arn": unit["Arn"], "ParentId": parent_id,
+                  "Accounts": [], "SCPs": [], "OrgUnits": []}
+        outstanding[unit["Id"]] = len(fields)
+        for field, fetch in fields:
+            pending[pool.submit(fetch, unit["Id"])] = (record, field)
+
+    try:
+        for root in org.roots():
+            _start(root, None)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record, field = pending.pop(future)
+                value = future.result()
+                if field == "OrgUnits":
+                    for unit in value:
+                        _start(unit, record["Id"])
+                    value = [unit["Id"] for unit in value]
+                record[field] = value
+                outstanding[record["Id"]] -= 1
+                if not outstanding[record["Id"]]:
+                    del outstanding[record["Id"]]
+                    if record["ParentId"] is None or record["ParentId"] in yielded:
+                        yield from _release(record)
+                    else:
+                        waiting[record["ParentId"]].append(record)
+    finally:  # Also when the caller stops early
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def build_org_tree(**kwargs):
+    """The whole organisation as a list of roots, each nested like:
+
+        {"Name", "Id", "Arn", "Accounts": [...], "SCPs": [...], "OrgUnits": [<nested OUs>]}
+
+    Takes the same `kwargs` as `iter_org_units`.
+    """
+
+    records = {record["Id"]: record for record in iter_org_units(**kwargs)}
+
+    def _nest(record):
+        return {
+            "Name": record["Name"],
+            "Id": record["Id"],
+            "Arn": record["Arn"],
+            "Accounts": record["Accounts"],
+            "SCPs": record["SCPs"],
+            "OrgUnits": [_nest(records[child]) for child in record["OrgUnits"]],
+        }
+
+    return [_nest(r) for r in sorted(records.values(), key=lambda r: r["Id"]) if r["ParentId"] is None]
+
+
+def _client(session, max_workers):
+    """Pooled to match the workers.  botocore's retries are off so that throttling reaches the `_Lister`, which
+    retries it and transient errors itself
+    """
+
+    return get_client("organizations", session=session, max_pool_connections=max_workers, max_attempts=0)
+
+
+class _Lister:
+    """Complete listings from Organizations within an `AdaptiveSemaphore`, retrying throttled pages with fewer calls
+    at once, and pages that failed with a server (5xx) or connection error
+    """
+
+    def __init__(self, client, limit, max_retries, backoff_base, backoff_cap):
+        self.client = client
+        self.limit = limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    def org_units(self, parent_id):
+        return self.list(self.client.list_organizational_units_for_parent, "OrganizationalUnits", ParentId=parent_id)
+
+    def accounts(self, parent_id):
+        return self.list(self.client.list_accounts_for_parent, "Accounts", ParentId=parent_id)
+
+    def scps(self, target_id):
+        return self.list(self.client.list_policies_for_target, "Policies", TargetId=target_id,
+                         Filter="SERVICE_CONTROL_POLICY")
+
+    def roots(self):
+        return self.list(self.client.list_roots, "Roots")
+
+    def policies(self):
+        return self.list(self.client.list_policies, "Policies", Filter="SERVICE_CONTROL_POLICY")
+
+    def targets(self, policy_id):
+        return self.list(self.client.list_targets_for_policy, "Targets", PolicyId=policy_id)
+
+    def document(self, policy_id):
+        return self.call(self.client.describe_policy, PolicyId=policy_id)["Policy"]["Content"]
+
+    def organization(self):
+        return self.call(self.client.describe_organization)["Organization"]
+
+    def call(self, method, **kwargs):
+        def _call():
+            response = method(**kwargs)
+            self.limit.succeeded()
+            return response
+
+        return self._retry(method, _call)
+
+    def list(self, method, result_key, **kwargs):
+        results, token = [], None
+
+        def _list():
+            nonlocal token
+            for page, token in paginate_pages(method, starting_token=token, **kwargs):
+                results.extend(page.get(result_key, []))
+                self.limit.succeeded()
+            return results
+
+        return self._retry(method, _list)
+
+    def _retry(self, method, fetch):
+        """`fetch()` within the semaphore.  A throttled or failed listing resumes from the page it stopped at"""
+
+        attempt = 0
+        while True:
+            try:
+                with self.limit:
+                    return fetch()
+            except ClientError as ce:
+                throttled = ce.response["Error"]["Code"] in _THROTTLE_ERRORS
+                server_error = ce.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+                if not (throttled or server_error) or attempt >= self.max_retries:
+                    raise
+                error = ce
+            except (BotoConnectionError, HTTPClientError) as e:  # e.g a timeout or reset connection
+                if attempt >= self.max_retries:
+                    raise
+                throttled, error = False, e
+            if throttled:
+                self.limit.throttled()
+            attempt += 1
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            logger.debug(f"{error!r} on {method.__name__}. Retry {attempt} in {delay:.2f}s")
+            time.sleep(delay)
@@ -1,5 +1,5 @@
 # flake8: noqa F401         - import not used error
-from .session import Session
+from ._lazy import lazy_module
 from .logger import Logger, get_log
 from .verification import ensure_http_success
 from .helper import *
@@ -7,3 +7,11 @@ from .common import *
 from .singleton import Singleton
 
 name = 'util'
+
+
+# Imported on first use as they import boto3, which is slow
+lazy_module(__name__, {
+    "clients": ["clear_client_cache", "get_client", "get_resource"],
+    "fanout": ["AccountResult", "fan_out"],
+    "session": ["Session"],
+}, set_all=False)
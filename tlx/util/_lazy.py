@@ -0,0 +1,38 @@
+import importlib
+import sys
+
+
+def lazy_module(name, submodules, set_all=True):
+    """Lets a package export the public names of its submodules while importing each submodule only on first use
+    (PEP 562), so that importing the package doesn't pay for e.g boto3.  Call from the package's `__init__`.
+
+    Adds `__getattr__` and `__dir__` to the package, and `__all__` unless `set_all` is False (e.g a package that
+    also star-imports some of its modules).
+
+    Args:
+        name (str): The package's `__name__`.
+        submodules (dict): {submodule: [public name, ...]}.  Add new public names here.
+
+    e.g
+        >>> lazy_module(__name__, {"table": ["full_scan", "iter_scan"]})
+    """
+
+    package = sys.modules[name]
+    where = {attr: module for module, attrs in submodules.items() for attr in attrs}
+
+    def __getattr__(attr):
+        try:
+            module = importlib.import_module("." + where[attr], name)
+        except KeyError:
+            raise AttributeError(f"module {name!r} has no attribute {attr!r}") from None
+        value = getattr(module, attr)
+        setattr(package, attr, value)  # Later lookups don't come here
+        return value
+
+    def __dir__():
+        return sorted(set(vars(package)) | set(where))
+
+    package.__getattr__ = __getattr__
+    package.__dir__ = __dir__
+    if set_all:
+        package.__all__ = sorted(where)
@@ -0,0 +1,94 @@
+import threading
+import weakref
+
+import boto3
+from botocore.config import Config
+
+_lock = threading.Lock()
+_cache = {}
+_session_caches = weakref.WeakKeyDictionary()  # Session: its own cache, dropped with the session
+
+
+def get_client(service, session=None, region=None, profile=None, endpoint_url=None, **config):
+    """Returns a boto3 client for `service`, created once per process and reused.  e.g across warm Lambda
+    invocations, where creating a client (and its connection pool) for every call is a large part of the latency.
+
+    Clients are cached by service, session, region, profile, endpoint and config.  Those of a session are dropped
+    when the session is (e.g one per account in `fan_out`).  Creation is thread-safe and the clients themselves may be
+    shared between threads.
+
+    Kwargs (all optional):
+        session (boto3.session.Session): e.g a `tlx.util.Session` with an assumed role.  Not to be used with `profile`.
+            Defaults to a session for `profile` or else boto3's default session.
+        region (str): An AWS region.  Defaults to that of the session.
+        profile (str): A profile from the AWS config files.
+        endpoint_url (str): e.g 'http://localhost:8000' for DynamoDB local.
+        config: botocore `Config` options:
+            max_pool_connections (int): Connections kept open to the service.  10 by default.
+            tcp_keepalive (bool): Send TCP keep-alive packets on idle connections.
+            retry_mode (str): 'legacy', 'standard' or 'adaptive'.
+            max_attempts (int): Retries per request, not counting the first attempt.
+            or anything else `botocore.config.Config` takes.
+
+    Example:
+        >>> ddb = get_client('dynamodb', max_pool_connections=50, retry_mode='adaptive')
+    """
+    return _cached("client", service, session, region, profile, endpoint_url, config)
+
+
+def get_resource(service, session=None, region=None, profile=None, endpoint_url=None, **config):
+    """Returns a boto3 resource for `service`, created once per process and reused.  Takes the same arguments as
+    `get_client`.
+
+    Resource objects are not thread-safe (their `meta.client` is), so share the client between threads rather than
+    the resource.
+
+    Example:
+        >>> table = get_resource('dynamodb', session=Session(role=role_arn)).Table('Users')
+    """
+    return _cached("resource", service, session, region, profile, endpoint_url, config)
+
+
+def clear_client_cache():
+    """Forgets all cached clients, resources and sessions.  e.g after changing credentials in the environment"""
+
+    with _lock:
+        _cache.clear()
+        _session_caches.clear()
+
+
+def _cached(kind, service, session, region, profile, endpoint_url, config):
+    if session is not None and profile:
+        raise AttributeError("Either a session or a profile should be given. Not both.")
+
+    key = (kind, service, region, profile, endpoint_url, repr(sorted(config.items())))
+    try:
+        return (_cache if session is None else _session_caches[session])[key]
+    except KeyError:
+        pass
+
+    with _lock:  # boto3 sessions are not thread-safe
+        cache = _cache if session is None else _session_caches.setdefault(session, {})
+        if key not in cache:
+            owner = session or _session(profile)
+            create = owner.client if kind == "client" else owner.resource
+            cache[key] = create(service, region_name=region, endpoint_url=endpoint_url, config=_config(**config))
+        return cache[key]
+
+
+def _session(profile):
+    """A shared session per profile.  Needs `_lock`"""
+
+    if profile is None:
+        return boto3._get_default_session()
+    key = ("session", profile)
+    if key not in _cache:
+        _cache[key] = boto3.session.Session(profile_name=profile)
+    return _cache[key]
+
+
+def _config(retry_mode=None, max_attempts=None, **options):
+    retries = {k: v for k, v in (("mode", retry_mode), ("max_attempts", max_attempts)) if v is not None}
+    if retries:
+        options["retries"] = retries
+    return Config(**options) if options else None
@@ -3,7 +3,7 @@ import random
 from uuid import uuid4
 
 
-def string_from_datetime(dt_obj, sep=None, timespec='milliseconds'):
+def string_from_datetime(dt_obj, sep='T', timespec='milliseconds'):
     """string format from python datetime"""
     # Pandas datetime is not yet implimenting `timespec`
     # https://github.com/pandas-dev/pandas/issues/26131
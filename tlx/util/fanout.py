@@ -0,0 +1,81 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import ClientError
+
+from tlx.util.session import Session
+
+logger = logging.getLogger(__name__)
+
+AccountResult = namedtuple("AccountResult", ["account", "result", "error"])
+AccountResult.__doc__ = """The outcome of `func` for one account.  `error` is the exception raised, if any, else None"""
+
+_ACCOUNT_ID = re.compile(r"^\d{12}$")
+_THROTTLE_ERRORS = {"Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequestsException"}
+
+
+def fan_out(func, accounts, role_name="OrganizationAccountAccessRole", region=None, max_workers=32,
+            max_assume_concurrency=8, ordered=False, max_retries=8, backoff_base=0.1, backoff_cap=10):
+    """Runs `func(session, account)` for every account concurrently, each with a `Session` for a role in that
+    account.  Yields an `AccountResult` per account as they complete (or in the order of `accounts` if `ordered`).
+
+    A failure in one account (assuming the role or in `func`) is returned as that account's `error` rather than
+    stopping the others.  Throttled STS calls are retried with exponential backoff and full jitter, and at most
+    `max_assume_concurrency` are made at once.  Roles are assumed with the default credentials (e.g `AWS_PROFILE`)
+    and their credentials are cached like any `Session(role=...)`.
+
+    Args:
+        func (callable): Called as `func(session, account)` in a thread pool.  Its return value is the `result`.
+        accounts (iterable): 12 digit account IDs, which use the role `role_name`, or role ARNs.
+        role_name (str): The role to assume in accounts given by ID.
+        region (str): The region of the sessions.
+        max_workers (int): Accounts in progress at once.
+
+    Example:
+        >>> def buckets(session, account):
+        ...     return [b['Name'] for b in session.client('s3').list_buckets()['Buckets']]
+        >>> for account, result, error in fan_out(buckets, ['123456789012', '210987654321']):
+        ...     print(account, error or result)
+    """
+
+    accounts = list(accounts)
+    assume_slots = threading.Semaphore(max_assume_concurrency)
+
+    def _run(account):
+        try:
+            role = account if not _ACCOUNT_ID.match(str(account)) else f"arn:aws:iam::{account}:role/{role_name}"
+            session = _assume(role, region, assume_slots, max_retries, backoff_base, backoff_cap)
+            return AccountResult(account, func(session, account), None)
+        except Exception as e:  # Isolated to this account  # pylint: disable=broad-except
+            logger.debug(f"{account}: {e!r}")
+            return AccountResult(account, None, e)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [pool.submit(_run, account) for account in accounts]
+    try:
+        for future in futures if ordered else as_completed(futures):
+            yield future.result()
+    finally:  # The caller may stop early
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def _assume(role, region, assume_slots, max_retries, backoff_base, backoff_cap):
+    attempt = 0
+    while True:
+        try:
+            with assume_slots:
+                return Session(role=role, region=region)
+        except ClientError as ce:
+            if ce.response["Error"]["Code"] not in _THROTTLE_ERRORS or attempt >= max_retries:
+                raise
+        attempt += 1
+        delay = random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+        logger.debug(f"Throttled assuming {role}. Retry {attempt} in {delay:.2f}s")
+        time.sleep(delay)
@@ -1,4 +1,10 @@
-def paginate(method, **kwargs):
+import queue
+import threading
+
+__all__ = ["AdaptiveSemaphore", "apaginate", "paginate", "paginate_pages", "paginate_parallel", "prefetch"]
+
+
+def paginate(method, prefetch_pages=0, starting_token=None, **kwargs):
     """ Automatically paginates through result lists regardless of what type of marker/token/continuation
         AWS decided to use on that service. Will raise `OperationNotPageableError` if the operation is
         not pagable.
@@ -9,13 +15,273 @@ def paginate(method, **kwargs):
             >>> all_stacks = [ s for s in paginate(cfn.list_stacks)]  # `NextToken`
             >>> all_roles = [r for r in paginate(iam.list_roles)]  # `Marker`
             >>> all_objects = [ob for ob in paginate(s3.list_objects, Bucket=bucket_name, MaxKeys=10)]
+
+        Set `prefetch_pages` to fetch up to that many pages in a background thread while the caller processes the
+        current one.  `starting_token` resumes a listing (see `paginate_pages`).  Operations with several result
+        keys (e.g `Contents` and `CommonPrefixes`) yield the results of each page in key order.
+    """
+
+    page_iterator = _page_iterator(method, starting_token, **kwargs)
+    for page, _ in prefetch(_pages(page_iterator), size=prefetch_pages):
+        yield from _results(page_iterator.result_keys, page)
+
+
+def paginate_pages(method, prefetch_pages=0, starting_token=None, **kwargs):
+    """ Like `paginate` but yields each whole response page with the token to resume the listing after it.
+        The token is None after the last page.  Pass it as `starting_token` to continue where a failed or
+        interrupted listing stopped.
+
+        e.g
+            >>> token = load_checkpoint()
+            >>> for page, token in paginate_pages(s3.list_objects_v2, Bucket=bucket, starting_token=token):
+            ...     process(page['Contents'])
+            ...     save_checkpoint(token)
+    """
+
+    return prefetch(_pages(_page_iterator(method, starting_token, **kwargs)), size=prefetch_pages)
+
+
+async def apaginate(method, pages=False, executor=None, starting_token=None, **kwargs):
+    """ Async version of `paginate` (or `paginate_pages` if `pages`).  The blocking API calls run in `executor`
+        (default: the loop's) and the next page is fetched while the caller processes the current one.
+
+        e.g
+            >>> async for account in apaginate(org.list_accounts_for_parent, ParentId=ou_id, executor=pool):
+            ...     print(account['Id'])
+    """
+
+    import asyncio  # Slow to import. Only when needed
+
+    loop = asyncio.get_running_loop()
+    page_iterator = _page_iterator(method, starting_token, **kwargs)
+    results = _pages(page_iterator)
+
+    next_page = loop.run_in_executor(executor, next, results, None)
+    while True:
+        result = await next_page
+        if result is None:
+            return
+        next_page = loop.run_in_executor(executor, next, results, None)
+        if pages:
+            yield result
+        else:
+            for item in _results(page_iterator.result_keys, result[0]):
+                yield item
+
+
+def paginate_parallel(method, partitions=None, prefixes=None, segments=None, prefix_key="Prefix", max_workers=8,
+                      ordered=False, buffer_pages=2, **kwargs):
+    """ Paginates several partitions of a listing concurrently and merges their results into one iterator.
+        Give exactly one partitioning strategy:
+            partitions (list of dict): the kwargs of each partition, e.g log streams of a log group.
+            prefixes (list of str): one partition per prefix, passed as `prefix_key` (e.g `Prefix` for S3).
+            segments (int): a parallel scan with `Segment` and `TotalSegments` (e.g `dynamodb.scan`).
+        `kwargs` are passed to every partition.
+
+        At most `max_workers` partitions are walked at once, each holding up to `buffer_pages` pages ahead of the
+        caller.  Results are yielded as pages arrive unless `ordered`, in which case each partition's results are
+        yielded in turn, in partition order.  The first error raised by any partition is raised to the caller.
+
+        The partitions share the client of `method` and so its connection pool.  Give it at least `max_workers`
+        connections, e.g `tlx.util.get_client('s3', max_pool_connections=32)`.
+
+        e.g
+            >>> keys = [o['Key'] for o in paginate_parallel(s3.list_objects_v2, prefixes=list('0123456789abcdef'),
+            ...                                             Bucket=bucket, max_workers=16)]
+            >>> items = list(paginate_parallel(ddb.scan, segments=16, TableName='Users', max_workers=16))
     """
 
+    if sum(strategy is not None for strategy in (partitions, prefixes, segments)) != 1:
+        raise ValueError("Give exactly one of `partitions`, `prefixes` or `segments`")
+    if prefixes is not None:
+        partitions = [{prefix_key: prefix} for prefix in prefixes]
+    elif segments is not None:
+        partitions = [{"Segment": segment, "TotalSegments": segments} for segment in range(segments)]
+
+    stop = threading.Event()
+    done = object()
+    shared = queue.Queue(maxsize=buffer_pages * max_workers)
+    queues = [queue.Queue(maxsize=buffer_pages) if ordered else shared for _ in partitions]
+
+    def _put(results, value):
+        while not stop.is_set():
+            try:
+                results.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _walk(results, partition):
+        if stop.is_set():
+            return
+        try:
+            page_iterator = _page_iterator(method, **dict(kwargs, **partition))
+            for page, _ in _pages(page_iterator):
+                if not _put(results, (list(_results(page_iterator.result_keys, page)), None)):
+                    return  # The caller stopped
+        except BaseException as e:  # Handed to the caller
+            _put(results, (done, e))
+        else:
+            _put(results, (done, None))
+
+    def _drain(results, partitions_left):
+        while partitions_left:
+            items, error = results.get()
+            if error is not None:
+                raise error
+            if items is done:
+                partitions_left -= 1
+            else:
+                yield from items
+
+    from concurrent.futures import ThreadPoolExecutor  # Slow to import. Only when needed
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for results, partition in zip(queues, partitions):
+            pool.submit(_walk, results, partition)
+
+        if ordered:
+            for results in queues:
+                yield from _drain(results, 1)
+        else:
+            yield from _drain(shared, len(partitions))
+    finally:
+        stop.set()  # Releases the workers if the caller stops early
+        pool.shutdown(wait=False)
+
+
+def _page_iterator(method, starting_token=None, **kwargs):
     client = method.__self__
     paginator = client.get_paginator(method.__name__)
-    for page in paginator.paginate(**kwargs).result_key_iters():
+    if starting_token:
+        kwargs["PaginationConfig"] = dict(kwargs.get("PaginationConfig") or {}, StartingToken=starting_token)
+    return paginator.paginate(**kwargs)
+
+
+def _pages(page_iterator):
+    """ Each page with the token to resume after it, encoded the way botocore takes a `StartingToken` """
+
+    from botocore.paginate import TokenEncoder  # botocore is slow to import. Only when needed
+
+    encoder = TokenEncoder()
+    for page in page_iterator:
+        if page_iterator.resume_token:  # Stopped by `PaginationConfig.MaxItems`
+            yield page, page_iterator.resume_token
+            continue
+        next_token = page_iterator._get_next_token(page)  # No public equivalent
+        yield page, encoder.encode(next_token) if any(t is not None for t in next_token.values()) else None
+
+
+def _results(result_keys, page):
+    for result_key in result_keys:
+        results = result_key.search(page)
+        if results is not None:  # e.g no `CommonPrefixes`
+            yield from results
+
+
+def prefetch(iterable, size=1):
+    """ Iterates over `iterable` in a background thread, queueing at most `size` results ahead of the caller (plus
+        the one the thread is waiting to queue).
+        Useful to overlap network round trips (e.g fetching the next page) with processing the current one.
+        Exceptions raised while iterating are re-raised to the caller.
+
+        e.g
+            >>> for page in prefetch(pages_of_results, size=2):
+            ...     process(page)
+    """
+
+    if size < 1:
+        yield from iterable
+        return
+
+    results = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def _put(value):
+        while not stop.is_set():
+            try:
+                results.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
         try:
-            for result in page:
-                yield result
-        except TypeError:
-            pass
+            for result in iterable:
+                if not _put((result, None)):
+                    return
+        except BaseException as e:  # Handed to the caller
+            _put((done, e))
+        else:
+            _put((done, None))
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            result, error = results.get()
+            if error is not None:
+                raise error
+            if result is done:
+                return
+            yield result
+    finally:
+        stop.set()  # Releases the producer if the caller stops early
+
+
+class AdaptiveSemaphore:
+    """ A semaphore whose limit adapts to throttling by the service being called.  The limit is halved by
+        `throttled()` and grows back by one after each `limit` calls to `succeeded()`, up to the initial limit.
+
+        e.g
+            >>> limit = AdaptiveSemaphore(16)
+            >>> with limit:
+            ...     try:
+            ...         call_api()
+            ...         limit.succeeded()
+            ...     except TooManyRequestsException:
+            ...         limit.throttled()
+    """
+
+    def __init__(self, limit, minimum=1):
+        self.max_limit = limit
+        self.minimum = minimum
+        self.limit = limit
+        self._active = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def throttled(self):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._successes = 0
+
+    def succeeded(self):
+        with self._condition:
+            self._successes += 1
+            if self.limit < self.max_limit and self._successes >= self.limit:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify()
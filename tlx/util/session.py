@@ -1,125 +1,265 @@
-import os
-import boto3
-import logging
-from getpass import getpass
-from botocore.credentials import DeferredRefreshableCredentials
-from botocore.exceptions import ClientError
-
-
-class Session(boto3.session.Session):
-    """Returns an AWS session instance.  If no parameters are provided, keys from `.aws/credentials` 'default' profile are used.
-
-        Kwargs (all optional):
-            profile (str): A profile with API keys as configured in ~/.aws/credentials file. Not to be used with other parmeters.
-                If your role needs an MFA token you will be prompted for input.
-            region (str): An AWS region
-            role (str): AWS Arn of the role the user is assuming. If None, the users identity is used.
-            mfa_serial (str): AWS Arn of the users Multi-Factor authentication device.
-            mfa_token (str): 6 digit Multi-Factor Authentication code.
-
-        Example:
-            session = Session()
-            s3client = session.client('s3')
-
-
-        NB: If you already have AWS environment variables in the root shell they will take precedence. Override them by specifing any arguments.
-    """
-
-    def __init__(self, profile=None, region=None, role=None, mfa_serial=None, mfa_token=None):
-        if profile and role:
-            raise AttributeError("Either a profile should be used OR a role assumed. Not both.")
-
-        params = {
-            'region_name': region,
-        }
-
-        # 1. Allow pass through if env vars already exist - Dont need extra params boto will get them
-        temp_creds_already_exist = len(
-            {'AWS_SECRET_ACCESS_KEY', 'AWS_ACCESS_KEY_ID', 'AWS_SESSION_TOKEN'}.intersection(os.environ)
-        ) == 3
-        if temp_creds_already_exist:
-            pass  # this is all we need  TODO: test on expired ones
-
-        # 2. If assuming a role get temp creds
-        if role:  # ! Not `elif` because role should override
-            creds = _assume_role(role, mfa_serial, mfa_token)
-            params.update({
-                'aws_access_key_id': creds['AccessKeyId'],
-                'aws_secret_access_key': creds['SecretAccessKey'],
-                'aws_session_token': creds['SessionToken'],
-            })
-        # 4. If pofile is user profile and has mfa, populate env var params like role
-        profile_mfa_serial = _get_mfa_serial_if_user(profile) if profile and not temp_creds_already_exist else None
-        if profile_mfa_serial:
-            if not mfa_token:
-                mfa_token = getpass(f'Enter MFA code for {profile_mfa_serial}: ')
-
-            user_base_session = boto3.session.Session(profile_name=profile)
-            creds = user_base_session.client('sts').get_session_token(
-                SerialNumber=profile_mfa_serial,
-                TokenCode=mfa_token,
-            )['Credentials']
-            params.update({
-                'aws_access_key_id': creds['AccessKeyId'],
-                'aws_secret_access_key': creds['SecretAccessKey'],
-                'aws_session_token': creds['SessionToken'],
-            })
-
-        # 3. If profile add it to input params
-        elif profile:
-            params['profile_name'] = profile
-
-        try:
-            boto3.session.Session.__init__(self, **{k: v for k, v in params.items() if v})
-        except ClientError as e:
-            logging.error("Do the API keys in `~/.aws/credentials` match those required? \n{}".format(e))
-
-    def get_session_creds(self):
-        creds = self.get_credentials()
-
-        if isinstance(creds, DeferredRefreshableCredentials):
-            # prompt for MFA token
-            creds = creds.get_frozen_credentials()
-
-        return creds
-
-
-def _get_mfa_serial_if_user(profile):
-    """Finds users mfa_serial from ~/.aws/credentials"""
-
-    profile = profile or 'default'
-    correct_profile = False
-    is_user_profile = None  # Should return None if Role profile
-    identified_mfa_serial = None
-
-    with open(os.path.expanduser('~/.aws/credentials'), 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith(f"[{profile}]"):
-                correct_profile = True
-            elif correct_profile and line.startswith('mfa_serial'):
-                identified_mfa_serial = line.split('=')[-1].strip()
-            elif correct_profile and line.startswith('aws_access_key_id'):
-                is_user_profile = True
-            elif correct_profile and line.startswith("["):  # New profile block. Search complete.
-                break  
-
-    if not correct_profile:
-        msg = f"Profile '{profile}' not found.  Typo?"
-        raise Exception(msg)
-
-    if is_user_profile:
-        return identified_mfa_serial
-    # Otherwise we have found a Role or other that will automatically pick
-    # up the MFA by boto
-    return None
-
-
-def _assume_role(role, mfa_serial, mfa_token):
-    params = {
-        "RoleArn": role,
-        "RoleSessionName": role,
-        "SerialNumber": mfa_serial,
-        "TokenCode": mfa_token
-    }
-    return boto3.client('sts').assume_role(**{k: v for k, v in params.items() if v})['Credentials']
+import configparser
+import datetime as dt
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import weakref
+from collections import defaultdict
+
+import boto3
+import logging
+from getpass import getpass
+from botocore.credentials import DeferredRefreshableCredentials, RefreshableCredentials
+from botocore.exceptions import ClientError
+from botocore.utils import JSONFileCache, parse_timestamp
+
+from tlx.util.clients import get_client
+
+# Shared with the AWS CLI, which uses the same file format and, for assumed roles, the same keys
+CACHE_DIR = os.path.expanduser(os.path.join('~', '.aws', 'cli', 'cache'))
+# Credentials this close to expiry are replaced. botocore's advisory refresh window
+REFRESH_MARGIN = dt.timedelta(minutes=15)
+
+_memory_cache = {}
+_cache_lock = threading.Lock()
+_key_locks = defaultdict(threading.Lock)  # So one key's STS call doesn't hold up others
+_refresh_timers = {}
+_refresh_users = defaultdict(weakref.WeakSet)  # Key: the sessions that use it. Refreshed while any are alive
+
+
+class Session(boto3.session.Session):
+    """Returns an AWS session instance.  If no parameters are provided, keys from `.aws/credentials` 'default' profile are used.
+
+        Kwargs (all optional):
+            profile (str): A profile with API keys as configured in ~/.aws/credentials file. Not to be used with other parmeters.
+                If your role needs an MFA token you will be prompted for input.
+            region (str): An AWS region
+            role (str): AWS Arn of the role the user is assuming. If None, the users identity is used.
+            mfa_serial (str): AWS Arn of the users Multi-Factor authentication device.
+            mfa_token (str): 6 digit Multi-Factor Authentication code.
+            cache (bool): Reuse temporary credentials from memory or the AWS CLI cache (`~/.aws/cli/cache`) until
+                they are within `REFRESH_MARGIN` of expiry, and save new ones there.  Default True.
+                Credentials for a role assumed without MFA are also refreshed in the background before they expire,
+                for as long as a session uses them.
+
+        Example:
+            session = Session()
+            s3client = session.client('s3')
+
+
+        NB: If you already have AWS environment variables in the root shell they will take precedence. Override them by specifing any arguments.
+    """
+
+    def __init__(self, profile=None, region=None, role=None, mfa_serial=None, mfa_token=None, cache=True):
+        if profile and role:
+            raise AttributeError("Either a profile should be used OR a role assumed. Not both.")
+
+        params = {
+            'region_name': region,
+        }
+
+        # 1. Allow pass through if env vars already exist - Dont need extra params boto will get them
+        temp_creds_already_exist = len(
+            {'AWS_SECRET_ACCESS_KEY', 'AWS_ACCESS_KEY_ID', 'AWS_SESSION_TOKEN'}.intersection(os.environ)
+        ) == 3
+        if temp_creds_already_exist:
+            pass  # this is all we need  TODO: test on expired ones
+
+        # 2. If assuming a role get temp creds
+        refreshable = None
+        if role:  # ! Not `elif` because role should override
+            # tlx's session name is a default, which the AWS CLI leaves out of the key. See `_cache_key`
+            cache_args = {'RoleArn': role, 'SerialNumber': mfa_serial}
+            fetch = functools.partial(_assume_role, role, mfa_serial, mfa_token)
+            # A new MFA token would be needed to refresh
+            creds = _cached_credentials(cache_args, fetch, cache, refresh_for=None if mfa_serial else self)
+            params.update(_session_params(creds))
+            if not mfa_serial:
+                refreshable = functools.partial(_cached_credentials, cache_args, fetch, cache)
+        # 4. If pofile is user profile and has mfa, populate env var params like role
+        profile_mfa_serial = _get_mfa_serial_if_user(profile) if profile and not temp_creds_already_exist else None
+        if profile_mfa_serial:
+            def fetch():
+                token = mfa_token or getpass(f'Enter MFA code for {profile_mfa_serial}: ')
+                user_base_session = boto3.session.Session(profile_name=profile)
+                return user_base_session.client('sts').get_session_token(
+                    SerialNumber=profile_mfa_serial,
+                    TokenCode=token,
+                )['Credentials']
+
+            creds = _cached_credentials({'Profile': profile, 'SerialNumber': profile_mfa_serial}, fetch, cache)
+            params.update(_session_params(creds))
+
+        # 3. If profile add it to input params
+        elif profile:
+            params['profile_name'] = profile
+
+        try:
+            boto3.session.Session.__init__(self, **{k: v for k, v in params.items() if v})
+        except ClientError as e:
+            logging.error("Do the API keys in `~/.aws/credentials` match those required? \n{}".format(e))
+
+        if refreshable:  # Long lived sessions pick up the refreshed credentials rather than expiring
+            self._session._credentials = RefreshableCredentials.create_from_metadata(
+                _credential_metadata(creds), lambda: _credential_metadata(refreshable()), 'assume-role')
+
+    def get_session_creds(self):
+        creds = self.get_credentials()
+
+        if isinstance(creds, DeferredRefreshableCredentials):
+            # prompt for MFA token
+            creds = creds.get_frozen_credentials()
+
+        return creds
+
+
+def _get_mfa_serial_if_user(profile):
+    """Finds users mfa_serial from ~/.aws/credentials"""
+
+    profile = profile or 'default'
+    credentials = _read_credentials_file(os.path.expanduser('~/.aws/credentials'))
+
+    if not credentials.has_section(profile):
+        msg = f"Profile '{profile}' not found.  Typo?"
+        raise Exception(msg)
+
+    if credentials.has_option(profile, 'aws_access_key_id'):  # A user profile
+        return credentials.get(profile, 'mfa_serial', fallback=None)
+    # Otherwise we have found a Role or other that will automatically pick
+    # up the MFA by boto
+    return None
+
+
+def _read_credentials_file(path):
+    return _parse_credentials_file(path, os.stat(path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_credentials_file(path, mtime):
+    """Parsed once per modification of the file"""
+
+    credentials = configparser.RawConfigParser()
+    credentials.read(path)
+    return credentials
+
+
+def _cached_credentials(args, fetch, cache=True, refresh_for=None):
+    """Temporary credentials for the STS call described by `args`.  From memory, the AWS CLI cache or `fetch()`.
+
+    The cache key is derived from `args` as by `_cache_key`.  With `refresh_for` (e.g a Session) they are
+    fetched again in the background before they expire, for as long as it or another `refresh_for` of the same key
+    is alive.  After that they are only fetched when next used.
+    """
+
+    key = _cache_key(args)
+    if not cache:
+        return fetch()
+
+    with _cache_lock:
+        key_lock = _key_locks[key]
+    with key_lock:
+        creds = _memory_cache.get(key) or _read_cache_file(key)
+        if creds is None or _expiring(creds):
+            creds = fetch()
+            _write_cache_file(key, creds)
+        _memory_cache[key] = creds
+        if refresh_for is not None:
+            _refresh_users[key].add(refresh_for)
+        if _refresh_users.get(key):
+            _schedule_refresh(key, fetch, creds)
+    return creds
+
+
+def _cache_key(args):
+    """The key the AWS CLI (botocore's `AssumeRoleCredentialFetcher`) gives the same `assume_role` arguments, so
+    that both share `CACHE_DIR`.  Like the CLI, leave a default `RoleSessionName` out of `args`
+    """
+
+    args = {k: v for k, v in args.items() if v}
+    return hashlib.sha1(json.dumps(args, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _read_cache_file(key):
+    try:
+        creds = dict(JSONFileCache(CACHE_DIR)[key]['Credentials'])
+        creds['Expiration'] = parse_timestamp(creds['Expiration'])
+        return creds
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _write_cache_file(key, creds):
+    try:
+        JSONFileCache(CACHE_DIR)[key] = {'Credentials': creds}
+    except OSError as e:
+        logging.warning(f"Could not cache credentials in {CACHE_DIR}: {e}")
+
+
+def _expiring(creds):
+    return creds['Expiration'] - dt.datetime.now(dt.timezone.utc) < REFRESH_MARGIN
+
+
+def _schedule_refresh(key, fetch, creds):
+    """Fetches new credentials before `creds` would be treated as expiring, and again after that while a session
+    uses them.  Needs the key's lock
+    """
+
+    def _refresh():
+        try:
+            with _key_locks[key]:
+                if not _refresh_users.get(key):  # Unused. `RefreshableCredentials` fetches them if ever needed
+                    _refresh_users.pop(key, None)
+                    _refresh_timers.pop(key, None)
+                    return
+                _memory_cache[key] = fetch()
+                _write_cache_file(key, _memory_cache[key])
+                _schedule_refresh(key, fetch, _memory_cache[key])
+        except Exception as e:  # The next use of the session will try again  # pylint: disable=broad-except
+            logging.warning(f"Background credential refresh failed: {e}")
+
+    previous = _refresh_timers.get(key)
+    if previous and previous.is_alive() and previous is not threading.current_thread():
+        return  # Already scheduled
+    delay = creds['Expiration'] - dt.datetime.now(dt.timezone.utc) - 2 * REFRESH_MARGIN
+    timer = _refresh_timers[key] = threading.Timer(max(delay.total_seconds(), 0), _refresh)
+    timer.daemon = True
+    timer.start()
+
+
+def _session_params(creds):
+    return {
+        'aws_access_key_id': creds['AccessKeyId'],
+        'aws_secret_access_key': creds['SecretAccessKey'],
+        'aws_session_token': creds['SessionToken'],
+    }
+
+
+def _credential_metadata(creds):
+    """In the form `RefreshableCredentials` takes"""
+
+    return {
+        'access_key': creds['AccessKeyId'],
+        'secret_key': creds['SecretAccessKey'],
+        'token': creds['SessionToken'],
+        'expiry_time': creds['Expiration'].isoformat(),
+    }
+
+
+def _assume_role(role, mfa_serial, mfa_token):
+    params = {
+        "RoleArn": role,
+        "RoleSessionName": _role_session_name(role),
+        "SerialNumber": mfa_serial,
+        "TokenCode": mfa_token
+    }
+    # The cached client is thread-safe, so many roles can be assumed at once. See `tlx.util.fanout`
+    return get_client('sts').assume_role(**{k: v for k, v in params.items() if v})['Credentials']
+
+
+def _role_session_name(role):
+    """The role's name, restricted to the characters STS allows (an ARN has ':' and '/')"""
+
+    return re.sub(r"[^\w+=,.@-]", "-", role.rsplit("/", 1)[-1])[:64]
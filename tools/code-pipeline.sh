@@ -368,9 +368,11 @@ export -f cp-update
 
 cp-execs() {
     if [[ "$*" == *"--help"* ]]; then
-        code-pipeline-executions --help
+        echo "Usage: cp-execs [pipeline_name] [count] [cp-executions options]"
+        cp-executions --help
         return 0
     fi
-    code-pipeline-executions "$@" | jq -c '.[]'
+    # Positional count as in `code-pipeline-executions`. Without a pipeline: every pipeline
+    cp-executions ${1:+"$1"} ${2:+--count "$2"} "${@:3}"
 }
 export -f cp-execs